@@ -0,0 +1,154 @@
+"""
+送出訊息到收到回覆的完整路徑負載測試
+
+N 個虛擬使用者各自建立會話，依序送出 M 則訊息；每則訊息
+`POST /api/v1/conversations/messages/` 之後以 `GET /api/v1/conversations/{id}/polling/` 等待回覆，
+量測送出延遲、端到端延遲（送出到收到回覆）、吞吐量與錯誤回覆數。
+
+LLM 使用離線的 stub provider（maiagent/chat/llm/stub.py），不需 API key，同樣的參數可重現：
+
+    python manage.py prepare_load_test --profile slow      # 輸出 --scenario 與 --token
+    # 另開終端：web（uvicorn）、relay_outbox、celery worker 或 run_async_worker
+    python benchmarks/chat_load.py --scenario <ID> --token <JWT> -n 50 -m 5 --label prefork
+
+每則訊息內容不同（含虛擬使用者與輪次），不會命中回覆快取或被合併。
+送出得到非 2xx、polling 回應 204 以外的錯誤（例如 409 回覆逾時）或等待逾時的訊息計為失敗的樣本，
+不計入延遲；該虛擬使用者之後的訊息不再送出，同樣計為失敗。有失敗的樣本時以結束碼 1 結束。
+只使用標準函式庫，不需額外安裝套件。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from typing import Any
+from urllib.parse import urlsplit
+
+# 與 maiagent.chat.tasks.LLM_ERROR_REPLY 相同：LLM 最終失敗時的回覆
+LLM_ERROR_REPLY = "抱歉，目前無法產生回覆，請稍後再試。"
+
+
+async def http(
+    host: str, port: int, method: str, path: str, token: str, body: Any = None, timeout: float = 60
+) -> tuple[int, Any]:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            f"Authorization: Bearer {token}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode() + payload)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout=timeout)
+    finally:
+        writer.close()
+    header, _, content = response.partition(b"\r\n\r\n")
+    status = int(header.split(b" ", 2)[1]) if header else 0
+    return status, json.loads(content) if content.strip() else None
+
+
+def is_success(status: int) -> bool:
+    return 200 <= status < 300
+
+
+async def wait_reply(
+    host: str, port: int, token: str, session_id: str, args: argparse.Namespace
+) -> tuple[dict | None, str]:
+    """等待回覆；回傳（回覆, 失敗原因），取得回覆時原因為空字串。"""
+    deadline = time.monotonic() + args.reply_timeout
+    while time.monotonic() < deadline:
+        path = f"/api/v1/conversations/{session_id}/polling/?timeout={args.poll_timeout}"
+        status, data = await http(host, port, "GET", path, token, timeout=args.poll_timeout + 10)
+        if status == 200:
+            return data, ""
+        if status != 204:
+            return None, f"poll {status}"
+    return None, "no reply"
+
+
+async def virtual_user(index: int, host: str, port: int, args: argparse.Namespace, stats: dict[str, list]) -> None:
+    await asyncio.sleep(args.ramp * index / args.users)
+    session_id = None
+    for turn in range(args.messages):
+        body = {"content": f"負載測試 使用者 {index} 第 {turn} 則：{args.label}"}
+        body.update({"session_id": session_id} if session_id else {"scenario_id": args.scenario})
+        started = time.monotonic()
+        try:
+            status, data = await http(host, port, "POST", "/api/v1/conversations/messages/", args.token, body)
+            if not is_success(status):
+                reason = f"send {status}"
+            else:
+                sent = time.monotonic() - started
+                session_id = data["session_id"]
+                reply, reason = await wait_reply(host, port, args.token, session_id, args)
+        except (OSError, asyncio.TimeoutError, ValueError) as exc:
+            reason = type(exc).__name__
+        if reason:
+            # 會話可能仍在等待回覆，之後的訊息不再送出
+            stats["errors"].append(reason)
+            stats["errors"].extend(["skipped"] * (args.messages - turn - 1))
+            return
+        stats["send"].append(sent)
+        stats["reply"].append(time.monotonic() - started)
+        if reply.get("content") == LLM_ERROR_REPLY:
+            stats["error_replies"].append(session_id)
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def run(args: argparse.Namespace) -> int:
+    url = urlsplit(args.url)
+    host, port = url.hostname or "127.0.0.1", url.port or 80
+    stats: dict[str, list] = {"send": [], "reply": [], "errors": [], "error_replies": []}
+
+    started = time.monotonic()
+    await asyncio.gather(*(virtual_user(i, host, port, args, stats) for i in range(args.users)))
+    wall = time.monotonic() - started
+
+    samples = args.users * args.messages
+    print(f"[{args.label}] users={args.users} messages/user={args.messages} ramp={args.ramp}s")
+    print(
+        f"  samples={samples} replies={len(stats['reply'])} error_replies={len(stats['error_replies'])} "
+        f"failures={len(stats['errors'])} wall={wall:.2f}s throughput={len(stats['reply']) / wall:.2f} replies/s"
+    )
+    for name in ("send", "reply"):
+        values = stats[name]
+        if values:
+            print(
+                f"  {name:5} p50={statistics.median(values):.3f}s p95={percentile(values, 95):.3f}s "
+                f"p99={percentile(values, 99):.3f}s max={max(values):.3f}s"
+            )
+    if stats["errors"]:
+        counts = {reason: stats["errors"].count(reason) for reason in sorted(set(stats["errors"]))}
+        print(f"  failures: {counts}")
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", required=True, help="prepare_load_test 輸出的場景 ID")
+    parser.add_argument("--token", required=True, help="JWT access token")
+    parser.add_argument("-n", "--users", type=int, default=20, help="虛擬使用者數")
+    parser.add_argument("-m", "--messages", type=int, default=5, help="每個虛擬使用者依序送出的訊息數")
+    parser.add_argument("--ramp", type=float, default=0, help="在幾秒內陸續啟動虛擬使用者")
+    parser.add_argument("--poll-timeout", type=int, default=30, help="每次 polling 的 timeout 秒數")
+    parser.add_argument("--reply-timeout", type=float, default=300, help="等待單則回覆的上限秒數")
+    parser.add_argument("--label", default="run")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
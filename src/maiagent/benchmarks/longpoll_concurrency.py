@@ -0,0 +1,101 @@
+"""
+長輪詢併發量基準測試
+
+對同一個 worker 同時開啟 N 個 `GET /api/v1/conversations/{id}/polling/?timeout=T`，
+量測失敗數、延遲與同時掛住的等待數峰值。
+
+比較同步與非同步端點（單一 uvicorn worker）：
+
+    # before：同步 ViewSet
+    CHAT_ASYNC_API=False gunicorn config.asgi -k uvicorn_worker.UvicornWorker -w 1 -b 127.0.0.1:8000
+    python benchmarks/longpoll_concurrency.py --session <WAITING 會話 ID> --token <JWT> -n 1000 --ramp 10 --label sync
+
+    # after：async view
+    CHAT_ASYNC_API=True gunicorn config.asgi -k uvicorn_worker.UvicornWorker -w 1 -b 127.0.0.1:8000
+    python benchmarks/longpoll_concurrency.py --session <WAITING 會話 ID> --token <JWT> -n 1000 --ramp 10 --label async
+
+會話需維持 WAITING（不要啟動 celery worker），讓每個請求都等滿 timeout。
+只使用標準函式庫，不需額外安裝套件。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def poll_once(
+    host: str, port: int, path: str, token: str, read_timeout: float, delay: float
+) -> tuple[int, float, float]:
+    await asyncio.sleep(delay)
+    started = time.monotonic()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            f"Authorization: Bearer {token}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(request.encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout=read_timeout)
+        await asyncio.wait_for(reader.read(), timeout=read_timeout)
+    finally:
+        writer.close()
+    status = int(status_line.split()[1]) if status_line else 0
+    return status, started, time.monotonic()
+
+
+async def run(args: argparse.Namespace) -> None:
+    url = urlsplit(args.url)
+    host, port = url.hostname or "127.0.0.1", url.port or 80
+    path = f"/api/v1/conversations/{args.session}/polling/?timeout={args.timeout}"
+    read_timeout = args.timeout * 10
+
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *(
+            poll_once(host, port, path, args.token, read_timeout, args.ramp * i / args.clients)
+            for i in range(args.clients)
+        ),
+        return_exceptions=True,
+    )
+    wall = time.monotonic() - started
+
+    ok = [r for r in results if isinstance(r, tuple) and r[0] in (200, 204)]
+    latencies = [end - start for _, start, end in ok]
+    errors = len(results) - len(ok)
+    # 成功請求的區間重疊數峰值，即同時掛住的等待數
+    edges = sorted([(start, 1) for _, start, _ in ok] + [(end, -1) for _, _, end in ok])
+    concurrent = peak = 0
+    for _, delta in edges:
+        concurrent += delta
+        peak = max(peak, concurrent)
+
+    print(f"[{args.label}] clients={args.clients} timeout={args.timeout}s ramp={args.ramp}s")
+    print(f"  completed={len(latencies)} errors={errors} wall={wall:.2f}s")
+    if latencies:
+        print(
+            f"  latency p50={statistics.median(latencies):.2f}s "
+            f"max={max(latencies):.2f}s"
+        )
+    print(f"  peak concurrent waiting clients per worker = {peak}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--session", required=True, help="保持 WAITING 狀態的會話 ID")
+    parser.add_argument("--token", required=True, help="JWT access token")
+    parser.add_argument("-n", "--clients", type=int, default=500)
+    parser.add_argument("--timeout", type=int, default=5, help="polling timeout 秒數")
+    parser.add_argument("--ramp", type=float, default=0, help="在幾秒內陸續送出請求（0 表示同時送出）")
+    parser.add_argument("--label", default="run")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+訊息序號分配併發基準測試
+
+多個執行緒同時對同一個會話寫入訊息（每則訊息一個交易，如同一般 API 請求），
+比較兩種序號分配方式，並檢查序號是否連續、無重複：
+
+- legacy：鎖定 Session（select_for_update）後以 Max("sequence_number") + 1 分配
+- counter：Session.next_sequence 以單一 UPDATE ... RETURNING 分配（Message.save 目前的做法）
+
+    DATABASE_URL=postgres://... python benchmarks/message_sequence_concurrency.py --threads 16 --messages 200
+
+需要已有使用者與場景的資料庫（例如執行過 load_fixtures）；會建立測試用會話並於結束後刪除。
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, models, transaction  # noqa: E402
+from django.db.models import Max  # noqa: E402
+
+from maiagent.chat.models import Message, Scenario, Session  # noqa: E402
+from maiagent.users.models import User  # noqa: E402
+
+
+def legacy_append(session_id, content: str) -> None:
+    with transaction.atomic():
+        Session.objects.select_for_update().get(pk=session_id)
+        max_seq = Message.objects.filter(session_id=session_id).aggregate(max_seq=Max("sequence_number"))["max_seq"]
+        message = Message(
+            session_id=session_id, role=Message.Role.USER, content=content, sequence_number=(max_seq or 0) + 1
+        )
+        # 略過 Message.save，保留原本的兩段式分配
+        models.Model.save(message)
+
+
+def counter_append(session_id, content: str) -> None:
+    with transaction.atomic():
+        Message.objects.create(session_id=session_id, role=Message.Role.USER, content=content)
+
+
+def run(name: str, append, threads: int, messages: int) -> None:
+    session = Session.objects.create(user=User.objects.first(), scenario=Scenario.objects.first())
+    barrier = threading.Barrier(threads)
+    errors: list[BaseException] = []
+
+    def worker(index: int) -> None:
+        try:
+            barrier.wait()
+            for i in range(messages):
+                append(session.pk, f"thread {index} message {i}")
+        except BaseException as exc:  # noqa: BLE001
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * messages
+    sequences = sorted(Message.objects.filter(session=session).values_list("sequence_number", flat=True))
+    consistent = sequences == list(range(1, total + 1))
+    print(
+        f"[{name}] threads={threads} messages={total} elapsed={elapsed:.2f}s "
+        f"throughput={total / elapsed:.0f} msg/s errors={len(errors)} "
+        f"{'no gaps or duplicates' if consistent else 'INCONSISTENT SEQUENCES'}"
+    )
+    session.delete()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=200, help="每個執行緒寫入的訊息數")
+    args = parser.parse_args()
+
+    run("legacy", legacy_append, args.threads, args.messages)
+    run("counter", counter_append, args.threads, args.messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 from django.conf import settings
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 from rest_framework.routers import SimpleRouter
 
 from maiagent.users.api.views import UserViewSet
+from maiagent.chat.api import async_views
 from maiagent.chat.api.views import ScenarioViewSet, SessionViewSet
 
 router = DefaultRouter() if settings.DEBUG else SimpleRouter()
@@ -13,4 +15,18 @@ router.register("v1/scenarios", ScenarioViewSet, basename="scenario")
 
 
 app_name = "api"
-urlpatterns = router.urls
+urlpatterns = [
+    # SSE 串流僅有非同步版本
+    path("v1/conversations/<uuid:pk>/stream/", async_views.session_stream, name="conversation-stream"),
+    *router.urls,
+]
+
+if settings.CHAT_ASYNC_API:
+    # 非同步端點與 router 路徑相同，需放在前面優先匹配
+    urlpatterns = [
+        path("v1/conversations/messages/", async_views.post_message, name="conversation-post-message-async"),
+        path("v1/conversations/poll-batch/", async_views.poll_batch, name="conversation-poll-batch-async"),
+        path("v1/conversations/<uuid:pk>/", async_views.session_detail, name="conversation-detail-async"),
+        path("v1/conversations/<uuid:pk>/polling/", async_views.session_polling, name="conversation-polling-async"),
+        *urlpatterns,
+    ]
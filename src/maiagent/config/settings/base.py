@@ -272,6 +272,156 @@ LOGGING = {
 
 REDIS_URL = env("REDIS_URL", default="redis://redis:6379/0")
 REDIS_SSL = REDIS_URL.startswith("rediss://")
+# 共用連線池上限（見 doc/design/Celery_Design.md）
+REDIS_MAX_CONNECTIONS = env.int("REDIS_MAX_CONNECTIONS", default=20)
+
+# Chat
+# ------------------------------------------------------------------------------
+# 會話事件通知 broker：長輪詢等待 process_message 寫入的助手回覆
+CHAT_REPLY_BROKER = env(
+    "CHAT_REPLY_BROKER",
+    default="maiagent.chat.notifications.RedisReplyBroker",
+)
+# polling / retrieve / post_message 改由 async view 處理（需以 ASGI 執行）
+CHAT_ASYNC_API = env.bool("CHAT_ASYNC_API", default=True)
+# POST /conversations/poll-batch/ 一次可輪詢的會話數上限
+CHAT_POLL_BATCH_MAX_SESSIONS = env.int("CHAT_POLL_BATCH_MAX_SESSIONS", default=50)
+# POST /conversations/{id}/messages/bulk/ 一次可匯入的訊息數上限
+CHAT_BULK_APPEND_MAX_MESSAGES = env.int("CHAT_BULK_APPEND_MAX_MESSAGES", default=1000)
+# post_message 的 Idempotency-Key：完成的回應保存時間與處理中標記的存活時間（秒）
+CHAT_IDEMPOTENCY_TTL = env.int("CHAT_IDEMPOTENCY_TTL", default=24 * 60 * 60)
+CHAT_IDEMPOTENCY_LOCK_TTL = env.int("CHAT_IDEMPOTENCY_LOCK_TTL", default=30)
+# 會話狀態快取（Django cache）的存活時間（秒）
+CHAT_SESSION_STATE_TTL = env.int("CHAT_SESSION_STATE_TTL", default=300)
+# 回覆串流（SSE）：process_message 逐段寫入，GET /stream/ 轉送
+CHAT_REPLY_STREAM = env(
+    "CHAT_REPLY_STREAM",
+    default="maiagent.chat.streams.RedisReplyStream",
+)
+CHAT_STREAM_TTL = env.int("CHAT_STREAM_TTL", default=3600)
+CHAT_STREAM_MAXLEN = env.int("CHAT_STREAM_MAXLEN", default=10000)
+# 每個 web worker 同時進行 XREAD BLOCK 的連線上限
+CHAT_STREAM_MAX_READERS = env.int("CHAT_STREAM_MAX_READERS", default=200)
+
+# LLM providers
+# ------------------------------------------------------------------------------
+# 依 LlmModel.provider 選擇用戶端；每個 worker 行程每個 provider 共用一個 keep-alive 連線池
+CHAT_LLM_PROVIDERS = {
+    "openai": {
+        "CLASS": "maiagent.chat.llm.openai.OpenAIClient",
+        "OPTIONS": {
+            "api_key": env("OPENAI_API_KEY", default=""),
+            "base_url": env("OPENAI_BASE_URL", default="https://api.openai.com/v1"),
+        },
+    },
+    "anthropic": {
+        "CLASS": "maiagent.chat.llm.anthropic.AnthropicClient",
+        "OPTIONS": {
+            "api_key": env("ANTHROPIC_API_KEY", default=""),
+            "base_url": env("ANTHROPIC_BASE_URL", default="https://api.anthropic.com"),
+        },
+    },
+    # 離線 provider：本機開發用，不連網；stub 的 echo profile，回覆「[模型] 收到：問題」
+    "fake": {
+        "CLASS": "maiagent.chat.llm.stub.StubLlmClient",
+        "OPTIONS": {
+            "reply": "echo",
+            "first_token_latency": env.float("FAKE_LLM_FIRST_TOKEN_LATENCY", default=0),
+            # 0 為不限速
+            "tokens_per_second": env.float("FAKE_LLM_TOKENS_PER_SECOND", default=0),
+        },
+    },
+    # 負載測試用的離線 provider：模擬首字延遲、輸出速度、5xx 與 429，見 maiagent/chat/llm/stub.py；
+    # LlmModel.params["stub"] 可指定 profile 或覆寫個別欄位
+    "stub": {
+        "CLASS": "maiagent.chat.llm.stub.StubLlmClient",
+        "OPTIONS": {
+            "first_token_latency": env.float("STUB_LLM_FIRST_TOKEN_LATENCY", default=0.5),
+            "tokens_per_second": env.float("STUB_LLM_TOKENS_PER_SECOND", default=50),
+            "reply_tokens": env.int("STUB_LLM_REPLY_TOKENS", default=100),
+            "error_rate": env.float("STUB_LLM_ERROR_RATE", default=0),
+            "rate_limit_rate": env.float("STUB_LLM_RATE_LIMIT_RATE", default=0),
+            "seed": env.int("STUB_LLM_SEED", default=0),
+            "profiles": {
+                "echo": {"reply": "echo", "first_token_latency": 0, "tokens_per_second": 0},
+                "fast": {"first_token_latency": 0.2, "tokens_per_second": 100},
+                "slow": {"first_token_latency": 2.0, "first_token_sigma": 0.5, "tokens_per_second": 20},
+                "flaky": {"first_token_latency": 0.8, "first_token_sigma": 1.0, "error_rate": 0.1},
+                "throttled": {"rate_limit_rate": 0.3, "retry_after": 2},
+            },
+        },
+    },
+}
+# 場景未綁定模型時使用的模型
+CHAT_LLM_DEFAULT_MODEL = {"provider": env("CHAT_LLM_DEFAULT_PROVIDER", default="fake"), "name": "fake-echo"}
+# 對話記憶視窗快取（Django cache）的存活時間（秒）
+CHAT_MEMORY_CACHE_TTL = env.int("CHAT_MEMORY_CACHE_TTL", default=60 * 60)
+# 讀取逾時（秒），見 doc/design/Celery_Design.md
+CHAT_LLM_TIMEOUT = env.float("CHAT_LLM_TIMEOUT", default=30)
+CHAT_LLM_CONNECT_TIMEOUT = env.float("CHAT_LLM_CONNECT_TIMEOUT", default=5)
+# 每個 provider 的連線池上限（超過時等待可用連線）
+CHAT_LLM_POOL_MAXSIZE = env.int("CHAT_LLM_POOL_MAXSIZE", default=10)
+# asyncio 執行模式（manage.py run_async_worker）：每個行程同時處理的 process_message 上限
+# （亦為非同步 HTTP 用戶端每個 provider 的連線上限）與資料庫 / Redis 操作的執行緒數；
+# 執行緒數 0 表示與並行上限相同（執行緒依需要建立），小於並行上限時啟動會記錄警告
+CHAT_ASYNC_WORKER_CONCURRENCY = env.int("CHAT_ASYNC_WORKER_CONCURRENCY", default=200)
+CHAT_ASYNC_WORKER_THREADS = env.int("CHAT_ASYNC_WORKER_THREADS", default=0)
+# 訊息 token 數的計算方式，LlmModel.tokenizer 指定名稱，見 maiagent/chat/tokenizers.py
+CHAT_TOKENIZERS = {
+    "estimate": {"CLASS": "maiagent.chat.tokenizers.EstimatingTokenizer"},
+    # 需另外安裝 tiktoken
+    "cl100k": {"CLASS": "maiagent.chat.tokenizers.TiktokenTokenizer", "OPTIONS": {"encoding": "cl100k_base"}},
+    "o200k": {"CLASS": "maiagent.chat.tokenizers.TiktokenTokenizer", "OPTIONS": {"encoding": "o200k_base"}},
+}
+CHAT_DEFAULT_TOKENIZER = env("CHAT_DEFAULT_TOKENIZER", default="estimate")
+# 每個模型的請求數 / token 數速率限制（LlmModel 的上限欄位），見 maiagent/chat/rate_limit.py
+CHAT_RATE_LIMITER = env("CHAT_RATE_LIMITER", default="maiagent.chat.rate_limit.RedisRateLimiter")
+# 生成參數未設定 max_tokens 時，預估每則回覆使用的 token 數
+CHAT_RATE_LIMIT_REPLY_TOKENS = env.int("CHAT_RATE_LIMIT_REPLY_TOKENS", default=512)
+# 每個行程的場景設定快取（maiagent/chat/scenario_cache.py）：場景變更時經 Redis 廣播丟棄，
+# 漏收廣播時最久沿用的秒數
+CHAT_SCENARIO_CACHE_ENABLED = env.bool("CHAT_SCENARIO_CACHE_ENABLED", default=True)
+CHAT_SCENARIO_CACHE_TTL = env.int("CHAT_SCENARIO_CACHE_TTL", default=300)
+# 每個模型的斷路器（maiagent/chat/circuit_breaker.py）：連續失敗（逾時、5xx、首字延遲超過 SLOW_CALL 秒）
+# 達門檻後開啟，OPEN_SECONDS 秒內不呼叫該模型，改用場景的其他模型或直接回覆錯誤
+CHAT_CIRCUIT_BREAKER = env("CHAT_CIRCUIT_BREAKER", default="maiagent.chat.circuit_breaker.RedisCircuitBreaker")
+CHAT_CIRCUIT_BREAKER_FAILURE_THRESHOLD = env.int("CHAT_CIRCUIT_BREAKER_FAILURE_THRESHOLD", default=5)
+CHAT_CIRCUIT_BREAKER_OPEN_SECONDS = env.float("CHAT_CIRCUIT_BREAKER_OPEN_SECONDS", default=30)
+CHAT_CIRCUIT_BREAKER_SLOW_CALL = env.float("CHAT_CIRCUIT_BREAKER_SLOW_CALL", default=10.0)
+# 取消進行中的回覆（maiagent/chat/cancellation.py）：串流期間檢查會話是否已刪除或訊息被取代的間隔（秒）
+CHAT_CANCEL_CHECK_INTERVAL = env.float("CHAT_CANCEL_CHECK_INTERVAL", default=0.5)
+# 回覆期限（maiagent/chat/deadlines.py）：送出訊息後超過此秒數仍未開始產生的回覆不再產生，
+# 與前端等待回覆的上限（輪詢 30 次）一致
+CHAT_REPLY_DEADLINE = env.int("CHAT_REPLY_DEADLINE", default=30)
+# LLM 回覆快取（完全比對），見 maiagent/chat/response_cache.py
+CHAT_RESPONSE_CACHE_ENABLED = env.bool("CHAT_RESPONSE_CACHE_ENABLED", default=True)
+CHAT_RESPONSE_CACHE_ALIAS = env("CHAT_RESPONSE_CACHE_ALIAS", default="default")
+# 場景未設定 response_cache.ttl 時的存活時間（秒）
+CHAT_RESPONSE_CACHE_TTL = env.int("CHAT_RESPONSE_CACHE_TTL", default=24 * 60 * 60)
+# 語意快取（換句話說的問題），見 maiagent/chat/semantic_cache.py；場景需另以 config_json 啟用
+CHAT_SEMANTIC_CACHE_ENABLED = env.bool("CHAT_SEMANTIC_CACHE_ENABLED", default=True)
+CHAT_SEMANTIC_CACHE_EMBEDDER = {
+    "CLASS": env("CHAT_SEMANTIC_CACHE_EMBEDDER", default="maiagent.chat.embeddings.HashingEmbedder"),
+    "OPTIONS": {"dimensions": env.int("CHAT_SEMANTIC_CACHE_DIMENSIONS", default=512)},
+}
+# 場景未設定 semantic_cache.threshold / ttl 時的相似度門檻與存活時間（秒）
+CHAT_SEMANTIC_CACHE_THRESHOLD = env.float("CHAT_SEMANTIC_CACHE_THRESHOLD", default=0.9)
+CHAT_SEMANTIC_CACHE_TTL = env.int("CHAT_SEMANTIC_CACHE_TTL", default=24 * 60 * 60)
+# 每個 worker 行程每個場景載入記憶體的問答上限
+CHAT_SEMANTIC_CACHE_MAX_ENTRIES = env.int("CHAT_SEMANTIC_CACHE_MAX_ENTRIES", default=5000)
+# 相同 LLM 請求的合併，見 maiagent/chat/single_flight.py
+CHAT_SINGLE_FLIGHT_ENABLED = env.bool("CHAT_SINGLE_FLIGHT_ENABLED", default=True)
+# leader 鎖與結果需由所有 worker 行程共用
+CHAT_SINGLE_FLIGHT_STORE = env("CHAT_SINGLE_FLIGHT_STORE", default="maiagent.chat.single_flight.RedisFlightStore")
+# leader 鎖的存活時間（秒），亦為等待結果的上限；應大於一次 LLM 呼叫的讀取逾時
+CHAT_SINGLE_FLIGHT_LOCK_TTL = env.int("CHAT_SINGLE_FLIGHT_LOCK_TTL", default=60)
+CHAT_SINGLE_FLIGHT_RESULT_TTL = env.int("CHAT_SINGLE_FLIGHT_RESULT_TTL", default=10)
+# 結果尚未產生時，相同的請求延後此秒數重新排入（經 outbox）後再讀取
+CHAT_SINGLE_FLIGHT_POLL_INTERVAL = env.float("CHAT_SINGLE_FLIGHT_POLL_INTERVAL", default=0.5)
+# Hedged requests（maiagent/chat/hedging.py）：場景以 config_json["hedging"] 啟用；
+# 主要模型超過此秒數沒有首字時，向場景的下一個模型送出相同的請求
+CHAT_HEDGING_ENABLED = env.bool("CHAT_HEDGING_ENABLED", default=True)
+CHAT_HEDGE_FIRST_TOKEN_TIMEOUT = env.float("CHAT_HEDGE_FIRST_TOKEN_TIMEOUT", default=2.0)
 
 # Elasticsearch
 # ------------------------------------------------------------------------------
@@ -321,6 +471,16 @@ CELERY_TASK_SEND_SENT_EVENT = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-hijack-root-logger
 CELERY_WORKER_HIJACK_ROOT_LOGGER = False
 CELERY_TASK_DEFAULT_QUEUE = "default"
+# Outbox relay（manage.py relay_outbox）每批發送的任務數與無待發送資料時的輪詢間隔（秒）
+CHAT_OUTBOX_BATCH_SIZE = env.int("CHAT_OUTBOX_BATCH_SIZE", default=100)
+CHAT_OUTBOX_POLL_INTERVAL = env.float("CHAT_OUTBOX_POLL_INTERVAL", default=0.1)
+# 回覆任務的跨群組公平排程，見 maiagent/chat/fair_queue.py
+CHAT_FAIR_QUEUE_ENABLED = env.bool("CHAT_FAIR_QUEUE_ENABLED", default=True)
+# ai_queue 中尚未發送給 worker 的任務上限，超過時積壓留在 outbox 依群組公平發送；
+# 應略大於所有 worker 的並行數總和，worker 不會閒置
+CHAT_FAIR_QUEUE_MAX_READY = env.int("CHAT_FAIR_QUEUE_MAX_READY", default=50)
+# 各角色的 flow 權重：每輪可發送的任務數
+CHAT_FAIR_QUEUE_ROLE_WEIGHTS = {"admin": 4, "supervisor": 2, "employee": 1}
 CELERY_TASK_QUEUES = {
     "default": {},
     "ai_queue": {},
@@ -30,7 +30,17 @@ CACHES = {
             "IGNORE_EXCEPTIONS": True,
         },
     },
+    # LLM 回覆快取使用獨立的 Redis（maxmemory-policy allkeys-lru），用滿時淘汰最久未使用的回覆
+    "llm_responses": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": env("CHAT_RESPONSE_CACHE_URL", default="redis://responsecache:6379/0"),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "IGNORE_EXCEPTIONS": True,
+        },
+    },
 }
+CHAT_RESPONSE_CACHE_ALIAS = "llm_responses"
 
 # SECURITY
 # ------------------------------------------------------------------------------
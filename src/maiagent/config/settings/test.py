@@ -37,5 +37,15 @@ MEDIA_URL = "http://media.testserver/"
 # django-webpack-loader
 # ------------------------------------------------------------------------------
 WEBPACK_LOADER["DEFAULT"]["LOADER_CLASS"] = "webpack_loader.loaders.FakeWebpackLoader"  # noqa: F405
+# Chat
+# ------------------------------------------------------------------------------
+# 測試不依賴 Redis，使用單一行程內的 broker
+CHAT_REPLY_BROKER = "maiagent.chat.notifications.InMemoryReplyBroker"
+CHAT_REPLY_STREAM = "maiagent.chat.streams.InMemoryReplyStream"
+CHAT_RATE_LIMITER = "maiagent.chat.rate_limit.InMemoryRateLimiter"
+CHAT_CIRCUIT_BREAKER = "maiagent.chat.circuit_breaker.InMemoryCircuitBreaker"
+CHAT_SINGLE_FLIGHT_STORE = "maiagent.chat.single_flight.InMemoryFlightStore"
+# 測試在單一行程內執行，預設的 LocMemCache 即可
+SILENCED_SYSTEM_CHECKS = ["chat.W001"]
 # Your stuff...
 # ------------------------------------------------------------------------------
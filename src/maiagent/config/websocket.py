@@ -1,13 +1,4 @@
-async def websocket_application(scope, receive, send):
-    while True:
-        event = await receive()
+# 會話 WebSocket 協定實作於 maiagent.chat.websocket
+from maiagent.chat.websocket import websocket_application
 
-        if event["type"] == "websocket.connect":
-            await send({"type": "websocket.accept"})
-
-        if event["type"] == "websocket.disconnect":
-            break
-
-        if event["type"] == "websocket.receive":
-            if event["text"] == "ping":
-                await send({"type": "websocket.send", "text": "pong!"})
+__all__ = ["websocket_application"]
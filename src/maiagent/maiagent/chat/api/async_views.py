@@ -0,0 +1,409 @@
+"""
+非同步版本的會話端點（ASGI / uvicorn worker）
+
+長輪詢等待回覆時不佔用執行緒，單一 worker 可同時掛住大量連線。
+資料讀取使用 Django async ORM；權限檢查與交易寫入透過 sync_to_async 執行
+（transaction.atomic 尚無非同步版本）。回應格式與 SessionViewSet 相同。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import re
+import time
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import Prefetch
+from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, ValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rolepermissions.checkers import has_permission
+
+from maiagent.chat.deadlines import EXPIRED_REPLY
+from maiagent.chat.idempotency import REPLAYED_HEADER, IdempotencyError, IdempotentRequest, request_fingerprint
+from maiagent.chat.models import Message, Session
+from maiagent.chat.notifications import get_reply_broker, session_channel
+from maiagent.chat.services import (
+    MessageSubmissionError,
+    new_assistant_messages,
+    submit_user_message,
+)
+from maiagent.chat.status_cache import aget_session_state, alast_assistant_message
+from maiagent.chat.streams import STREAM_START, get_reply_stream
+from maiagent.users.permissions import filter_sessions_for_user
+
+from .serializers import FlexibleMessageSerializer, MessageSerializer, PollBatchSerializer, SessionDetailSerializer
+from .views import SessionViewSet, poll_batch_data, validate_retrieve_query_params
+
+logger = logging.getLogger(__name__)
+
+# DELETE 仍交由同步 ViewSet 處理
+_session_destroy = SessionViewSet.as_view({"delete": "destroy"})
+
+
+# SSE 串流單次連線的最長時間與心跳間隔（秒）；逾時後客戶端以 Last-Event-ID 重新連線
+_STREAM_MAX_DURATION = 300
+_STREAM_KEEPALIVE = 15
+
+_STREAM_ID_RE = re.compile(r"^\d+(-\d+)?$")
+
+
+def _authenticate(request: HttpRequest, allow_query_token: bool) -> Any | None:
+    auth = JWTAuthentication()
+    raw_token = request.GET.get("token") if allow_query_token else None
+    try:
+        if raw_token:
+            return auth.get_user(auth.get_validated_token(raw_token))
+        result = auth.authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def authenticate_request(request: HttpRequest, *, allow_query_token: bool = False) -> Any | None:
+    """以 SimpleJWT 驗證 Authorization 標頭，失敗回傳 None。
+
+    EventSource 無法設定標頭，`allow_query_token` 時也接受 `?token=`。
+    """
+    return await sync_to_async(_authenticate)(request, allow_query_token)
+
+
+def _unauthorized() -> JsonResponse:
+    response = JsonResponse({"detail": str(NotAuthenticated.default_detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    response["WWW-Authenticate"] = 'Bearer realm="api"'
+    return response
+
+
+def _release_db_connections() -> None:
+    # 與 CONN_MAX_AGE 無關，直接關閉本請求執行緒的連線（交易中的連線除外）
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close()
+
+
+def _forbidden(detail: str = "權限不足") -> JsonResponse:
+    return JsonResponse({"detail": detail}, status=status.HTTP_403_FORBIDDEN)
+
+
+async def _authorize(
+    request: HttpRequest, operation_name: str, *, allow_query_token: bool = False
+) -> tuple[Any | None, JsonResponse | None]:
+    user = await authenticate_request(request, allow_query_token=allow_query_token)
+    if user is None:
+        return None, _unauthorized()
+    if not await sync_to_async(has_permission)(user, operation_name):
+        return None, _forbidden()
+    return user, None
+
+
+@csrf_exempt
+@transaction.non_atomic_requests
+async def session_polling(request: HttpRequest, pk: Any) -> HttpResponse:
+    """
+    GET /api/v1/conversations/{session_id}/polling/
+    等待助手回覆，timeout 秒內無回覆回傳 204
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    user, error = await _authorize(request, "use_scenario")
+    if error is not None:
+        return error
+
+    try:
+        timeout_seconds = int(request.GET.get("timeout", 30))
+    except ValueError:
+        return JsonResponse({"detail": "timeout 必須為整數"}, status=status.HTTP_400_BAD_REQUEST)
+    deadline = time.monotonic() + max(1, min(timeout_seconds, 60))
+
+    # 先訂閱再讀取狀態，訂閱之後提交的回覆都會以事件送達
+    async with get_reply_broker().asubscribe([session_channel(pk)]) as subscription:
+        # 狀態與可見性優先讀取快取，等待中的會話不查詢資料庫
+        state = await aget_session_state(pk)
+        if state is None or not state.visible_to(user):
+            return JsonResponse({"detail": "會話不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+        if state.status == Session.Status.REPLYED:
+            last_assistant = await alast_assistant_message(pk, state)
+            if last_assistant:
+                return JsonResponse(MessageSerializer(last_assistant).data, status=status.HTTP_200_OK)
+        if state.status == Session.Status.EXPIRED:
+            return JsonResponse({"detail": EXPIRED_REPLY, "status": state.status}, status=status.HTTP_409_CONFLICT)
+
+        # 等待前歸還資料庫連線，掛住的長輪詢不佔用 PostgreSQL 連線
+        await sync_to_async(_release_db_connections)()
+        event = await subscription.get(timeout=deadline - time.monotonic())
+        if event is not None and event["type"] == "expired":
+            return JsonResponse(
+                {"detail": event["detail"], "status": Session.Status.EXPIRED}, status=status.HTTP_409_CONFLICT
+            )
+        if event is not None:
+            return JsonResponse(event["message"], status=status.HTTP_200_OK)
+
+    # 超時仍未回覆
+    return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+
+def _poll_batch_once(user: Any, cursors: dict[Any, int]) -> dict[str, Any] | None:
+    updates = new_assistant_messages(user, cursors)
+    return poll_batch_data(updates) if updates else None
+
+
+@csrf_exempt
+@transaction.non_atomic_requests
+async def poll_batch(request: HttpRequest) -> HttpResponse:
+    """
+    多會話批次輪詢（非同步）
+    POST /api/v1/conversations/poll-batch/
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    user, error = await _authorize(request, "use_scenario")
+    if error is not None:
+        return error
+
+    try:
+        payload = _request_payload(request)
+    except ValueError:
+        return JsonResponse({"detail": "請求資料格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = PollBatchSerializer(data=payload)
+    if not serializer.is_valid():
+        return JsonResponse(
+            {"detail": "請求資料格式錯誤", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST
+        )
+    cursors = serializer.validated_data["sessions"]
+    deadline = time.monotonic() + serializer.validated_data["timeout"]
+
+    # 先訂閱再查詢；收到任一會話的通知後重新查詢
+    channels = [session_channel(session_id) for session_id in cursors]
+    async with get_reply_broker().asubscribe(channels) as subscription:
+        while True:
+            data = await sync_to_async(_poll_batch_once)(user, cursors)
+            if data is not None:
+                return JsonResponse(data, status=status.HTTP_200_OK)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # 等待前歸還資料庫連線
+            await sync_to_async(_release_db_connections)()
+            if await subscription.get(timeout=remaining) is None:
+                break
+
+    # 超時仍無更新
+    return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+
+def _sse(event: str, data: dict[str, Any], event_id: str | None = None) -> str:
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, cls=DjangoJSONEncoder)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+async def _single_event(payload: str):
+    yield payload
+
+
+async def _relay_stream(session_id: Any, reply_to: str, after: str):
+    """轉送本輪回覆的串流事件，直到 done / error 或連線時間上限。"""
+    stream = get_reply_stream()
+    deadline = time.monotonic() + _STREAM_MAX_DURATION
+    yield "retry: 1000\n\n"
+    while (remaining := deadline - time.monotonic()) > 0:
+        entries = await stream.aread(session_id, after, timeout=min(_STREAM_KEEPALIVE, remaining))
+        if not entries:
+            yield ": keepalive\n\n"
+            continue
+        for entry_id, event in entries:
+            after = entry_id
+            if event.get("reply_to") != reply_to:
+                continue
+            yield _sse(event["type"], event, entry_id)
+            if event["type"] in ("done", "error"):
+                return
+
+
+@csrf_exempt
+@transaction.non_atomic_requests
+async def session_stream(request: HttpRequest, pk: Any) -> HttpResponse:
+    """
+    GET /api/v1/conversations/{session_id}/stream/
+    以 Server-Sent Events 逐段轉送助手回覆；支援 Last-Event-ID 續讀
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    user, error = await _authorize(request, "use_scenario", allow_query_token=True)
+    if error is not None:
+        return error
+
+    after = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id") or STREAM_START
+    if not _STREAM_ID_RE.match(after):
+        return JsonResponse({"detail": "Last-Event-ID 格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
+
+    state = await aget_session_state(pk)
+    if state is None or not state.visible_to(user):
+        return JsonResponse({"detail": "會話不存在"}, status=status.HTTP_404_NOT_FOUND)
+    last_user_message = await (
+        Message.objects.filter(session_id=pk, role=Message.Role.USER).order_by("-sequence_number").afirst()
+    )
+    if last_user_message is None:
+        return JsonResponse({"detail": "會話尚無訊息"}, status=status.HTTP_404_NOT_FOUND)
+    reply_to = str(last_user_message.pk)
+
+    if state.status == Session.Status.WAITING:
+        events = _relay_stream(pk, reply_to, after)
+    else:
+        # 回覆已寫入資料庫，直接以 done 事件送出完整訊息
+        reply = await (
+            Message.objects.filter(
+                session_id=pk,
+                role=Message.Role.ASSISTANT,
+                sequence_number__gt=last_user_message.sequence_number,
+            )
+            .order_by("-sequence_number")
+            .afirst()
+        )
+        if reply is None:
+            detail = EXPIRED_REPLY if state.status == Session.Status.EXPIRED else "沒有進行中的回覆"
+            payload = _sse("error", {"type": "error", "reply_to": reply_to, "detail": detail})
+        else:
+            payload = _sse("done", {"type": "done", "reply_to": reply_to, "message": MessageSerializer(reply).data})
+        events = _single_event(payload)
+
+    # 串流期間不佔用資料庫連線
+    await sync_to_async(_release_db_connections)()
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@csrf_exempt
+@transaction.non_atomic_requests
+async def session_detail(request: HttpRequest, pk: Any) -> HttpResponse:
+    """
+    GET    /api/v1/conversations/{session_id}/  查詢特定會話（非同步）
+    DELETE /api/v1/conversations/{session_id}/  交由 SessionViewSet.destroy
+    """
+    if request.method == "DELETE":
+        return await sync_to_async(_session_destroy)(request, pk=str(pk))
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET", "DELETE"])
+
+    user = await authenticate_request(request)
+    if user is None:
+        return _unauthorized()
+
+    try:
+        validate_retrieve_query_params(request.GET)
+    except ValidationError as e:
+        return JsonResponse(
+            {"detail": "查詢參數格式錯誤或未通過 Serializers 驗證", "errors": e.detail},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        instance = await (
+            filter_sessions_for_user(Session.objects.all(), user)
+            .select_related("scenario", "user")
+            .prefetch_related(Prefetch("messages", queryset=Message.objects.order_by("sequence_number")))
+            .filter(pk=pk)
+            .afirst()
+        )
+        if instance is None:
+            if await aget_session_state(pk) is not None:
+                return _forbidden("使用者 Role 沒有查看該會話的權限")
+            return JsonResponse({"detail": "會話不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+        include_messages = request.GET.get("include_messages", "true").lower() == "true"
+        message_limit = int(request.GET.get("message_limit", 100))
+        message_offset = int(request.GET.get("message_offset", 0))
+
+        # MessageDetailSerializer 會查詢前一則訊息，序列化於執行緒中進行
+        serialized_data = await sync_to_async(lambda: SessionDetailSerializer(instance).data)()
+
+        response_data: dict[str, Any] = {
+            "success": True,
+            "data": {
+                "session": serialized_data,
+            },
+            "message": "會話詳情取得成功",
+            "timestamp": timezone.now().isoformat(),
+        }
+        if include_messages:
+            response_data["data"]["message_pagination"] = {
+                "offset": message_offset,
+                "limit": message_limit,
+                "total_count": len(serialized_data.get("messages", [])),
+                "has_more": False,
+            }
+        return JsonResponse(response_data, status=status.HTTP_200_OK)
+    except Exception:
+        logger.exception("Failed to retrieve session %s", pk)
+        return JsonResponse({"detail": "伺服器遇到未預期的狀況"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _request_payload(request: HttpRequest) -> Any:
+    if request.content_type == "application/json":
+        return json.loads(request.body or b"{}")
+    return request.POST
+
+
+@csrf_exempt
+@transaction.non_atomic_requests
+async def post_message(request: HttpRequest) -> HttpResponse:
+    """
+    彈性訊息提交 API（非同步）
+    POST /api/v1/conversations/messages/
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    user, error = await _authorize(request, "send_message_to_scenario")
+    if error is not None:
+        return error
+
+    try:
+        payload = _request_payload(request)
+    except ValueError:
+        return JsonResponse({"detail": "請求資料格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # 帶 Idempotency-Key 的重送直接回傳第一次的回應，不建立訊息也不寫入 outbox
+    try:
+        idempotency = IdempotentRequest.from_headers(
+            user, request.headers, request_fingerprint(request.method, request.path, payload)
+        )
+        stored = await sync_to_async(idempotency.begin)() if idempotency else None
+    except IdempotencyError as exc:
+        return JsonResponse({"detail": exc.detail}, status=exc.status_code)
+    if stored is not None:
+        return JsonResponse(stored.body, status=stored.status_code, headers={REPLAYED_HEADER: "true"})
+
+    body, status_code = await _submit_message(user, payload)
+    if idempotency:
+        await sync_to_async(idempotency.finish)(status_code, body)
+    return JsonResponse(body, status=status_code)
+
+
+async def _submit_message(user: Any, payload: Any) -> tuple[dict[str, Any], int]:
+    serializer = FlexibleMessageSerializer(data=payload)
+    if not serializer.is_valid():
+        return {"detail": "請求資料格式錯誤", "errors": serializer.errors}, status.HTTP_400_BAD_REQUEST
+
+    try:
+        session, message = await sync_to_async(submit_user_message)(
+            user,
+            content=serializer.validated_data["content"],
+            session_id=serializer.validated_data.get("session_id"),
+            scenario_id=serializer.validated_data.get("scenario_id"),
+            llm_model_id=serializer.validated_data.get("llm_model_id"),
+        )
+    except MessageSubmissionError as exc:
+        return {"detail": exc.detail}, exc.status_code
+    except Exception as exc:
+        return {"detail": f"資料庫操作失敗: {exc}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    return {"session_id": str(session.id), "message": MessageSerializer(message).data}, status.HTTP_201_CREATED
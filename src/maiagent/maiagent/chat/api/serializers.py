@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from typing import Any
 
+from django.conf import settings
 from rest_framework import serializers
 
 from maiagent.chat.models import LlmModel, Message, Scenario, Session
@@ -190,6 +191,46 @@ class FlexibleMessageSerializer(serializers.Serializer[Any]):
         return attrs
 
 
+class PollBatchCursorSerializer(serializers.Serializer[Any]):
+    """批次輪詢中單一會話的讀取位置"""
+    session_id = serializers.UUIDField()
+    last_sequence = serializers.IntegerField(min_value=0)
+
+
+class PollBatchSerializer(serializers.Serializer[Any]):
+    """多會話批次輪詢的 serializer"""
+    sessions = PollBatchCursorSerializer(many=True, allow_empty=False)
+    timeout = serializers.IntegerField(min_value=1, max_value=60, default=30)
+
+    def validate_sessions(self, value: list[dict[str, Any]]) -> dict[Any, int]:
+        limit = settings.CHAT_POLL_BATCH_MAX_SESSIONS
+        if len(value) > limit:
+            raise serializers.ValidationError(f"一次最多輪詢 {limit} 個會話")
+        # 轉為 {session_id: last_sequence}，重複的會話取較小的序號
+        cursors: dict[Any, int] = {}
+        for item in value:
+            session_id = item["session_id"]
+            cursors[session_id] = min(item["last_sequence"], cursors.get(session_id, item["last_sequence"]))
+        return cursors
+
+
+class BulkMessageItemSerializer(serializers.Serializer[Any]):
+    """批次匯入的單則訊息"""
+    role = serializers.ChoiceField(choices=Message.Role.choices)
+    content = serializers.CharField(allow_blank=False, trim_whitespace=False)
+
+
+class BulkAppendMessagesSerializer(serializers.Serializer[Any]):
+    """批次匯入訊息的 serializer（依陣列順序分配序號）"""
+    messages = BulkMessageItemSerializer(many=True, allow_empty=False)
+
+    def validate_messages(self, value: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        limit = settings.CHAT_BULK_APPEND_MAX_MESSAGES
+        if len(value) > limit:
+            raise serializers.ValidationError(f"一次最多匯入 {limit} 則訊息")
+        return value
+
+
 class ScenarioUpdateSerializer(serializers.Serializer[Any]):
     """更新場景設定的 serializer"""
     model_id = serializers.UUIDField(required=True)
@@ -16,19 +16,33 @@ from rest_framework.decorators import action
 from rest_framework.request import Request
 from rest_framework.response import Response
 
+from maiagent.chat.deadlines import EXPIRED_REPLY
+from maiagent.chat.idempotency import REPLAYED_HEADER, IdempotencyError, IdempotentRequest, request_fingerprint
+from maiagent.chat.memory import forget_memory
 from maiagent.chat.models import LlmModel, Message, Scenario, Session
-from maiagent.chat.tasks import process_message
+from maiagent.chat.notifications import get_reply_broker, session_channel
+from maiagent.chat.services import (
+    MessageSubmissionError,
+    cancel_session_replies,
+    new_assistant_messages,
+    submit_user_message,
+)
+from maiagent.chat.status_cache import forget_session_state, get_session_state, last_assistant_message
+from maiagent.chat.tasks import select_llm_model
+from maiagent.chat.tokenizers import get_tokenizer
 from maiagent.users.permissions import (
     CanManageScenarios,
     filter_sessions_for_user,
     require_permission,
-    user_has_scenario_access,
+    user_can_view_session,
 )
 
 from .serializers import (
+    BulkAppendMessagesSerializer,
     CreateMessageSerializer,
     FlexibleMessageSerializer,
     MessageSerializer,
+    PollBatchSerializer,
     ScenarioSerializer,
     ScenarioUpsertSerializer,
     ScenarioUpdateSerializer,
@@ -37,6 +51,53 @@ from .serializers import (
 )
 
 
+def validate_retrieve_query_params(query_params: Any) -> None:
+    """驗證 retrieve API 的查詢參數"""
+    # 驗證 include_messages 參數
+    include_messages = query_params.get('include_messages')
+    if include_messages is not None and include_messages.lower() not in ['true', 'false']:
+        raise ValidationError({"include_messages": "必須為 true 或 false"})
+    
+    # 驗證 message_limit 參數
+    try:
+        message_limit = query_params.get('message_limit')
+        if message_limit is not None:
+            limit_num = int(message_limit)
+            if limit_num < 0 or limit_num > 1000:
+                raise ValidationError({"message_limit": "訊息數量限制必須在 0-1000 之間"})
+    except ValueError:
+        raise ValidationError({"message_limit": "訊息數量限制必須為整數"})
+    
+    # 驗證 message_offset 參數  
+    try:
+        message_offset = query_params.get('message_offset')
+        if message_offset is not None:
+            offset_num = int(message_offset)
+            if offset_num < 0:
+                raise ValidationError({"message_offset": "訊息偏移量必須大於或等於 0"})
+    except ValueError:
+        raise ValidationError({"message_offset": "訊息偏移量必須為整數"})
+
+
+def poll_batch_data(updates: dict[str, list[Message]]) -> dict[str, Any]:
+    """批次輪詢的回應內容"""
+    return {
+        "success": True,
+        "data": {
+            "sessions": [
+                {
+                    "session_id": session_id,
+                    "messages": MessageSerializer(messages, many=True).data,
+                    "last_sequence": messages[-1].sequence_number,
+                }
+                for session_id, messages in updates.items()
+            ],
+        },
+        "message": "有新的助手訊息",
+        "timestamp": timezone.now().isoformat(),
+    }
+
+
 class SessionViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin):
     queryset: QuerySet[Session] = Session.objects.all().select_related("scenario", "user__group").order_by("-last_activity_at")
     serializer_class = SessionListSerializer
@@ -217,8 +278,8 @@ class SessionViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.Retr
             # 獲取會話物件
             session: Session = self.get_object()
             
-            # 檢查用戶是否有權限查看該會話
-            if not filter_sessions_for_user(Session.objects.filter(pk=session.pk), request.user).exists():
+            # 檢查用戶是否有權限查看該會話（get_object 已載入 user__group，不需再查詢）
+            if not user_can_view_session(request.user, session.user_id, session.user.group_id):
                 return Response(
                     {"detail": "使用者 Role 沒有查看該會話的權限"},
                     status=status.HTTP_403_FORBIDDEN
@@ -287,30 +348,7 @@ class SessionViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.Retr
     
     def _validate_retrieve_query_params(self, request: Request) -> None:
         """驗證 retrieve API 的查詢參數"""
-        # 驗證 include_messages 參數
-        include_messages = request.query_params.get('include_messages')
-        if include_messages is not None and include_messages.lower() not in ['true', 'false']:
-            raise ValidationError({"include_messages": "必須為 true 或 false"})
-        
-        # 驗證 message_limit 參數
-        try:
-            message_limit = request.query_params.get('message_limit')
-            if message_limit is not None:
-                limit_num = int(message_limit)
-                if limit_num < 0 or limit_num > 1000:
-                    raise ValidationError({"message_limit": "訊息數量限制必須在 0-1000 之間"})
-        except ValueError:
-            raise ValidationError({"message_limit": "訊息數量限制必須為整數"})
-        
-        # 驗證 message_offset 參數  
-        try:
-            message_offset = request.query_params.get('message_offset')
-            if message_offset is not None:
-                offset_num = int(message_offset)
-                if offset_num < 0:
-                    raise ValidationError({"message_offset": "訊息偏移量必須大於或等於 0"})
-        except ValueError:
-            raise ValidationError({"message_offset": "訊息偏移量必須為整數"})
+        validate_retrieve_query_params(request.query_params)
 
     def destroy(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """
@@ -328,7 +366,7 @@ class SessionViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.Retr
                 )
             
             # 檢查用戶是否有權限刪除該會話
-            if not filter_sessions_for_user(Session.objects.filter(pk=session.pk), request.user).exists():
+            if not user_can_view_session(request.user, session.user_id, session.user.group_id):
                 return Response(
                     {"detail": "使用者沒有刪除該會話的權限"},
                     status=status.HTTP_403_FORBIDDEN
@@ -342,7 +380,11 @@ class SessionViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.Retr
             try:
                 from django.db import transaction
                 with transaction.atomic():
+                    # 撤銷尚未發送的回覆任務，進行中的生成在下次檢查時停止
+                    cancel_session_replies(session_id)
                     session.delete()
+                    forget_session_state(session_id)
+                    forget_memory(session_id)
             except Exception as e:
                 return Response(
                     {"detail": "資料庫服務超載或系統維護中"},
@@ -380,8 +422,24 @@ class SessionViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.Retr
         POST /api/v1/conversations/messages/
         - 包含 session_id: 使用現有會話
         - 包含 scenario_id: 建立新會話
+        - 帶 Idempotency-Key 標頭的重送直接回傳第一次的回應
         """
-        from django.db import transaction
+        try:
+            idempotency = IdempotentRequest.from_headers(
+                request.user, request.headers, request_fingerprint(request.method, request.path, request.data)
+            )
+            stored = idempotency.begin() if idempotency else None
+        except IdempotencyError as exc:
+            return Response({"detail": exc.detail}, status=exc.status_code)
+        if stored is not None:
+            return Response(stored.body, status=stored.status_code, headers={REPLAYED_HEADER: "true"})
+
+        response = self._submit_message(request)
+        if idempotency:
+            idempotency.finish(response.status_code, response.data)
+        return response
+
+    def _submit_message(self, request: Request) -> Response:
         import logging
         
         logger = logging.getLogger(__name__)
@@ -396,90 +454,22 @@ class SessionViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.Retr
         
         logger.info(f"Serializer validated successfully: {serializer.validated_data}")
         
-        content: str = serializer.validated_data["content"]
-        request_session_id = serializer.validated_data.get("session_id")
-        scenario_id = serializer.validated_data.get("scenario_id")
-        llm_model_id = serializer.validated_data.get("llm_model_id")
-
         try:
-            with transaction.atomic():
-                # 案例1：請求體中有 session_id - 使用指定會話
-                if request_session_id:
-                    try:
-                        session = get_object_or_404(Session, pk=request_session_id)
-                        # 檢查使用者權限
-                        if not filter_sessions_for_user(Session.objects.filter(pk=session.pk), request.user).exists():
-                            return Response(
-                                {"detail": "無權限存取該會話"}, 
-                                status=status.HTTP_403_FORBIDDEN
-                            )
-                        # 檢查場景存取權
-                        if not user_has_scenario_access(request.user, session.scenario_id):
-                            return Response({"detail": "無場景存取權"}, status=status.HTTP_403_FORBIDDEN)
-                        # 檢查會話狀態
-                        if session.status not in (Session.Status.ACTIVE, Session.Status.REPLYED):
-                            return Response(
-                                {"detail": "會話狀態不允許提交訊息"}, status=status.HTTP_400_BAD_REQUEST
-                            )
-                    except Session.DoesNotExist:
-                        return Response({"detail": "會話不存在"}, status=status.HTTP_404_NOT_FOUND)
-
-                # 案例2：建立新會話
-                else:
-                    if not scenario_id:
-                        return Response(
-                            {"detail": "建立新對話時需要指定場景 ID"}, 
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                    
-                    scenario = get_object_or_404(Scenario, pk=scenario_id)
-                    # 檢查場景存取權
-                    if not user_has_scenario_access(request.user, scenario_id):
-                        return Response({"detail": "無場景存取權"}, status=status.HTTP_403_FORBIDDEN)
-                    
-                    # 建立新會話
-                    session = Session.objects.create(
-                        user=request.user,
-                        scenario=scenario,
-                        status=Session.Status.ACTIVE
-                    )
-
-                # 建立使用者訊息
-                logger.info(f"Creating message: session={session.id}, content={content[:50]}")
-                message = Message.objects.create(
-                    session=session, 
-                    role=Message.Role.USER, 
-                    content=content
-                )
-                logger.info(f"Message created successfully: id={message.id}, sequence={message.sequence_number}")
-
-                # 驗證 LLM model（如果有提供）
-                if llm_model_id:
-                    logger.info(f"Validating LLM model: {llm_model_id}")
-                    llm_model = get_object_or_404(LlmModel, pk=llm_model_id)
-                    logger.info(f"LLM model validated: {llm_model.provider}:{llm_model.name}")
-
-                # 更新 Session 狀態為 Waiting
-                logger.info(f"Updating session status to WAITING")
-                session.status = Session.Status.WAITING
-                session.save(update_fields=["status", "last_activity_at"])
-                logger.info(f"Session updated successfully")
-
+            session, message = submit_user_message(
+                request.user,
+                content=serializer.validated_data["content"],
+                session_id=serializer.validated_data.get("session_id"),
+                scenario_id=serializer.validated_data.get("scenario_id"),
+                llm_model_id=serializer.validated_data.get("llm_model_id"),
+            )
+        except MessageSubmissionError as exc:
+            return Response({"detail": exc.detail}, status=exc.status_code)
         except Exception as exc:
             return Response(
                 {"detail": f"資料庫操作失敗: {exc}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        # 發送 Celery 任務
-        try:
-            process_message.delay(str(session.id), str(message.id))
-        except Exception as exc:
-            return Response(
-                {"detail": f"訊息處理服務暫時不可用: {exc}"}, 
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
-
         # 回傳成功回應，包含 session_id（對新建立的會話特別有用）
         return Response({
             "session_id": str(session.id),
@@ -489,29 +479,99 @@ class SessionViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.Retr
     @action(detail=True, methods=["get"], url_path="polling")
     @require_permission("use_scenario")
     def polling(self, request: Request, pk: str | None = None) -> Response:
-        session: Session = self.get_object()
-        # 可見性檢查
-        if not filter_sessions_for_user(Session.objects.filter(pk=session.pk), request.user).exists():
-            return Response({"detail": "無權限存取該會話"}, status=status.HTTP_403_FORBIDDEN)
         timeout_seconds = int(request.query_params.get("timeout", 30))
         deadline = time.monotonic() + max(1, min(timeout_seconds, 60))
 
-        while time.monotonic() < deadline:
-            session.refresh_from_db(fields=["status", "last_activity_at"])
-            if session.status == Session.Status.REPLYED:
-                last_assistant = (
-                    Message.objects.filter(session=session, role=Message.Role.ASSISTANT)
-                    .order_by("-sequence_number")
-                    .first()
-                )
+        # 先訂閱再檢查狀態：訂閱之後提交的回覆都會以事件送達，不會遺漏
+        with get_reply_broker().subscribe([session_channel(pk)]) as subscription:
+            # 狀態與可見性優先讀取快取
+            state = get_session_state(pk)
+            if state is None or not state.visible_to(request.user):
+                raise Http404
+            if state.status == Session.Status.REPLYED:
+                last_assistant = last_assistant_message(pk, state)
                 if last_assistant:
                     return Response(MessageSerializer(last_assistant).data, status=status.HTTP_200_OK)
-                # 沒有找到助手訊息，稍候再試
-            time.sleep(1.0)
+            if state.status == Session.Status.EXPIRED:
+                # 超過回覆期限未產生回覆，前端提供重新送出
+                return Response({"detail": EXPIRED_REPLY, "status": state.status}, status=status.HTTP_409_CONFLICT)
+
+            # 等待期間不查詢資料庫，由 process_message 的通知喚醒
+            event = subscription.get(timeout=deadline - time.monotonic())
+            if event is not None and event["type"] == "expired":
+                return Response(
+                    {"detail": event["detail"], "status": Session.Status.EXPIRED}, status=status.HTTP_409_CONFLICT
+                )
+            if event is not None:
+                return Response(event["message"], status=status.HTTP_200_OK)
 
         # 超時仍未回覆
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=["post"], url_path="poll-batch")
+    @require_permission("use_scenario")
+    def poll_batch(self, request: Request) -> Response:
+        """
+        多會話批次輪詢
+        POST /api/v1/conversations/poll-batch/
+        回傳有新助手訊息的會話；皆無更新時等待至 timeout，逾時回傳 204
+        """
+        serializer = PollBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"detail": "請求資料格式錯誤", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+        cursors = serializer.validated_data["sessions"]
+        deadline = time.monotonic() + serializer.validated_data["timeout"]
+
+        # 先訂閱再查詢；收到任一會話的通知後重新查詢
+        channels = [session_channel(session_id) for session_id in cursors]
+        with get_reply_broker().subscribe(channels) as subscription:
+            while True:
+                updates = new_assistant_messages(request.user, cursors)
+                if updates:
+                    return Response(poll_batch_data(updates), status=status.HTTP_200_OK)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or subscription.get(timeout=remaining) is None:
+                    break
+
+        # 超時仍無更新
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=["post"], url_path="messages/bulk")
+    @require_permission("import_conversation_messages")
+    def bulk_append_messages(self, request: Request, pk: str | None = None) -> Response:
+        """
+        批次匯入訊息（僅管理人員）
+        POST /api/v1/conversations/{session_id}/messages/bulk/
+        依陣列順序附加於會話既有訊息之後，不觸發 AI 回覆
+        """
+        serializer = BulkAppendMessagesSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"detail": "請求資料格式錯誤", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+        session: Session = self.get_object()
+
+        from django.db import transaction
+        tokenizer = get_tokenizer(select_llm_model(session).tokenizer)
+        with transaction.atomic():
+            created = Message.objects.append_many(session, serializer.validated_data["messages"], tokenizer)
+            # 匯入的助手訊息可能改變最新回覆，清除快取由讀取端重新載入
+            forget_session_state(session.pk)
+
+        return Response({
+            "success": True,
+            "data": {
+                "session_id": str(session.id),
+                "created_count": len(created),
+                "first_sequence": created[0].sequence_number,
+                "last_sequence": created[-1].sequence_number,
+            },
+            "message": "訊息匯入成功",
+            "timestamp": timezone.now().isoformat()
+        }, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=["get"], url_path="search")
     def search(self, request: Request) -> Response:
         query = request.query_params.get("q", "").strip()
@@ -6,4 +6,7 @@ class ChatConfig(AppConfig):
     name = "maiagent.chat"
     verbose_name = "Chat"
 
+    def ready(self):
+        import maiagent.chat.checks  # noqa: F401, PLC0415
+
 
@@ -0,0 +1,282 @@
+"""asyncio 執行模式：單一行程以事件迴圈同時處理多個 `process_message`。
+
+`process_message` 幾乎所有時間都在等待 LLM 的串流回應，prefork worker 每個任務佔用一個行程。
+此模式（`manage.py run_async_worker`）直接從 broker 消費 `ai_queue`，每則任務為事件迴圈上的一個
+coroutine，LLM 以非同步 HTTP 用戶端（`LlmClient.astream`）串流，一個行程可同時進行數百個回覆：
+
+- 呼叫 LLM 前後的步驟（`prepare_generation` / `finish_generation`：資料庫、快取、速率限制）
+  與每個串流片段的寫入，在執行緒池中執行；每個執行緒各自持有一個資料庫連線
+- 同時處理的任務數上限為 `CHAT_ASYNC_WORKER_CONCURRENCY`（broker 的 prefetch），
+  任務完成後才 ack，行程中止時未完成的任務由 broker 重新投遞
+- 執行緒數預設與並行上限相同，每個進行中的任務都取得得到執行緒，一個任務的同步步驟變慢時
+  不會讓其他任務的片段寫入排隊；執行緒依需要建立，閒置時不佔用資料庫連線
+- 執行緒池中只執行短暫的步驟，等待不在其中進行：相同請求的合併、速率限制與重試都經 outbox 延後重新排入
+- 可重試的 LLM 錯誤以相同的 countdown 與重試上限經 outbox 重新排入（帶重試次數，同 `Task.retry`）；
+  帶 eta 的任務（prefork 的 `Task.retry`）未到期時同樣改經 outbox 延後，不佔用並行名額
+
+其他佇列（default、monitor_queue）仍由 Celery worker 處理，見
+`compose/production/django/celery/worker/start` 的 `CELERY_WORKER_QUEUES`。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable
+
+from asgiref.sync import sync_to_async
+from celery import current_app
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .cancellation import CancellationCheck, GenerationCancelled
+from .deadlines import expire_reply, is_expired, parse_deadline
+from .fair_queue import flow_for
+from .llm import LlmError, get_llm_client
+from .outbox import enqueue_task
+from .tasks import (
+    Generation,
+    abandon_generation,
+    fail_generation,
+    finish_generation,
+    prepare_generation,
+    process_message,
+    publish_chunk,
+    publish_error,
+    record_llm_outcome,
+    retry_allowed,
+    retry_countdown,
+    settle_hedge,
+)
+
+logger = logging.getLogger(__name__)
+
+# 消費執行緒等待 broker 事件的間隔（秒），期間累積的 ack 於每次間隔送出
+DRAIN_INTERVAL = 0.1
+# broker 連線中斷後重新連線前的等待（秒）
+RECONNECT_DELAY = 1
+
+
+def _call(func: Callable[..., Any], *args: Any) -> Any:
+    # 執行緒池的執行緒長期存在，與 Celery 任務之間相同，先關閉已失效或超過 CONN_MAX_AGE 的連線
+    close_old_connections()
+    return func(*args)
+
+
+async def run_sync(func: Callable[..., Any], *args: Any) -> Any:
+    """在執行緒池執行同步函式（ORM、Redis），不阻塞事件迴圈。"""
+    return await sync_to_async(_call, thread_sensitive=False)(func, *args)
+
+
+def _send_retry(generation: Generation, retries: int, countdown: float) -> None:
+    # 經 outbox 重新排入，寫入後才 ack 原本的任務，行程中止時重試不會遺失
+    enqueue_task(
+        process_message.name,
+        *generation.task_args,
+        countdown=countdown,
+        retries=retries + 1,
+        expires=generation.deadline,
+        **flow_for(generation.session.user),
+    )
+
+
+def _defer(args: list[Any], delay: float, retries: int, deadline: datetime | None) -> None:
+    enqueue_task(process_message.name, *args, countdown=delay, retries=retries, expires=deadline)
+
+
+def _llm_astream(generation: Generation) -> AsyncIterator[str]:
+    if generation.hedge is not None:
+        return generation.hedge.astream()
+    return get_llm_client(generation.llm_model.provider).astream(generation.request)
+
+
+async def _agenerate_reply(generation: Generation, retries: int) -> str | None:
+    """`tasks._generate_reply` 的非同步版本；重新排入或最終失敗時回傳 None。"""
+    chunks: list[str] = []
+    started, first_token_latency = time.monotonic(), None
+    check = CancellationCheck(generation.session.pk, generation.user_message_id)
+    try:
+        async for chunk in _llm_astream(generation):
+            if first_token_latency is None:
+                first_token_latency = time.monotonic() - started
+            await run_sync(publish_chunk, generation, len(chunks), chunk)
+            chunks.append(chunk)
+            if check.due:
+                await run_sync(check)
+    except GenerationCancelled:
+        await run_sync(abandon_generation, generation, "".join(chunks))
+        return None
+    except LlmError as exc:
+        await run_sync(record_llm_outcome, generation, None, exc)
+        if retry_allowed(exc, chunks, retries):
+            countdown = await run_sync(retry_countdown, generation, exc, retries)
+            if countdown is not None:
+                logger.warning("LLM call failed, retrying: session=%s error=%r", generation.session.pk, exc)
+                await run_sync(_send_retry, generation, retries, countdown)
+            return None
+        await run_sync(fail_generation, generation, exc)
+        return None
+    except Exception as exc:
+        await run_sync(publish_error, generation, exc)
+        raise
+    else:
+        await run_sync(record_llm_outcome, generation, first_token_latency)
+    finally:
+        await run_sync(settle_hedge, generation)
+    return "".join(chunks)
+
+
+async def aprocess_message(
+    session_id: str,
+    user_message_id: str,
+    llm_model_id: str | None = None,
+    *,
+    retries: int = 0,
+    deadline: datetime | None = None,
+) -> None:
+    """與 `process_message` 相同的流程，LLM 串流在事件迴圈上進行。"""
+    try:
+        generation = await run_sync(prepare_generation, session_id, user_message_id, llm_model_id, deadline)
+        if generation is None:
+            return
+        try:
+            reply_text = await _agenerate_reply(generation, retries)
+            if reply_text:
+                await run_sync(generation.share, reply_text)
+        finally:
+            await run_sync(generation.release)
+        if reply_text is not None:
+            await run_sync(finish_generation, generation, reply_text)
+    except GenerationCancelled:
+        logger.info("Generation cancelled: session=%s message=%s", session_id, user_message_id)
+
+
+class AsyncWorker:
+    """消費 broker 佇列並在事件迴圈上執行 `process_message`。
+
+    kombu 的連線不是執行緒安全的：消費與 ack 都在獨立的消費執行緒，
+    完成的任務經 `_acks` 佇列交回該執行緒 ack。
+    """
+
+    def __init__(
+        self, *, queue_name: str = "ai_queue", concurrency: int | None = None, threads: int | None = None
+    ) -> None:
+        self.queue_name = queue_name
+        self.concurrency = concurrency or settings.CHAT_ASYNC_WORKER_CONCURRENCY
+        self.threads = threads or settings.CHAT_ASYNC_WORKER_THREADS or self.concurrency
+        self._acks: queue.SimpleQueue[Any] = queue.SimpleQueue()
+        self._tasks: set[asyncio.Task[None]] = set()
+        # 停止接收新任務 / 進行中的任務皆已完成
+        self._stopping = threading.Event()
+        self._drained = threading.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopped: asyncio.Event | None = None
+
+    def run(self) -> None:
+        asyncio.run(self.serve())
+
+    def stop(self) -> None:
+        """停止接收新任務，進行中的任務完成後結束。"""
+        self._stopping.set()
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if self.threads < self.concurrency:
+            logger.warning(
+                "Async worker has %d threads for %d concurrent tasks; blocking steps may queue behind each other",
+                self.threads,
+                self.concurrency,
+            )
+        self._loop.set_default_executor(ThreadPoolExecutor(self.threads, thread_name_prefix="async-worker"))
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._loop.add_signal_handler(signum, self.stop)
+
+        consumer = threading.Thread(target=self._consume, name="async-worker-consumer", daemon=True)
+        consumer.start()
+        await self._stopped.wait()
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+        self._drained.set()
+        await asyncio.to_thread(consumer.join)
+
+    def _start(self, body: Any, message: Any) -> None:
+        task = asyncio.create_task(self._handle(body, message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, body: Any, message: Any) -> None:
+        headers = message.headers or {}
+        try:
+            if headers.get("task") != process_message.name:
+                logger.error("Unsupported task on %s: %s", self.queue_name, headers.get("task"))
+                return
+            args, kwargs, _ = body
+            retries = headers.get("retries") or 0
+            # Celery 的 expires：超過回覆期限的任務不執行（prefork 由 Celery 丟棄）
+            deadline = parse_deadline(headers.get("expires"))
+            if is_expired(deadline):
+                await run_sync(expire_reply, *args[:2])
+                return
+            # 帶 eta 的任務（prefork 以 Task.retry 重試）未到期時經 outbox 延後，不在此等待而佔用並行名額
+            eta = headers.get("eta")
+            if eta:
+                delay = (datetime.fromisoformat(eta) - timezone.now()).total_seconds()
+                if delay > 0:
+                    await run_sync(_defer, args, delay, retries, deadline)
+                    return
+            await aprocess_message(*args, **kwargs, retries=retries, deadline=deadline)
+        except Exception:
+            logger.exception("process_message failed: id=%s args=%s", headers.get("id"), headers.get("argsrepr"))
+        finally:
+            self._acks.put(message)
+
+    def _on_message(self, body: Any, message: Any) -> None:
+        assert self._loop is not None
+        self._loop.call_soon_threadsafe(self._start, body, message)
+
+    def _flush_acks(self) -> None:
+        while True:
+            try:
+                message = self._acks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                message.ack()
+            except Exception:  # noqa: BLE001
+                # 連線已重建，舊連線上的任務由 broker 重新投遞；任務可重複執行
+                logger.warning("Failed to ack message: id=%s", (message.headers or {}).get("id"))
+
+    def _consume(self) -> None:
+        task_queue = current_app.amqp.queues[self.queue_name]
+        while not self._stopping.is_set():
+            try:
+                with current_app.connection_for_read() as connection:
+                    consumer = connection.Consumer(
+                        task_queue, callbacks=[self._on_message], accept=["json"], prefetch_count=self.concurrency
+                    )
+                    with consumer:
+                        while not self._stopping.is_set():
+                            self._flush_acks()
+                            try:
+                                connection.drain_events(timeout=DRAIN_INTERVAL)
+                            except socket.timeout:
+                                pass
+                        consumer.cancel()
+                        # 停止接收後，等進行中的任務完成並送出 ack 才關閉連線
+                        while not self._drained.wait(DRAIN_INTERVAL):
+                            self._flush_acks()
+                        self._flush_acks()
+            except Exception:  # noqa: BLE001
+                logger.exception("Async worker lost broker connection, reconnecting")
+                time.sleep(RECONNECT_DELAY)
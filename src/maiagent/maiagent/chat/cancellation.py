@@ -0,0 +1,64 @@
+"""取消進行中的回覆生成。
+
+會話被刪除，或等待中的回覆被新的使用者訊息取代時，`process_message` 不必繼續呼叫 LLM、佔用 worker。
+生成 token 存於會話資料列的 `Session.generation`，web 與所有 worker 行程讀取同一份：
+
+- 值為會話目前等待回覆的使用者訊息 ID，與訊息在同一交易寫入（`services.submit_user_message`），
+  先前訊息的任務隨之失效；交易回滾時一併回滾，進行中的生成不受影響
+- 刪除會話時資料列隨之刪除，視為取消；尚未由 relay 發送的任務直接從 outbox 刪除
+  （`services.cancel_session_replies`）
+- `process_message` 在呼叫 LLM 前（`prepare_generation`）與串流片段之間比對 token（`CancellationCheck`，
+  每 `CHAT_CANCEL_CHECK_INTERVAL` 秒最多以主鍵查詢一次），不相符時停止讀取串流（與 provider 的連線隨之關閉）、
+  退回預扣的速率額度，不寫入回覆
+- 寫入回覆前鎖定會話資料列再比對一次，不會與刪除會話或提交新訊息交錯
+- token 為空（欄位加入前建立的會話）時視為有效
+
+等待首字期間不會中斷，最久為 CHAT_LLM_TIMEOUT 秒。
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from django.conf import settings
+
+from .models import Session
+
+
+class GenerationCancelled(Exception):
+    """會話已刪除，或等待的使用者訊息已被新訊息取代。"""
+
+
+def is_awaiting(session: Session, user_message_id: Any) -> bool:
+    """已載入的會話是否仍在等待此訊息的回覆。"""
+    return session.generation is None or str(session.generation) == str(user_message_id)
+
+
+def is_current(session_id: Any, user_message_id: Any, *, lock: bool = False) -> bool:
+    """查詢會話的生成 token；`lock` 時鎖定會話資料列，需在交易內呼叫。會話已刪除時回傳 False。"""
+    sessions = Session.objects.filter(pk=session_id)
+    if lock:
+        sessions = sessions.select_for_update()
+    tokens = list(sessions.values_list("generation", flat=True))
+    return bool(tokens) and (tokens[0] is None or str(tokens[0]) == str(user_message_id))
+
+
+class CancellationCheck:
+    """串流期間定期比對生成 token；建立時視為剛檢查過（`prepare_generation` 已在呼叫 LLM 前比對）。"""
+
+    def __init__(self, session_id: Any, user_message_id: Any) -> None:
+        self.session_id = session_id
+        self.user_message_id = user_message_id
+        self.checked_at = time.monotonic()
+
+    @property
+    def due(self) -> bool:
+        return time.monotonic() - self.checked_at >= settings.CHAT_CANCEL_CHECK_INTERVAL
+
+    def __call__(self) -> None:
+        if not self.due:
+            return
+        self.checked_at = time.monotonic()
+        if not is_current(self.session_id, self.user_message_id):
+            raise GenerationCancelled(f"generation cancelled: session={self.session_id}")
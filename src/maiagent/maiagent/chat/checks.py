@@ -0,0 +1,30 @@
+"""chat 的系統檢查。
+
+管理指令（runserver、relay_outbox、run_async_worker 等）啟動時與 `manage.py check` 執行。
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from django.conf import settings
+from django.core.checks import CheckMessage, Tags, register
+from django.core.checks import Warning as CheckWarning
+
+# 每個行程各自一份資料的快取後端
+PROCESS_LOCAL_CACHES = ("django.core.cache.backends.locmem.LocMemCache",)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs: Any = None, **kwargs: Any) -> list[CheckMessage]:
+    """會話狀態、single-flight 等狀態由 web 寫入、worker 讀取（反之亦然），預設快取需跨行程共用。"""
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        CheckWarning(
+            f"預設快取 {backend} 只在單一行程內有效，web 與 worker 讀不到彼此寫入的會話狀態",
+            hint="CACHES['default'] 改用 django_redis（REDIS_URL），與正式環境相同",
+            id="chat.W001",
+        )
+    ]
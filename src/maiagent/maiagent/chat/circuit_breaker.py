@@ -0,0 +1,192 @@
+"""每個 LLM 模型的斷路器，狀態由所有 worker 共用。
+
+provider 故障時，每個使用該模型的 `process_message` 都要等到逾時並重試數次，整個叢集的 worker 被佔滿。
+斷路器記錄每個模型（`LlmModel`，以 `provider:name` 區分）最近的呼叫結果：
+
+- closed：正常呼叫；連續 `CHAT_CIRCUIT_BREAKER_FAILURE_THRESHOLD` 次失敗後開啟。
+  失敗為逾時、5xx、503，以及首字延遲超過 `CHAT_CIRCUIT_BREAKER_SLOW_CALL` 秒的呼叫；
+  429 由速率限制處理，不計入
+- open：不呼叫該模型。`process_message` 改用場景中斷路器未開啟的其他模型，沒有時直接回覆錯誤訊息，
+  不等待逾時也不重試。開啟 `CHAT_CIRCUIT_BREAKER_OPEN_SECONDS` 秒後進入 half-open
+- half-open：只放行一個試探請求；成功則關閉，失敗則再次開啟。試探請求超過開啟秒數仍未回報
+  （worker 中止）時再放行一個
+
+- `RedisCircuitBreaker`：Redis hash `chat:breaker:{provider}:{name}`，以 Lua 腳本原子更新
+- `InMemoryCircuitBreaker`：單一行程內的替身，供測試使用
+
+`system_health_check` 回傳各模型的狀態。
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from functools import cache
+from typing import Any
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from redis.exceptions import RedisError
+
+from .llm import LlmError, LlmServerError, LlmTimeoutError, LlmUnavailableError
+from .redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 閒置超過此秒數的狀態視為已關閉，讓 Redis 回收鍵
+STATE_TTL = 24 * 60 * 60
+
+
+class CircuitOpenError(LlmError):
+    """模型的斷路器開啟且沒有可用的其他模型，不重試。"""
+
+
+def is_failure(exc: LlmError) -> bool:
+    """provider 端的故障才計入；401、格式錯誤等設定問題與 429 不計入。"""
+    return isinstance(exc, (LlmTimeoutError, LlmServerError, LlmUnavailableError))
+
+
+def breaker_key(llm_model: Any) -> str:
+    return f"chat:breaker:{llm_model.provider}:{llm_model.name}"
+
+
+class CircuitBreaker:
+    def allow(self, llm_model: Any) -> bool:
+        """是否可呼叫模型；half-open 時只有取得試探名額的呼叫回傳 True。"""
+        raise NotImplementedError
+
+    def record(self, llm_model: Any, ok: bool) -> None:
+        """回報一次呼叫的結果。"""
+        raise NotImplementedError
+
+    def state(self, llm_model: Any) -> str:
+        """目前的狀態，不佔用試探名額。"""
+        raise NotImplementedError
+
+
+# KEYS：狀態的鍵；ARGV：開啟秒數, TTL
+_ALLOW_SCRIPT = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'state', 'changed')
+if not state[1] or state[1] == 'closed' then
+    return 1
+end
+if now - tonumber(state[2]) < tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', 'half_open', 'changed', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS：狀態的鍵；ARGV：成功（1 / 0）, 失敗門檻, TTL
+_RECORD_SCRIPT = """
+redis.replicate_commands()
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'open' then
+    return state
+end
+if ARGV[1] == '1' then
+    redis.call('DEL', KEYS[1])
+    return 'closed'
+end
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+if state == 'half_open' or failures >= tonumber(ARGV[2]) then
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    redis.call('HSET', KEYS[1], 'state', 'open', 'changed', tostring(now), 'failures', 0)
+    state = 'open'
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return state
+"""
+
+
+class RedisCircuitBreaker(CircuitBreaker):
+    def allow(self, llm_model: Any) -> bool:
+        script = get_redis_client().register_script(_ALLOW_SCRIPT)
+        try:
+            return bool(
+                script(keys=[breaker_key(llm_model)], args=[settings.CHAT_CIRCUIT_BREAKER_OPEN_SECONDS, STATE_TTL])
+            )
+        except RedisError:
+            # Redis 無法使用時不阻擋呼叫，由逾時與重試策略處理
+            logger.exception("Circuit breaker unavailable: model=%s", llm_model)
+            return True
+
+    def record(self, llm_model: Any, ok: bool) -> None:
+        script = get_redis_client().register_script(_RECORD_SCRIPT)
+        try:
+            state = script(
+                keys=[breaker_key(llm_model)],
+                args=[int(ok), settings.CHAT_CIRCUIT_BREAKER_FAILURE_THRESHOLD, STATE_TTL],
+            )
+        except RedisError:
+            logger.exception("Circuit breaker unavailable: model=%s", llm_model)
+            return
+        if not ok and state == OPEN.encode():
+            logger.warning("Circuit opened: model=%s", llm_model)
+
+    def state(self, llm_model: Any) -> str:
+        try:
+            state = get_redis_client().hget(breaker_key(llm_model), "state")
+        except RedisError:
+            logger.exception("Circuit breaker unavailable: model=%s", llm_model)
+            return "unknown"
+        return state.decode() if state else CLOSED
+
+
+class InMemoryCircuitBreaker(CircuitBreaker):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # 鍵 →（狀態, 狀態變更時間, 連續失敗數）
+        self._states: dict[str, tuple[str, float, int]] = {}
+
+    def allow(self, llm_model: Any) -> bool:
+        key = breaker_key(llm_model)
+        with self._lock:
+            state, changed, _ = self._states.get(key, (CLOSED, 0.0, 0))
+            if state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - changed < settings.CHAT_CIRCUIT_BREAKER_OPEN_SECONDS:
+                return False
+            self._states[key] = (HALF_OPEN, now, 0)
+            return True
+
+    def record(self, llm_model: Any, ok: bool) -> None:
+        key = breaker_key(llm_model)
+        with self._lock:
+            state, changed, failures = self._states.get(key, (CLOSED, 0.0, 0))
+            if state == OPEN:
+                return
+            if ok:
+                self._states.pop(key, None)
+            elif state == HALF_OPEN or failures + 1 >= settings.CHAT_CIRCUIT_BREAKER_FAILURE_THRESHOLD:
+                self._states[key] = (OPEN, time.monotonic(), 0)
+            else:
+                self._states[key] = (state, changed, failures + 1)
+
+    def state(self, llm_model: Any) -> str:
+        with self._lock:
+            return self._states.get(breaker_key(llm_model), (CLOSED, 0.0, 0))[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._states.clear()
+
+
+@cache
+def _load_breaker(path: str) -> CircuitBreaker:
+    return import_string(path)()
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    return _load_breaker(settings.CHAT_CIRCUIT_BREAKER)
@@ -0,0 +1,107 @@
+"""回覆期限：使用者已不再等待的回覆不再產生。
+
+前端送出訊息後最多等待 30 秒（輪詢 30 次、WebSocket 計時器），之後顯示「回應超時，請重新嘗試」。
+積壓消化時，worker 原本仍會為早已放棄等待的訊息逐一呼叫 LLM。改為：
+
+- `submit_user_message` 寫入 outbox 時帶絕對期限（提交後 `CHAT_REPLY_DEADLINE` 秒，`OutboxMessage.expires_at`），
+  relay 以 Celery 的 `expires` 發送；重試與速率限制延後的重新排入沿用原本的期限，
+  等待秒數以期限前剩餘的時間為上限（`capped_countdown`），已無剩餘時間時直接過期
+- relay 不發送已過期的 outbox 資料列，刪除後直接執行 `expire_reply`
+- worker 不執行已過期的任務：prefork 由 Celery 丟棄並送出 `task_revoked` 信號，
+  asyncio 執行模式比對訊息標頭的 `expires`；`prepare_generation` 在呼叫 LLM 前再比對一次
+- 過期時（`expire_reply`）：
+  - 會話仍在等待該訊息時標記為 `EXPIRED`，可重新送出訊息；polling 回應 409 讓前端提供重試
+  - 串流送出 `error` 事件；會話頻道發佈 `expired` 事件，喚醒 WebSocket 訂閱者與長輪詢
+  - 累計 `chat:reply-expired` 計數，`system_health_check` 的 `expired_replies` 回傳
+
+已開始串流的回覆不中斷。
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cancellation import is_awaiting
+from .models import Session
+from .notifications import publish_expired
+from .status_cache import record_session_state
+from .streams import publish_stream_event
+
+logger = logging.getLogger(__name__)
+
+EXPIRED_COUNT_KEY = "chat:reply-expired"
+EXPIRED_REPLY = "回覆逾時，請重新送出訊息"
+
+
+def reply_deadline() -> datetime:
+    return timezone.now() + timedelta(seconds=settings.CHAT_REPLY_DEADLINE)
+
+
+def capped_countdown(countdown: float, deadline: datetime | None) -> float | None:
+    """重新排入前的等待秒數，使任務在期限前執行；期限已過回傳 None，呼叫端應改為 `expire_reply`。
+
+    Celery 重試沿用原本的 `expires`，等待超過剩餘時間的重試必定過期；等待至多為剩餘時間的一半，
+    另一半留給重試本身呼叫 LLM。
+    """
+    if deadline is None:
+        return countdown
+    remaining = (deadline - timezone.now()).total_seconds()
+    if remaining <= 0:
+        return None
+    return min(countdown, remaining / 2)
+
+
+def parse_deadline(value: Any) -> datetime | None:
+    """Celery 的 `expires`（訊息標頭為 ISO 8601 字串）轉為 datetime；未設定回傳 None。"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return parse_datetime(value)
+
+
+def is_expired(deadline: datetime | None) -> bool:
+    return deadline is not None and timezone.now() >= deadline
+
+
+def expire_reply(session_id: Any, user_message_id: Any) -> None:
+    """丟棄已過期的回覆任務：會話仍在等待該訊息時標記為 EXPIRED，並累計過期數。"""
+    logger.warning("Reply expired before generation: session=%s message=%s", session_id, user_message_id)
+    record_expired()
+    with transaction.atomic():
+        session = (
+            Session.objects.select_for_update(of=("self",))
+            .select_related("user")
+            .filter(pk=session_id, status=Session.Status.WAITING)
+            .first()
+        )
+        # 已刪除、已回覆，或等待的訊息已被取代
+        if session is None or not is_awaiting(session, user_message_id):
+            return
+        session.status = Session.Status.EXPIRED
+        session.save(update_fields=["status", "last_activity_at"])
+        record_session_state(session)
+        event = {"type": "error", "reply_to": str(user_message_id), "detail": EXPIRED_REPLY}
+        transaction.on_commit(lambda: publish_stream_event(session_id, event))
+        transaction.on_commit(lambda: publish_expired(session_id, user_message_id, EXPIRED_REPLY))
+
+
+def record_expired() -> None:
+    cache.add(EXPIRED_COUNT_KEY, 0, timeout=None)
+    try:
+        cache.incr(EXPIRED_COUNT_KEY)
+    except ValueError:
+        # 剛好被淘汰，下次重新計數
+        pass
+
+
+def expired_count() -> int:
+    return cache.get(EXPIRED_COUNT_KEY, 0)
@@ -0,0 +1,80 @@
+"""語意快取使用的文字向量（embedding）。
+
+`CHAT_SEMANTIC_CACHE_EMBEDDER` 設定類別與參數，與 `CHAT_LLM_PROVIDERS` 相同的格式：
+
+    CHAT_SEMANTIC_CACHE_EMBEDDER = {
+        "CLASS": "maiagent.chat.embeddings.HashingEmbedder",
+        "OPTIONS": {"dimensions": 512},
+    }
+
+`embed` 回傳 L2 正規化的 float32 矩陣（每列一段文字），兩個向量的內積即餘弦相似度。
+"""
+
+from __future__ import annotations
+
+import unicodedata
+import zlib
+from functools import cache
+from typing import Any, Sequence
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .response_cache import normalize_text
+
+
+class Embedder:
+    # 向量維度，存入的向量與查詢的向量必須一致
+    dimensions: int
+
+    @property
+    def identity(self) -> str:
+        """模型與維度的識別，更換 embedder 後舊向量不再參與比對。"""
+        return f"{type(self).__module__}.{type(self).__qualname__}:{self.dimensions}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms == 0, 1, norms)).astype(np.float32, copy=False)
+
+
+class HashingEmbedder(Embedder):
+    """離線用：字元 n-gram 雜湊到固定維度（feature hashing），不需下載模型。
+
+    以字元為單位，中文不需斷詞；只能辨識用字相近的換句話說，語意相近但用字不同的問題
+    需要真正的 embedding 模型。
+    """
+
+    def __init__(self, *, dimensions: int = 512, ngram_sizes: Sequence[int] = (1, 2), **options: Any) -> None:
+        self.dimensions = dimensions
+        self.ngram_sizes = tuple(ngram_sizes)
+
+    def _features(self, text: str) -> list[str]:
+        # 忽略空白與標點，「怎麼重設密碼？」與「怎麼重設 密碼」相同
+        chars = "".join(c for c in normalize_text(text) if unicodedata.category(c)[0] not in "PZ")
+        return [chars[i:i + n] for n in self.ngram_sizes for i in range(len(chars) - n + 1)]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.array([zlib.crc32(f.encode()) for f in self._features(text)], dtype=np.uint32)
+            if not hashes.size:
+                continue
+            # 最高位元決定正負號，降低雜湊碰撞造成的偏差
+            signs = np.where(hashes >> 31, -1.0, 1.0)
+            vectors[row] = np.bincount(hashes % self.dimensions, weights=signs, minlength=self.dimensions)
+        return normalize_rows(vectors)
+
+
+@cache
+def _load_embedder() -> Embedder:
+    config = settings.CHAT_SEMANTIC_CACHE_EMBEDDER
+    return import_string(config["CLASS"])(**config.get("OPTIONS", {}))
+
+
+def get_embedder() -> Embedder:
+    return _load_embedder()
@@ -0,0 +1,148 @@
+"""AI 任務的跨群組公平排程（deficit round-robin）。
+
+所有 `process_message` 共用 FIFO 的 `ai_queue`，大量送出訊息的群組會讓其他群組等到其積壓消化完。
+改為讓積壓留在 outbox，由 relay 依群組公平地發送：
+
+- 每則回覆任務寫入 outbox 時帶 flow（`{群組 ID}:{角色}`，無群組為 `-:{角色}`）與權重
+  （`CHAT_FAIR_QUEUE_ROLE_WEIGHTS`，管理員與主管高於一般員工）
+- relay 只在 `ai_queue` 尚未發送給 worker 的任務少於 `CHAT_FAIR_QUEUE_MAX_READY` 時發送，
+  積壓不會進入 broker 的 FIFO
+- 可發送的名額以 deficit round-robin 分給有積壓的 flow：每輪每個 flow 累積與權重相同的額度，
+  依額度發送；同一 flow 內依寫入順序。大量送出的群組只佔自己的份額，小群組的等待時間
+  與大群組的積壓量無關
+- `backlog_by_flow()` / `manage.py fair_queue_stats` 提供各 flow 的待發送數與最久等待時間，
+  `system_health_check` 回傳各 flow 的待發送數
+
+未帶 flow 的 outbox 資料列（其他任務）不受限制，依寫入順序發送。
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import deque
+from typing import Any
+
+from celery import current_app
+from django.conf import settings
+from django.db.models import Count, F, Max, Min, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def flow_for(user: Any) -> dict[str, Any]:
+    """`enqueue_task` 的 flow 與權重參數；未啟用公平排程時回傳空字典。"""
+    if not settings.CHAT_FAIR_QUEUE_ENABLED:
+        return {}
+    role = getattr(user, "role", "") or ""
+    return {
+        "flow": f"{user.group_id or '-'}:{role}",
+        "weight": settings.CHAT_FAIR_QUEUE_ROLE_WEIGHTS.get(role, 1),
+    }
+
+
+def ready_count(queue_name: str = "ai_queue") -> int:
+    """broker 佇列中尚未發送給 worker 的任務數。"""
+    with current_app.connection_for_read() as connection:
+        try:
+            return connection.default_channel.queue_declare(queue=queue_name, passive=True).message_count
+        except connection.channel_errors:
+            # Redis broker 在佇列清空時刪除其 list，被動宣告回應 404：視為沒有待處理的任務
+            return 0
+
+
+class DeficitRoundRobin:
+    """跨批次保留各 flow 的額度與輪替位置（每個 relay 行程一個）。"""
+
+    def __init__(self) -> None:
+        self.deficits: dict[str, float] = {}
+        self.order: deque[str] = deque()
+
+    def allocate(self, backlog: dict[str, tuple[int, int]], capacity: int) -> list[str]:
+        """`backlog` 為 flow →（待發送數, 權重）；回傳本批依發送順序排列的 flow，每個元素代表一則任務。"""
+        # 積壓已清空的 flow 移除並歸零額度，新的 flow 排到最後
+        for flow in [flow for flow in self.order if flow not in backlog]:
+            self.order.remove(flow)
+            del self.deficits[flow]
+        for flow in backlog:
+            if flow not in self.deficits:
+                self.deficits[flow] = 0
+                self.order.append(flow)
+
+        remaining = {flow: pending for flow, (pending, _) in backlog.items()}
+        served: list[str] = []
+        while len(served) < capacity and any(remaining.values()):
+            flow = self.order[0]
+            self.order.rotate(-1)
+            if not remaining[flow]:
+                continue
+            self.deficits[flow] += backlog[flow][1]
+            take = min(int(self.deficits[flow]), remaining[flow], capacity - len(served))
+            served.extend([flow] * take)
+            self.deficits[flow] -= take
+            remaining[flow] -= take
+            if not remaining[flow]:
+                self.deficits[flow] = 0
+        return served
+
+
+_scheduler = DeficitRoundRobin()
+
+
+def _pending_rows() -> Any:
+    return OutboxMessage.objects.filter(available_at__lte=timezone.now()).exclude(flow="")
+
+
+def lock_fair_batch(capacity: int, scheduler: DeficitRoundRobin | None = None) -> list[OutboxMessage]:
+    """鎖定本批要發送的公平排程資料列（需在交易中呼叫），依 deficit round-robin 的順序排列。"""
+    scheduler = scheduler or _scheduler
+    # 新的 flow 依最早的待發送任務排入輪替
+    rows = (
+        _pending_rows()
+        .values("flow")
+        .annotate(pending=Count("id"), weight=Max("weight"), first=Min("id"))
+        .order_by("first")
+    )
+    backlog = {row["flow"]: (row["pending"], row["weight"]) for row in rows}
+    if not backlog:
+        return []
+    try:
+        capacity = min(capacity, settings.CHAT_FAIR_QUEUE_MAX_READY - ready_count())
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Cannot read ai_queue depth, holding fair-queued tasks: %s", exc)
+        return []
+    served = scheduler.allocate(backlog, capacity)
+    if not served:
+        return []
+
+    takes: dict[str, int] = {}
+    for flow in served:
+        takes[flow] = takes.get(flow, 0) + 1
+    # 每個 flow 最早的 N 筆；視窗函數不能與 FOR UPDATE 併用，先選出 ID 再鎖定
+    heads = (
+        _pending_rows()
+        .filter(flow__in=takes)
+        .annotate(rank=Window(RowNumber(), partition_by=F("flow"), order_by=F("id").asc()))
+        .filter(rank__lte=max(takes.values()))
+        .values_list("id", "flow", "rank")
+    )
+    ids = [pk for pk, flow, rank in heads if rank <= takes[flow]]
+    # 已被其他 relay 鎖定的資料列略過，留給該 relay 發送
+    locked: dict[str, deque[OutboxMessage]] = {}
+    for row in OutboxMessage.objects.select_for_update(skip_locked=True).filter(pk__in=ids).order_by("id"):
+        locked.setdefault(row.flow, deque()).append(row)
+    return [locked[flow].popleft() for flow in served if locked.get(flow)]
+
+
+def backlog_by_flow() -> list[dict[str, Any]]:
+    """各 flow 的待發送數（含尚未到期的延後任務）與最早寫入時間，依待發送數由多到少。"""
+    rows = (
+        OutboxMessage.objects.exclude(flow="")
+        .values("flow")
+        .annotate(pending=Count("id"), weight=Max("weight"), oldest=Min("created_at"))
+        .order_by("-pending")
+    )
+    return list(rows)
@@ -0,0 +1,246 @@
+"""Hedged requests：主要模型遲遲沒有首字時，同時向場景的下一個模型送出請求。
+
+provider 的尾端延遲升高時，使用者原本要等到讀取逾時（30 秒）。場景以 `config_json["hedging"]` 啟用：
+
+    {"enabled": true, "first_token_timeout": 2.0}
+
+- 主要模型（`select_llm_model` 的結果）在 `first_token_timeout` 秒（預設 CHAT_HEDGE_FIRST_TOKEN_TIMEOUT）
+  內沒有產生首字時，向場景的下一個 `ScenarioModel`（預設模型優先）送出相同的對話
+- 主要模型在首字之前失敗時立即改用備援模型，不等待門檻
+- 先產生首字者勝出，另一個請求隨即取消，之後只轉送勝出者的片段；回覆以勝出的模型寫入
+- 備援模型的速率額度不足、或場景沒有其他模型時不送出
+- 每次決策寫入 `HedgeDecision`（是否送出備援、勝出者、各自的首字延遲），`manage.py hedge_stats` 彙整
+
+prefork worker 以執行緒、asyncio 執行模式以 task 同時讀取兩個串流。取消時 prefork 由勝出者的執行緒
+關閉落後請求的 HTTP 回應（`StreamAbort`），provider 停滯時連線也立即釋放；asyncio 執行模式取消其 task。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterator
+
+from django.conf import settings
+
+from .llm import LlmRequest, StreamAbort, abortable, get_llm_client
+from .models import HedgeDecision, LlmModel
+from .rate_limit import get_rate_limiter
+from .scenario_cache import ScenarioRuntime
+
+PRIMARY = HedgeDecision.Role.PRIMARY
+BACKUP = HedgeDecision.Role.BACKUP
+
+
+def hedge_config(scenario_config: dict[str, Any] | None) -> dict[str, Any]:
+    return (scenario_config or {}).get("hedging") or {}
+
+
+def is_enabled(scenario_config: dict[str, Any] | None) -> bool:
+    return settings.CHAT_HEDGING_ENABLED and hedge_config(scenario_config).get("enabled", False)
+
+
+def backup_model(runtime: ScenarioRuntime, primary: LlmModel) -> LlmModel | None:
+    """場景中主要模型之外的下一個模型（預設模型優先）。"""
+    return next(iter(runtime.other_models(primary)), None)
+
+
+@dataclass(eq=False)
+class Attempt:
+    role: str
+    llm_model: LlmModel
+    request: LlmRequest
+    started: float | None = None
+    first_token: float | None = None
+    # 首字之前被取消時已等待的秒數（首字延遲的下限）
+    cancelled_after: float | None = None
+    error: Exception | None = None
+    # 取消時關閉進行中的連線（prefork 的執行緒），不等待下一個片段
+    abort: StreamAbort = field(default_factory=StreamAbort)
+
+    @property
+    def first_token_latency(self) -> float | None:
+        """首字延遲（秒），自本請求送出起算；首字之前被取消時為已等待的秒數。"""
+        if self.started is None:
+            return None
+        if self.first_token is not None:
+            return self.first_token - self.started
+        return self.cancelled_after
+
+    @property
+    def first_token_ms(self) -> int | None:
+        if self.started is None or self.first_token is None:
+            return None
+        return round((self.first_token - self.started) * 1000)
+
+
+class Hedge:
+    """一輪回覆的主要 / 備援請求與其決策；`stream()` / `astream()` 只能呼叫一次。"""
+
+    def __init__(self, timeout: float, primary: Attempt, backup: Attempt | None, backup_tokens: int = 0) -> None:
+        self.timeout = timeout
+        self.primary = primary
+        self.backup = backup
+        self.backup_tokens = backup_tokens
+        self.hedged = False
+        self.skip_reason = "" if backup is not None else HedgeDecision.SkipReason.NO_BACKUP
+        self.winner: Attempt | None = None
+
+    @property
+    def loser(self) -> Attempt | None:
+        if not self.hedged or self.winner is None:
+            return None
+        return self.backup if self.winner is self.primary else self.primary
+
+    def _acquire_backup(self) -> bool:
+        """是否送出備援請求；只決定一次。"""
+        if self.backup is None or self.hedged or self.skip_reason:
+            return False
+        if get_rate_limiter().acquire(self.backup.llm_model, self.backup_tokens):
+            self.skip_reason = HedgeDecision.SkipReason.RATE_LIMITED
+            return False
+        self.hedged = True
+        return True
+
+    @property
+    def attempts(self) -> list[Attempt]:
+        """已送出的請求。"""
+        return [a for a in (self.primary, self.backup) if a is not None and a.started is not None]
+
+    def _win(self, attempt: Attempt, others: set[Attempt]) -> None:
+        attempt.first_token = time.monotonic()
+        self.winner = attempt
+        for other in others - {attempt}:
+            if other.started is not None:
+                other.cancelled_after = attempt.first_token - other.started
+
+    def _stream_in_thread(self, attempt: Attempt, events: queue.SimpleQueue) -> None:
+        attempt.started = time.monotonic()
+        try:
+            with abortable(attempt.abort):
+                for chunk in get_llm_client(attempt.llm_model.provider).stream(attempt.request):
+                    if attempt.abort.aborted:
+                        return
+                    events.put((attempt, chunk, None))
+            events.put((attempt, None, None))
+        except Exception as exc:  # noqa: BLE001
+            events.put((attempt, None, exc))
+
+    def stream(self) -> Iterator[str]:
+        events: queue.SimpleQueue = queue.SimpleQueue()
+
+        def start(attempt: Attempt) -> None:
+            threading.Thread(target=self._stream_in_thread, args=(attempt, events), daemon=True).start()
+
+        start(self.primary)
+        running = {self.primary}
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                waiting = self.winner is None and not self.hedged and not self.skip_reason
+                try:
+                    attempt, chunk, exc = events.get(timeout=max(deadline - time.monotonic(), 0) if waiting else None)
+                except queue.Empty:
+                    # 主要模型逾時未產生首字
+                    if self._acquire_backup():
+                        start(self.backup)
+                        running.add(self.backup)
+                    continue
+                if self.winner is not None and attempt is not self.winner:
+                    continue
+                if chunk is not None:
+                    if self.winner is None:
+                        self._win(attempt, running)
+                        for other in running - {attempt}:
+                            other.abort.abort()
+                    yield chunk
+                    continue
+                attempt.error = exc
+                if self.winner is not None or exc is None:
+                    # 勝出者結束，或首字之前即結束（空白回覆）
+                    if exc is not None:
+                        raise exc
+                    self.winner = self.winner or attempt
+                    return
+                running.discard(attempt)
+                # 主要模型在首字之前失敗，立即改用備援模型
+                if attempt is self.primary and self._acquire_backup():
+                    start(self.backup)
+                    running.add(self.backup)
+                if not running:
+                    raise exc
+        finally:
+            for attempt in running:
+                attempt.abort.abort()
+
+    async def _astream_attempt(self, attempt: Attempt, events: asyncio.Queue) -> None:
+        attempt.started = time.monotonic()
+        try:
+            async for chunk in get_llm_client(attempt.llm_model.provider).astream(attempt.request):
+                await events.put((attempt, chunk, None))
+            await events.put((attempt, None, None))
+        except Exception as exc:  # noqa: BLE001
+            await events.put((attempt, None, exc))
+
+    async def astream(self) -> AsyncIterator[str]:
+        events: asyncio.Queue = asyncio.Queue()
+        tasks: dict[Attempt, asyncio.Task[None]] = {}
+
+        def start(attempt: Attempt) -> None:
+            tasks[attempt] = asyncio.create_task(self._astream_attempt(attempt, events))
+
+        start(self.primary)
+        running = {self.primary}
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                waiting = self.winner is None and not self.hedged and not self.skip_reason
+                try:
+                    timeout = max(deadline - time.monotonic(), 0) if waiting else None
+                    attempt, chunk, exc = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    if await asyncio.to_thread(self._acquire_backup):
+                        start(self.backup)
+                        running.add(self.backup)
+                    continue
+                if self.winner is not None and attempt is not self.winner:
+                    continue
+                if chunk is not None:
+                    if self.winner is None:
+                        self._win(attempt, running)
+                        for other in running - {attempt}:
+                            tasks[other].cancel()
+                    yield chunk
+                    continue
+                attempt.error = exc
+                if self.winner is not None or exc is None:
+                    if exc is not None:
+                        raise exc
+                    self.winner = self.winner or attempt
+                    return
+                running.discard(attempt)
+                if attempt is self.primary and await asyncio.to_thread(self._acquire_backup):
+                    start(self.backup)
+                    running.add(self.backup)
+                if not running:
+                    raise exc
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    def record(self, scenario_id: Any, user_message_id: Any) -> HedgeDecision:
+        return HedgeDecision.objects.create(
+            scenario_id=scenario_id,
+            message_id=user_message_id,
+            primary_model_id=self.primary.llm_model.pk,
+            backup_model_id=self.backup.llm_model.pk if self.backup is not None else None,
+            first_token_timeout=self.timeout,
+            hedged=self.hedged,
+            skip_reason=self.skip_reason if not self.hedged else "",
+            winner=self.winner.role if self.winner is not None else "",
+            primary_first_token_ms=self.primary.first_token_ms,
+            backup_first_token_ms=self.backup.first_token_ms if self.backup is not None else None,
+        )
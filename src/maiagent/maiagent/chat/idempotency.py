@@ -0,0 +1,98 @@
+"""post_message 的 Idempotency-Key 支援。
+
+行動裝置與代理伺服器會在逾時後重送 post_message；帶相同 `Idempotency-Key` 的重送直接回傳
+第一次的 201 回應，不再建立訊息、不再寫入 outbox（不會再呼叫一次 LLM）。
+
+快取（正式環境為 Redis）鍵為 `chat:idempotency:{user_id}:{sha256(key)}`，依使用者區分：
+
+- 處理中：`{"fingerprint"}`，存活 `CHAT_IDEMPOTENCY_LOCK_TTL` 秒；同時到達的重送回傳 409
+- 完成：`{"fingerprint", "status_code", "body"}`，交易提交後寫入，存活 `CHAT_IDEMPOTENCY_TTL` 秒
+- 失敗（非 2xx）：刪除鍵，客戶端可用同一個 key 重試
+- 同一個 key 搭配不同的請求內容回傳 422
+
+快取無法使用時不阻擋請求（等同未帶 key）。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Mapping
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# 重送時回應帶此標頭，方便客戶端與監控辨識
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    """Idempotency-Key 無效或衝突，由 API 層轉為對應的 HTTP 回應。"""
+
+    def __init__(self, detail: str, status_code: int) -> None:
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status_code: int
+    body: dict[str, Any]
+
+
+def request_fingerprint(method: str, path: str, payload: Any) -> str:
+    """請求內容的雜湊，用於判斷同一個 key 是否用於不同的請求。"""
+    if hasattr(payload, "dict"):
+        payload = payload.dict()
+    canonical = json.dumps([method, path, payload], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotentRequest:
+    def __init__(self, user: Any, key: str, fingerprint: str) -> None:
+        self.cache_key = f"chat:idempotency:{user.pk}:{hashlib.sha256(key.encode()).hexdigest()}"
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_headers(cls, user: Any, headers: Mapping[str, str], fingerprint: str) -> IdempotentRequest | None:
+        """讀取 Idempotency-Key 標頭；未提供時回傳 None。"""
+        key = headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return None
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyError(
+                f"{IDEMPOTENCY_HEADER} 長度必須為 1-{MAX_KEY_LENGTH} 字元", status.HTTP_400_BAD_REQUEST
+            )
+        return cls(user, key, fingerprint)
+
+    def begin(self) -> StoredResponse | None:
+        """開始處理：已完成的請求回傳先前的回應，否則標記為處理中並回傳 None。"""
+        stored = cache.get(self.cache_key)
+        if stored is None:
+            if cache.add(self.cache_key, {"fingerprint": self.fingerprint}, settings.CHAT_IDEMPOTENCY_LOCK_TTL):
+                return None
+            stored = cache.get(self.cache_key)
+            if stored is None:
+                # 快取無法使用，照常處理
+                return None
+        if stored["fingerprint"] != self.fingerprint:
+            raise IdempotencyError(
+                f"{IDEMPOTENCY_HEADER} 已用於不同的請求內容", status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if "status_code" not in stored:
+            raise IdempotencyError(f"相同 {IDEMPOTENCY_HEADER} 的請求仍在處理中", status.HTTP_409_CONFLICT)
+        return StoredResponse(status_code=stored["status_code"], body=stored["body"])
+
+    def finish(self, status_code: int, body: Any) -> None:
+        """處理結束：成功的回應於交易提交後保存，失敗時釋放 key 讓客戶端重試。"""
+        if not status.is_success(status_code):
+            cache.delete(self.cache_key)
+            return
+        stored = {"fingerprint": self.fingerprint, "status_code": status_code, "body": dict(body)}
+        transaction.on_commit(lambda: cache.set(self.cache_key, stored, settings.CHAT_IDEMPOTENCY_TTL))
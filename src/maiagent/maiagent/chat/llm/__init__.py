@@ -0,0 +1,33 @@
+"""LLM provider 用戶端（依 `LlmModel.provider` 選擇）。"""
+
+from .base import (
+    LlmAuthenticationError,
+    LlmClient,
+    LlmConfigurationError,
+    LlmError,
+    LlmRateLimitError,
+    LlmRequest,
+    LlmResponseError,
+    LlmServerError,
+    LlmTimeoutError,
+    LlmUnavailableError,
+    StreamAbort,
+    abortable,
+)
+from .registry import get_llm_client
+
+__all__ = [
+    "LlmAuthenticationError",
+    "LlmClient",
+    "LlmConfigurationError",
+    "LlmError",
+    "LlmRateLimitError",
+    "LlmRequest",
+    "LlmResponseError",
+    "LlmServerError",
+    "LlmTimeoutError",
+    "LlmUnavailableError",
+    "StreamAbort",
+    "abortable",
+    "get_llm_client",
+]
@@ -0,0 +1,50 @@
+"""Anthropic Messages API（串流）。"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from .base import LlmRequest, LlmResponseError, LlmServerError, LlmUnavailableError
+from .transport import HttpLlmClient
+
+API_VERSION = "2023-06-01"
+# Messages API 必須指定 max_tokens
+DEFAULT_MAX_TOKENS = 1024
+_PARAMS = ("temperature", "top_p")
+
+
+class AnthropicClient(HttpLlmClient):
+    path = "/v1/messages"
+
+    def __init__(self, *, base_url: str = "https://api.anthropic.com", **options: Any) -> None:
+        super().__init__(base_url=base_url, **options)
+
+    def headers(self) -> dict[str, str]:
+        return {"x-api-key": self.api_key, "anthropic-version": API_VERSION}
+
+    def payload(self, request: LlmRequest) -> dict[str, Any]:
+        payload = {
+            "model": request.model,
+            "messages": request.messages,
+            "max_tokens": request.params.get("max_tokens", DEFAULT_MAX_TOKENS),
+            "stream": True,
+            **{key: request.params[key] for key in _PARAMS if key in request.params},
+        }
+        if request.system:
+            payload["system"] = request.system
+        return payload
+
+    def event_text(self, event: dict[str, Any]) -> str | None:
+        # message_stop 之後伺服器即結束串流，不需特別處理
+        event_type = event.get("type")
+        if event_type == "content_block_delta":
+            return (event.get("delta") or {}).get("text")
+        if event_type == "error":
+            # 串流中途的錯誤（例如 overloaded_error）
+            error = event.get("error") or {}
+            if error.get("type") == "overloaded_error":
+                raise LlmUnavailableError(error.get("message", ""))
+            if error.get("type") == "api_error":
+                raise LlmServerError(error.get("message", ""))
+            raise LlmResponseError(error.get("message", "LLM 回應格式異常"))
+        return None
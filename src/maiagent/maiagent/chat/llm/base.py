@@ -0,0 +1,185 @@
+"""LLM 用戶端的共用型別與錯誤分類。
+
+錯誤分類對應 doc/design/Celery_Design.md 的重試策略，`process_message` 依
+`retryable` / `max_retries` / `retry_countdown()` 決定是否以 Celery 重試：
+
+| 錯誤                    | 重試                                  |
+|-------------------------|---------------------------------------|
+| LlmTimeoutError         | 最多 3 次，間隔 5 秒                   |
+| LlmRateLimitError (429) | 最多 5 次，指數退避 2 秒起、上限 300 秒 |
+| LlmServerError (5xx)    | 用戶端已立即重試 1 次；之後最多 3 次，間隔 10 秒 |
+| LlmUnavailableError (503)| 最多 2 次，間隔 60 秒                 |
+| LlmAuthenticationError (401)、LlmResponseError、其他 | 不重試 |
+
+帶回覆期限的任務，等待秒數以期限前剩餘時間的一半為上限，期限已過時不重試、直接標記逾時
+（maiagent/chat/deadlines.py 的 `capped_countdown`）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Iterator
+
+
+@dataclass(frozen=True)
+class LlmRequest:
+    model: str
+    # 依時間順序的對話：[{"role": "user" | "assistant", "content": "..."}]
+    messages: list[dict[str, str]]
+    system: str = ""
+    # temperature、max_tokens、top_p 等生成參數
+    params: dict[str, Any] = field(default_factory=dict)
+
+
+class StreamAbort:
+    """從其他執行緒中止進行中的同步串流（hedging 取消落後的請求）。
+
+    串流在 `abortable()` 內讀取時，provider 以 `on_abort` 登記關閉底層連線的函式，
+    阻塞中的讀取隨即結束，不需等到下一個片段或讀取逾時。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        self._aborted = threading.Event()
+
+    @property
+    def aborted(self) -> bool:
+        return self._aborted.is_set()
+
+    def on_abort(self, callback: Callable[[], None]) -> None:
+        """登記中止時呼叫的函式；已中止時立即呼叫。"""
+        with self._lock:
+            if not self.aborted:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def abort(self) -> None:
+        with self._lock:
+            self._aborted.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def wait(self, seconds: float) -> bool:
+        """等待 `seconds` 秒；期間被中止時提早回傳 True。"""
+        return self._aborted.wait(seconds)
+
+
+_current_abort: ContextVar[StreamAbort | None] = ContextVar("llm_stream_abort", default=None)
+
+
+@contextmanager
+def abortable(abort: StreamAbort) -> Iterator[None]:
+    """此範圍內讀取的同步串流可由 `abort.abort()` 中止。"""
+    token = _current_abort.set(abort)
+    try:
+        yield
+    finally:
+        _current_abort.reset(token)
+
+
+def current_abort() -> StreamAbort | None:
+    return _current_abort.get()
+
+
+def sleep(seconds: float) -> bool:
+    """離線 provider 模擬延遲；串流被中止時提早結束並回傳 False。"""
+    abort = current_abort()
+    if abort is None:
+        time.sleep(seconds)
+        return True
+    return not abort.wait(seconds)
+
+
+class LlmClient:
+    """LLM provider 用戶端；每個 worker 行程每個 provider 一個實例（見 `get_llm_client`）。"""
+
+    def stream(self, request: LlmRequest) -> Iterator[str]:
+        """逐段產生回覆文字。"""
+        raise NotImplementedError
+
+    async def astream(self, request: LlmRequest) -> AsyncIterator[str]:
+        """非同步逐段產生回覆文字（asyncio 執行模式）。
+
+        預設在執行緒中逐段讀取 `stream`；provider 應以非同步 HTTP 用戶端覆寫，不佔用執行緒。
+        """
+        chunks = iter(self.stream(request))
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            yield chunk
+
+    def complete(self, request: LlmRequest) -> str:
+        return "".join(self.stream(request))
+
+
+class LlmError(Exception):
+    retryable = False
+    max_retries = 0
+
+    def retry_countdown(self, retries: int) -> float:
+        """第 `retries` 次重試（0 起算）前的等待秒數。"""
+        return 0
+
+
+class LlmConfigurationError(LlmError):
+    """未設定的 provider 或缺少 API key。"""
+
+
+class LlmAuthenticationError(LlmError):
+    """401 / 403：API key 無效，不重試。"""
+
+
+class LlmResponseError(LlmError):
+    """回應格式異常或其他 4xx，不重試。"""
+
+
+class LlmTimeoutError(LlmError):
+    """連線或讀取逾時、連線中斷。"""
+
+    retryable = True
+    max_retries = 3
+
+    def retry_countdown(self, retries: int) -> float:
+        return 5
+
+
+class LlmRateLimitError(LlmError):
+    """429：依 Retry-After 或指數退避重試。"""
+
+    retryable = True
+    max_retries = 5
+
+    def __init__(self, message: str = "", retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def retry_countdown(self, retries: int) -> float:
+        if self.retry_after is not None:
+            return min(self.retry_after, 300)
+        return min(2 * 2**retries, 300)
+
+
+class LlmServerError(LlmError):
+    """5xx（503 除外）。"""
+
+    retryable = True
+    max_retries = 3
+
+    def retry_countdown(self, retries: int) -> float:
+        return 10
+
+
+class LlmUnavailableError(LlmError):
+    """503 / provider 過載。"""
+
+    retryable = True
+    max_retries = 2
+
+    def retry_countdown(self, retries: int) -> float:
+        return 60
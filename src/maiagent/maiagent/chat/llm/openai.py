@@ -0,0 +1,37 @@
+"""OpenAI Chat Completions（串流）。"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from .base import LlmRequest, LlmResponseError
+from .transport import HttpLlmClient
+
+# LlmModel.params / Scenario.config_json["llm"] 中可傳給 API 的參數
+_PARAMS = ("temperature", "max_tokens", "top_p")
+
+
+class OpenAIClient(HttpLlmClient):
+    path = "/chat/completions"
+
+    def __init__(self, *, base_url: str = "https://api.openai.com/v1", **options: Any) -> None:
+        super().__init__(base_url=base_url, **options)
+
+    def headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def payload(self, request: LlmRequest) -> dict[str, Any]:
+        messages = [{"role": "system", "content": request.system}] if request.system else []
+        return {
+            "model": request.model,
+            "messages": messages + request.messages,
+            "stream": True,
+            **{key: request.params[key] for key in _PARAMS if key in request.params},
+        }
+
+    def event_text(self, event: dict[str, Any]) -> str | None:
+        try:
+            choices = event["choices"]
+        except (KeyError, TypeError) as exc:
+            raise LlmResponseError("LLM 回應格式異常") from exc
+        return "".join((choice.get("delta") or {}).get("content") or "" for choice in choices)
@@ -0,0 +1,31 @@
+"""依 `LlmModel.provider` 取得 LLM 用戶端。
+
+`CHAT_LLM_PROVIDERS` 設定每個 provider 的類別與參數：
+
+    CHAT_LLM_PROVIDERS = {
+        "openai": {"CLASS": "maiagent.chat.llm.openai.OpenAIClient", "OPTIONS": {"api_key": "..."}},
+    }
+
+每個行程每個 provider 只建立一個實例，連線池在任務之間共用。
+"""
+
+from __future__ import annotations
+
+from functools import cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import LlmClient, LlmConfigurationError
+
+
+@cache
+def _load_client(provider: str) -> LlmClient:
+    config = settings.CHAT_LLM_PROVIDERS.get(provider)
+    if config is None:
+        raise LlmConfigurationError(f"未設定的 LLM provider: {provider}")
+    return import_string(config["CLASS"])(**config.get("OPTIONS", {}))
+
+
+def get_llm_client(provider: str) -> LlmClient:
+    return _load_client(provider)
@@ -0,0 +1,139 @@
+"""離線 provider（`LlmModel.provider = "stub"` 與 `"fake"`）。
+
+不連網，依 profile 模擬 provider 的延遲、吞吐量與錯誤，量測完整的送出 → `process_message` → 輪詢路徑；
+本機開發與場景未綁定模型時使用的 `fake` provider 為 echo profile 的預設設定：
+
+- `first_token_latency`：首字延遲的中位數（秒）；`first_token_sigma` > 0 時以對數常態分布產生長尾
+- `tokens_per_second`：首字之後的輸出速度，每個 token 為一個串流片段
+- `reply`：`tokens` 產生 `reply_tokens` 個 token；`echo` 回覆「[模型] 收到：問題」，依空白分段
+- `reply_tokens`：回覆長度（token 數），不超過生成參數的 `max_tokens`
+- `error_rate`：於首字延遲之後回應 500 的比例（`LlmServerError`）
+- `rate_limit_rate`：立即回應 429 的比例（`LlmRateLimitError`，`retry_after` 秒）
+- `seed`：相同的 seed 與請求產生相同的延遲、錯誤與回覆，結果可重現
+
+首字延遲超過 CHAT_LLM_TIMEOUT 時，等待 CHAT_LLM_TIMEOUT 秒後以 `LlmTimeoutError` 失敗，與真實 provider 一致。
+
+設定優先順序（後者覆寫前者）：`CHAT_LLM_PROVIDERS["stub"]["OPTIONS"]` 的預設值、
+`profiles` 中以 `profile` 指定的具名 profile、`LlmModel.params["stub"]`（可含 `profile`）。例如：
+
+    LlmModel(provider="stub", name="slow-gpt", params={"stub": {"profile": "slow", "error_rate": 0.05}})
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Any, AsyncIterator, Iterator
+
+from django.conf import settings
+
+from .base import LlmClient, LlmRateLimitError, LlmRequest, LlmServerError, LlmTimeoutError, sleep
+
+
+@dataclass(frozen=True)
+class StubProfile:
+    first_token_latency: float = 0.5
+    first_token_sigma: float = 0
+    tokens_per_second: float = 50
+    reply: str = "tokens"
+    reply_tokens: int = 100
+    error_rate: float = 0
+    rate_limit_rate: float = 0
+    retry_after: float | None = None
+    seed: int = 0
+
+    def updated(self, options: dict[str, Any]) -> StubProfile:
+        names = {f.name for f in fields(self)}
+        return replace(self, **{key: value for key, value in options.items() if key in names})
+
+
+@dataclass(frozen=True)
+class StubPlan:
+    """一次請求的模擬結果：首字延遲、錯誤（若有）與回覆的 token。"""
+
+    first_token_latency: float
+    token_interval: float
+    error: Exception | None
+    error_delay: float
+    tokens: list[str]
+
+
+class StubLlmClient(LlmClient):
+    def __init__(self, *, profiles: dict[str, dict[str, Any]] | None = None, **options: Any) -> None:
+        self.profiles = profiles or {}
+        self.default = StubProfile().updated(options)
+
+    def profile(self, request: LlmRequest) -> StubProfile:
+        overrides = request.params.get("stub") or {}
+        profile = self.default
+        name = overrides.get("profile")
+        if name:
+            profile = profile.updated(self.profiles.get(name, {}))
+        return profile.updated(overrides)
+
+    def plan(self, request: LlmRequest) -> StubPlan:
+        profile = self.profile(request)
+        # 以請求內容為種子：與並行順序無關，重跑得到相同的結果
+        material = json.dumps([profile.seed, request.model, request.system, request.messages], ensure_ascii=False)
+        rng = random.Random(hashlib.sha256(material.encode()).digest())
+        latency = profile.first_token_latency
+        if profile.first_token_sigma:
+            latency *= rng.lognormvariate(0, profile.first_token_sigma)
+
+        error: Exception | None = None
+        error_delay = latency
+        draw = rng.random()
+        if draw < profile.rate_limit_rate:
+            error, error_delay = LlmRateLimitError("429 (stub)", retry_after=profile.retry_after), 0
+        elif draw < profile.rate_limit_rate + profile.error_rate:
+            error = LlmServerError("500 (stub)")
+        elif latency > settings.CHAT_LLM_TIMEOUT:
+            error, error_delay = LlmTimeoutError("read timeout (stub)"), settings.CHAT_LLM_TIMEOUT
+
+        question = next((m["content"] for m in reversed(request.messages) if m["role"] == "user"), "")
+        if profile.reply == "echo":
+            tokens = re.findall(r"\S+\s*|\s+", f"[{request.model}] 收到：{question}")
+        else:
+            count = int(profile.reply_tokens)
+            if request.params.get("max_tokens"):
+                count = min(count, int(request.params["max_tokens"]))
+            tokens = [f"[{request.model}] ", f"{question[:20]} "] + [f"t{i} " for i in range(max(count - 2, 0))]
+            tokens = tokens[:count]
+        return StubPlan(
+            first_token_latency=latency,
+            token_interval=1 / profile.tokens_per_second if profile.tokens_per_second > 0 else 0,
+            error=error,
+            error_delay=error_delay,
+            tokens=tokens,
+        )
+
+    def stream(self, request: LlmRequest) -> Iterator[str]:
+        plan = self.plan(request)
+        if plan.error is not None:
+            if not sleep(plan.error_delay):
+                return
+            raise plan.error
+        # 依開始時間排定每個 token 的時間，sleep 的誤差不會累積
+        started = time.monotonic() + plan.first_token_latency
+        for index, token in enumerate(plan.tokens):
+            delay = started + index * plan.token_interval - time.monotonic()
+            if delay > 0 and not sleep(delay):
+                return
+            yield token
+
+    async def astream(self, request: LlmRequest) -> AsyncIterator[str]:
+        plan = self.plan(request)
+        if plan.error is not None:
+            await asyncio.sleep(plan.error_delay)
+            raise plan.error
+        started = time.monotonic() + plan.first_token_latency
+        for index, token in enumerate(plan.tokens):
+            delay = started + index * plan.token_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield token
@@ -0,0 +1,253 @@
+"""以 requests.Session 連線池呼叫 HTTP 型 LLM API。
+
+每個用戶端實例持有一個 `requests.Session`，連線以 keep-alive 重複使用，
+同一 worker 行程的後續任務不需重新進行 TCP / TLS 握手。連線池大小固定
+（`pool_block=True`），超過上限的請求等待可用連線而不是另開新連線。
+
+Session 在第一次使用時建立，並記錄建立時的行程 ID：Celery prefork 在 fork
+之後若沿用父行程的 socket 會互相干擾，行程 ID 不同時重新建立。
+
+asyncio 執行模式（`manage.py run_async_worker`）改用 `httpx.AsyncClient`，每個事件迴圈一個連線池，
+上限為 `CHAT_ASYNC_WORKER_CONCURRENCY`：每個進行中的串流各佔一個連線。
+
+子類別提供 `path`、`payload()` 與 `event_text()`，同步與非同步串流共用相同的請求與解析。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import socket
+from typing import Any, AsyncIterator, Iterator
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .base import (
+    LlmAuthenticationError,
+    LlmClient,
+    LlmConfigurationError,
+    LlmRateLimitError,
+    LlmRequest,
+    LlmResponseError,
+    LlmServerError,
+    LlmTimeoutError,
+    LlmUnavailableError,
+    current_abort,
+)
+
+logger = logging.getLogger(__name__)
+
+# 錯誤回應記錄到日誌的最大長度
+_ERROR_BODY_LIMIT = 2000
+
+
+class HttpLlmClient(LlmClient):
+    # API 路徑（相對於 base_url）
+    path = ""
+
+    def __init__(
+        self,
+        *,
+        base_url: str,
+        api_key: str = "",
+        timeout: float | None = None,
+        connect_timeout: float | None = None,
+        pool_maxsize: int | None = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.CHAT_LLM_CONNECT_TIMEOUT,
+            timeout if timeout is not None else settings.CHAT_LLM_TIMEOUT,
+        )
+        self.pool_maxsize = pool_maxsize or settings.CHAT_LLM_POOL_MAXSIZE
+        self._session: requests.Session | None = None
+        self._pid: int | None = None
+        self._async_clients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+    def headers(self) -> dict[str, str]:
+        return {}
+
+    def payload(self, request: LlmRequest) -> dict[str, Any]:
+        raise NotImplementedError
+
+    def event_text(self, event: dict[str, Any]) -> str | None:
+        """單一串流事件中的回覆文字；事件表示錯誤時拋出 LlmError。"""
+        raise NotImplementedError
+
+    def stream(self, request: LlmRequest) -> Iterator[str]:
+        for event in self.post_events(self.path, self.payload(request)):
+            text = self.event_text(event)
+            if text:
+                yield text
+
+    async def astream(self, request: LlmRequest) -> AsyncIterator[str]:
+        async for event in self.apost_events(self.path, self.payload(request)):
+            text = self.event_text(event)
+            if text:
+                yield text
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None or self._pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, pool_block=True, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(self.headers())
+            self._session, self._pid = session, os.getpid()
+        return self._session
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        # 連線屬於建立時的事件迴圈，每個迴圈使用獨立的連線池
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            for stale in [other for other in self._async_clients if other.is_closed()]:
+                del self._async_clients[stale]
+            connect_timeout, read_timeout = self.timeout
+            client = self._async_clients[loop] = httpx.AsyncClient(
+                headers=self.headers(),
+                # pool=None：超過上限的請求等待可用連線
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=None),
+                limits=httpx.Limits(
+                    max_connections=settings.CHAT_ASYNC_WORKER_CONCURRENCY,
+                    max_keepalive_connections=settings.CHAT_ASYNC_WORKER_CONCURRENCY,
+                ),
+            )
+        return client
+
+    def _url(self, path: str) -> str:
+        if not self.api_key:
+            raise LlmConfigurationError(f"{type(self).__name__} 未設定 API key")
+        return f"{self.base_url}{path}"
+
+    def post_events(self, path: str, payload: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        """POST 串流請求，逐一產生 Server-Sent Events 的 data（已解析 JSON）。"""
+        url = self._url(path)
+        # 5xx 先以同一個連線池立即重試一次，仍失敗才交給 Celery 延遲重試
+        for attempt in range(2):
+            try:
+                response = self.session.post(url, json=payload, stream=True, timeout=self.timeout)
+            except requests.Timeout as exc:
+                raise LlmTimeoutError(str(exc)) from exc
+            except requests.ConnectionError as exc:
+                raise LlmTimeoutError(str(exc)) from exc
+            if attempt == 0 and response.status_code >= 500 and response.status_code != 503:
+                logger.warning("LLM API %s returned %s, retrying once", url, response.status_code)
+                response.close()
+                continue
+            break
+
+        abort = current_abort()
+        if abort is not None:
+            abort.on_abort(lambda: _close_response(response))
+        with response:
+            if response.status_code >= 400:
+                raise _status_error(response)
+            # SSE 固定為 UTF-8；text/event-stream 未帶 charset 時 requests 會以 ISO-8859-1 解碼
+            response.encoding = "utf-8"
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    data = _event_data(line)
+                    if data == _DONE:
+                        return
+                    if data is not None:
+                        yield _parse_event(url, data)
+            except requests.RequestException as exc:
+                if abort is not None and abort.aborted:
+                    return
+                raise LlmTimeoutError(str(exc)) from exc
+            except (OSError, ValueError):
+                # 中止時連線由其他執行緒關閉，讀取可能以其他例外結束
+                if abort is not None and abort.aborted:
+                    return
+                raise
+
+    async def apost_events(self, path: str, payload: dict[str, Any]) -> AsyncIterator[dict[str, Any]]:
+        """`post_events` 的非同步版本（httpx），錯誤分類與 5xx 立即重試相同。"""
+        url = self._url(path)
+        client = self.async_client
+        for attempt in range(2):
+            try:
+                response = await client.send(client.build_request("POST", url, json=payload), stream=True)
+            except httpx.TransportError as exc:
+                raise LlmTimeoutError(str(exc)) from exc
+            if attempt == 0 and response.status_code >= 500 and response.status_code != 503:
+                logger.warning("LLM API %s returned %s, retrying once", url, response.status_code)
+                await response.aclose()
+                continue
+            break
+
+        try:
+            if response.status_code >= 400:
+                await response.aread()
+                raise _status_error(response)
+            async for line in response.aiter_lines():
+                data = _event_data(line)
+                if data == _DONE:
+                    return
+                if data is not None:
+                    yield _parse_event(url, data)
+        except httpx.TransportError as exc:
+            raise LlmTimeoutError(str(exc)) from exc
+        finally:
+            await response.aclose()
+
+
+_DONE = "[DONE]"
+
+
+def _close_response(response: requests.Response) -> None:
+    """從其他執行緒關閉串流中的回應：先 shutdown socket，僅 close 不會喚醒阻塞中的讀取。"""
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+def _event_data(line: str) -> str | None:
+    """SSE 的 data 欄位；其他行（空行、event:、註解）回傳 None。"""
+    if not line or not line.startswith("data:"):
+        return None
+    return line[5:].strip()
+
+
+def _parse_event(url: str, data: str) -> dict[str, Any]:
+    try:
+        return json.loads(data)
+    except ValueError as exc:
+        logger.error("Unparseable LLM stream event from %s: %s", url, data[:_ERROR_BODY_LIMIT])
+        raise LlmResponseError("LLM 回應格式異常") from exc
+
+
+def _status_error(response: requests.Response | httpx.Response) -> Exception:
+    body = response.text[:_ERROR_BODY_LIMIT]
+    status_code = response.status_code
+    logger.error("LLM API %s returned %s: %s", response.url, status_code, body)
+    message = f"LLM API 回傳 {status_code}"
+    if status_code in (401, 403):
+        return LlmAuthenticationError(message)
+    if status_code == 429:
+        return LlmRateLimitError(message, retry_after=_retry_after(response))
+    if status_code == 503:
+        return LlmUnavailableError(message)
+    if status_code >= 500:
+        return LlmServerError(message)
+    return LlmResponseError(message)
+
+
+def _retry_after(response: requests.Response | httpx.Response) -> float | None:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,67 @@
+"""
+Compute Message.token_count for messages stored before token counts were recorded.
+Batches run in parallel threads; each batch is one SELECT and one bulk UPDATE.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from maiagent.chat.models import LlmModel, Message, ScenarioModel
+from maiagent.chat.tokenizers import get_tokenizer
+
+
+class Command(BaseCommand):
+    help = '回填尚未計算的 Message.token_count（依場景預設模型的 tokenizer）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=4, help='同時處理的批次數')
+
+    def handle(self, *args, **options):
+        self.default_name = LlmModel(**settings.CHAT_LLM_DEFAULT_MODEL).tokenizer
+        # 每個場景取預設模型（與 process_message 選擇模型的順序相同）
+        self.tokenizer_names = {}
+        bindings = ScenarioModel.objects.order_by('scenario_id', '-is_default')
+        for scenario_id, name in bindings.values_list('scenario_id', 'llm_model__tokenizer'):
+            self.tokenizer_names.setdefault(scenario_id, name)
+
+        batches = self._batches(options['batch_size'])
+        if options['workers'] <= 1:
+            updated = sum(self._fill(ids) for ids in batches)
+        else:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                updated = sum(executor.map(self._fill_in_thread, batches))
+        self.stdout.write(self.style.SUCCESS(f'✓ 已回填 {updated} 則訊息的 token 數'))
+
+    def _batches(self, batch_size):
+        # 以主鍵 keyset 分批，只讀取 id
+        pending = Message.objects.filter(token_count__isnull=True).order_by('id')
+        last_id = None
+        while True:
+            batch = pending if last_id is None else pending.filter(id__gt=last_id)
+            ids = list(batch.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+
+    def _fill(self, ids):
+        rows = Message.objects.filter(pk__in=ids).values_list('id', 'content', 'session__scenario_id')
+        messages = [
+            Message(
+                id=message_id,
+                token_count=get_tokenizer(self.tokenizer_names.get(scenario_id, self.default_name)).count(content),
+            )
+            for message_id, content, scenario_id in rows
+        ]
+        return Message.objects.bulk_update(messages, ['token_count'])
+
+    def _fill_in_thread(self, ids):
+        try:
+            return self._fill(ids)
+        finally:
+            # 每個執行緒各自的資料庫連線
+            connection.close()
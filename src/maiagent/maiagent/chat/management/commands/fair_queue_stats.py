@@ -0,0 +1,30 @@
+"""
+Print the reply-task backlog per fair-queue flow (group and role): pending tasks,
+weight and how long the oldest task has been waiting in the outbox.
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from maiagent.chat.fair_queue import backlog_by_flow
+from maiagent.chat.models import Group
+
+
+class Command(BaseCommand):
+    help = '顯示各群組 / 角色待發送的回覆任務數與最久等待時間'
+
+    def handle(self, *args, **options):
+        backlog = backlog_by_flow()
+        if not backlog:
+            self.stdout.write('沒有待發送的回覆任務')
+            return
+        group_ids = {row['flow'].partition(':')[0] for row in backlog} - {'-'}
+        names = {str(pk): name for pk, name in Group.objects.filter(pk__in=group_ids).values_list('pk', 'name')}
+        now = timezone.now()
+        for row in backlog:
+            group_id, _, role = row['flow'].partition(':')
+            group = names.get(group_id, '（無群組）')
+            waited = (now - row['oldest']).total_seconds()
+            self.stdout.write(
+                f'{group} / {role or "-"}（權重 {row["weight"]}）：待發送 {row["pending"]}，最久等待 {waited:.1f} 秒'
+            )
@@ -0,0 +1,47 @@
+"""
+Print hedged-request decisions per scenario: how often the backup model was called,
+how often it won, and the primary model's time to first token.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from maiagent.chat.models import HedgeDecision, Scenario
+
+
+class Command(BaseCommand):
+    help = '顯示各場景 hedged requests 的決策統計（備援比例、勝出者與主要模型的首字延遲）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='統計最近幾天的決策')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        decisions = HedgeDecision.objects.filter(created_at__gte=since)
+        scenarios = Scenario.objects.filter(hedge_decisions__created_at__gte=since).distinct().order_by('name')
+        for scenario in scenarios:
+            rows = decisions.filter(scenario=scenario)
+            summary = rows.aggregate(
+                total=Count('id'),
+                hedged=Count('id', filter=Q(hedged=True)),
+                backup_wins=Count('id', filter=Q(winner=HedgeDecision.Role.BACKUP)),
+                rate_limited=Count('id', filter=Q(skip_reason=HedgeDecision.SkipReason.RATE_LIMITED)),
+                failed=Count('id', filter=Q(winner='')),
+            )
+            latencies = np.array(
+                rows.exclude(primary_first_token_ms=None).values_list('primary_first_token_ms', flat=True)
+            )
+            if len(latencies):
+                p50, p99 = np.percentile(latencies, [50, 99])
+                latency = f'主要模型首字 p50 {p50:.0f}ms / p99 {p99:.0f}ms'
+            else:
+                latency = '主要模型首字 -'
+            self.stdout.write(
+                f'{scenario.name}：{summary["total"]} 次，送出備援 {summary["hedged"]}，'
+                f'備援勝出 {summary["backup_wins"]}，備援額度不足 {summary["rate_limited"]}，'
+                f'皆失敗 {summary["failed"]}，{latency}'
+            )
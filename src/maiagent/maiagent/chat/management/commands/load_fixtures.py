@@ -100,6 +100,9 @@ class Command(BaseCommand):
                         self.style.SUCCESS('✓ 所有 fixtures 載入完成！')
                     )
                     
+                    # fixtures 的訊息帶有指定序號，同步會話的下一個序號
+                    call_command('sync_message_sequences', verbosity=0)
+                    
                     # 自動設置電子郵件驗證
                     self._setup_email_verification()
                     
@@ -0,0 +1,54 @@
+"""
+Create (or update) a scenario bound to the offline stub LLM provider, a group with
+access to it and an employee user, then print the IDs and a JWT access token for
+benchmarks/chat_load.py.
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import RefreshToken
+from rolepermissions.roles import assign_role
+
+from maiagent.chat.models import Group, GroupScenarioAccess, LlmModel, Scenario, ScenarioModel
+from maiagent.users.models import User
+
+
+class Command(BaseCommand):
+    help = '建立負載測試用的 stub 模型、場景、群組與使用者，並輸出場景 ID 與 JWT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', default='', help='CHAT_LLM_PROVIDERS["stub"] 的具名 profile，空白為預設值')
+        parser.add_argument('--stub', action='append', default=[], metavar='KEY=VALUE',
+                            help='覆寫 profile 的欄位，例如 --stub error_rate=0.05，可重複指定')
+        parser.add_argument('--username', default='loadtest')
+
+    def handle(self, *args, **options):
+        stub = {'profile': options['profile']} if options['profile'] else {}
+        for item in options['stub']:
+            key, _, value = item.partition('=')
+            stub[key] = json.loads(value)
+        llm_model, _ = LlmModel.objects.update_or_create(
+            provider='stub', name='load-test', defaults={'params': {'stub': stub}},
+        )
+        scenario, _ = Scenario.objects.update_or_create(
+            name='負載測試',
+            defaults={'config_json': {
+                'prompt': '你是負載測試用的助手',
+                'llm': {},
+                'memory': {'max_turns': 5},
+                # 每則訊息都經過 LLM，量測的是完整路徑而非快取
+                'response_cache': {'enabled': False},
+            }},
+        )
+        ScenarioModel.objects.update_or_create(scenario=scenario, llm_model=llm_model, defaults={'is_default': True})
+        group, _ = Group.objects.get_or_create(name='負載測試')
+        GroupScenarioAccess.objects.get_or_create(group=group, scenario=scenario)
+        user, _ = User.objects.update_or_create(
+            username=options['username'], defaults={'group': group, 'role': User.Role.EMPLOYEE},
+        )
+        assign_role(user, 'employee')
+
+        self.stdout.write(f'stub profile: {stub or "（預設）"}')
+        self.stdout.write(f'--scenario {scenario.id}')
+        self.stdout.write(f'--token {RefreshToken.for_user(user).access_token}')
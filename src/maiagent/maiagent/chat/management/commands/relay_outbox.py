@@ -0,0 +1,51 @@
+"""
+Relay pending outbox rows to the Celery broker.
+Runs as its own process next to the Celery workers; several relays can run at once.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from maiagent.chat.outbox import relay_batch
+
+
+class Command(BaseCommand):
+    help = '將 outbox 中待發送的任務發送到 Celery broker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='發送一輪後結束')
+        parser.add_argument('--batch-size', type=int, default=settings.CHAT_OUTBOX_BATCH_SIZE)
+        parser.add_argument(
+            '--interval', type=float, default=settings.CHAT_OUTBOX_POLL_INTERVAL, help='無待發送資料時的輪詢間隔（秒）'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['once']:
+            self.stdout.write(self.style.SUCCESS(f'✓ 已發送 {self._drain(batch_size)} 個任務'))
+            return
+
+        self.stdout.write(f'Outbox relay 啟動（batch={batch_size}, interval={options["interval"]}s）')
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    sent = relay_batch(batch_size)
+                except Exception as exc:  # noqa: BLE001
+                    # 資料庫暫時無法連線時稍後重試，不中止程序
+                    self.stderr.write(f'Outbox relay 錯誤: {exc}')
+                    sent = 0
+                # 整批發送完畢代表可能還有積壓，立即取下一批
+                if sent < batch_size:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def _drain(self, batch_size):
+        total = 0
+        while (sent := relay_batch(batch_size)) == batch_size:
+            total += sent
+        return total + sent
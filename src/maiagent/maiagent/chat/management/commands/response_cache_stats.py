@@ -0,0 +1,24 @@
+"""
+Print LLM response cache hit/miss counters per scenario, plus LLM calls saved by the
+semantic cache and by single-flight coalescing.
+"""
+
+from django.core.management.base import BaseCommand
+
+from maiagent.chat.models import Scenario
+from maiagent.chat.response_cache import is_enabled, response_cache_stats
+
+
+class Command(BaseCommand):
+    help = '顯示各場景 LLM 回覆快取的命中 / 未命中次數與省下的 LLM 呼叫'
+
+    def handle(self, *args, **options):
+        for scenario in Scenario.objects.order_by('name'):
+            stats = response_cache_stats(scenario.pk)
+            total = stats['hits'] + stats['misses']
+            hit_rate = f'{stats["hits"] / total:.1%}' if total else '-'
+            enabled = '啟用' if is_enabled(scenario.config_json) else '停用'
+            self.stdout.write(
+                f'{scenario.name}（{enabled}）：命中 {stats["hits"]}，未命中 {stats["misses"]}，命中率 {hit_rate}，'
+                f'語意快取命中 {stats["semantic_hits"]}，合併請求 {stats["coalesced"]}'
+            )
@@ -0,0 +1,31 @@
+"""
+Run process_message on an asyncio event loop instead of the prefork Celery worker.
+One process consumes ai_queue and streams many LLM replies concurrently; see maiagent/chat/async_worker.py.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from maiagent.chat.async_worker import AsyncWorker
+
+
+class Command(BaseCommand):
+    help = '以 asyncio 事件迴圈消費 ai_queue，單一行程同時產生多個 LLM 回覆'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', default='ai_queue')
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.CHAT_ASYNC_WORKER_CONCURRENCY, help='同時處理的任務數上限'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=settings.CHAT_ASYNC_WORKER_THREADS, help='資料庫與 Redis 操作的執行緒數（0 表示與並行上限相同）'
+        )
+
+    def handle(self, *args, **options):
+        worker = AsyncWorker(
+            queue_name=options['queue'], concurrency=options['concurrency'], threads=options['threads']
+        )
+        self.stdout.write(
+            f'Async worker 啟動（queue={options["queue"]}, concurrency={worker.concurrency}, threads={worker.threads}）'
+        )
+        worker.run()
@@ -0,0 +1,24 @@
+"""
+Recompute Session.next_sequence from existing messages.
+Run after adding the column or after loading messages with explicit sequence numbers.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from maiagent.chat.models import Message, Session
+
+
+class Command(BaseCommand):
+    help = '依現有訊息重新計算 Session.next_sequence'
+
+    def handle(self, *args, **options):
+        max_sequence = (
+            Message.objects.filter(session_id=OuterRef('pk'))
+            .values('session_id')
+            .annotate(max_seq=Max('sequence_number'))
+            .values('max_seq')
+        )
+        updated = Session.objects.update(next_sequence=Coalesce(Subquery(max_sequence), 0) + 1)
+        self.stdout.write(self.style.SUCCESS(f'✓ 已更新 {updated} 個會話的訊息序號'))
@@ -0,0 +1,140 @@
+"""對話記憶：依場景 `config_json["memory"]` 組出送給 LLM 的最近對話。
+
+    {"type": "conversation", "max_turns": 10}   # 最近 10 輪（20 則訊息）
+    {"type": "conversation", "max_tokens": 3000} # 另外限制總 token 數，保留放得下的最近訊息
+    {"type": "none"}                              # 只帶本輪使用者訊息
+
+組好的對話視窗快取於 Django cache（正式環境為 Redis），鍵為 `chat:memory:{session_id}`：
+
+    {"limit": 20, "last_sequence": 41, "messages": [{"role", "content", "sequence_number", "token_count"}, ...]}
+
+- 未命中：以 `(session, sequence_number)` 索引倒序取最近 `limit` 則（keyset），不讀取整段歷史
+- 命中：只查詢序號大於 `last_sequence` 的新訊息，接在視窗後並截去最舊的部分
+- 助手回覆提交後以 `remember_message` 直接接上，下一輪通常只需讀取新的使用者訊息
+
+每輪的資料庫讀取與字串處理只與 `max_turns` 有關，與對話總長度無關。`max_tokens` 以訊息寫入時存下的
+`token_count` 由新到舊加總，不重新斷詞（尚未回填的舊訊息才以 tokenizer 計算）。
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Message
+from .tokenizers import Tokenizer
+
+# 場景未設定 memory.max_turns 時帶入的對話輪數
+DEFAULT_MAX_TURNS = 10
+
+
+def memory_key(session_id: Any) -> str:
+    return f"chat:memory:{session_id}"
+
+
+def memory_limit(memory_config: dict[str, Any] | None) -> int:
+    """視窗的訊息數上限（每輪含使用者與助手各一則）。"""
+    memory_config = memory_config or {}
+    if memory_config.get("type") == "none":
+        return 1
+    return max(1, int(memory_config.get("max_turns", DEFAULT_MAX_TURNS))) * 2
+
+
+_FIELDS = ("role", "content", "sequence_number", "token_count")
+
+
+def _row(message: dict[str, Any]) -> dict[str, Any]:
+    return {field: message[field] for field in _FIELDS}
+
+
+def _load_window(session_id: Any, upto: int | None, limit: int) -> list[dict[str, Any]]:
+    rows = Message.objects.filter(session_id=session_id).order_by("-sequence_number")
+    if upto is not None:
+        rows = rows.filter(sequence_number__lte=upto)
+    return [_row(m) for m in reversed(rows.values(*_FIELDS)[:limit])]
+
+
+def _load_after(session_id: Any, after: int, upto: int | None) -> list[dict[str, Any]]:
+    rows = Message.objects.filter(session_id=session_id, sequence_number__gt=after).order_by("sequence_number")
+    if upto is not None:
+        rows = rows.filter(sequence_number__lte=upto)
+    return [_row(m) for m in rows.values(*_FIELDS)]
+
+
+def _store(session_id: Any, limit: int, messages: list[dict[str, Any]]) -> None:
+    if not messages:
+        return
+    cache.set(
+        memory_key(session_id),
+        {"limit": limit, "last_sequence": messages[-1]["sequence_number"], "messages": messages},
+        settings.CHAT_MEMORY_CACHE_TTL,
+    )
+
+
+def fit_token_budget(
+    messages: list[dict[str, Any]], max_tokens: int, tokenizer: Tokenizer | None = None
+) -> list[dict[str, Any]]:
+    """由新到舊加總 token 數，保留總數不超過 `max_tokens` 的最近訊息（至少保留最新一則）。"""
+    total = 0
+    start = len(messages)
+    for index in range(len(messages) - 1, -1, -1):
+        tokens = messages[index].get("token_count")
+        if tokens is None:
+            tokens = tokenizer.count(messages[index]["content"]) if tokenizer is not None else 0
+        total += tokens
+        if total > max_tokens and start < len(messages):
+            break
+        start = index
+    return messages[start:]
+
+
+def conversation_memory(
+    session_id: Any,
+    memory_config: dict[str, Any] | None,
+    upto: int | None = None,
+    tokenizer: Tokenizer | None = None,
+) -> list[dict[str, str]]:
+    """回傳序號不超過 `upto` 的最近對話（時間順序），格式為 LlmRequest.messages。"""
+    limit = memory_limit(memory_config)
+    cached = cache.get(memory_key(session_id))
+    usable = (
+        cached is not None
+        and cached["limit"] == limit
+        and (upto is None or cached["last_sequence"] <= upto)
+    )
+    if usable:
+        new_messages = _load_after(session_id, cached["last_sequence"], upto)
+        messages = (cached["messages"] + new_messages)[-limit:]
+        if new_messages:
+            _store(session_id, limit, messages)
+    else:
+        messages = _load_window(session_id, upto, limit)
+        # 重新產生較早一輪的回覆（重試）時不以舊視窗覆寫較新的快取
+        if cached is None or cached["limit"] != limit:
+            _store(session_id, limit, messages)
+    max_tokens = (memory_config or {}).get("max_tokens")
+    if max_tokens:
+        messages = fit_token_budget(messages, int(max_tokens), tokenizer)
+    return [{"role": m["role"], "content": m["content"]} for m in messages]
+
+
+def remember_message(session_id: Any, message: Message) -> None:
+    """訊息寫入後延伸快取的視窗（提交後執行），下一輪不需重新讀取。"""
+
+    def extend() -> None:
+        cached = cache.get(memory_key(session_id))
+        # 只接續連續的視窗；快取缺少中間的訊息時留待下一輪以 keyset 查詢補上
+        if cached is None or cached["last_sequence"] != message.sequence_number - 1:
+            return
+        row = {field: getattr(message, field) for field in _FIELDS}
+        messages = (cached["messages"] + [row])[-cached["limit"]:]
+        _store(session_id, cached["limit"], messages)
+
+    transaction.on_commit(extend)
+
+
+def forget_memory(session_id: Any) -> None:
+    cache.delete(memory_key(session_id))
@@ -1,10 +1,12 @@
 import uuid
-from typing import Any, Dict
+from typing import Any, Dict, Iterable
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models, transaction
-from django.db.models import Max
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 
 def validate_scenario_config_json(config: Dict[str, Any]) -> None:
@@ -16,6 +18,17 @@ def validate_scenario_config_json(config: Dict[str, Any]) -> None:
         raise ValidationError(f"config_json 缺少必要鍵: {', '.join(sorted(missing))}")
 
 
+def bump_scenario_versions(scenario_ids: Iterable[Any]) -> None:
+    """場景綁定的模型變更：遞增場景版本，各行程的場景快取（maiagent/chat/scenario_cache.py）丟棄舊版本。"""
+    from .scenario_cache import scenarios_changed  # scenario_cache 匯入本模組
+
+    ids = list(scenario_ids)
+    if not ids:
+        return
+    Scenario.objects.filter(pk__in=ids).update(version=F("version") + 1)
+    scenarios_changed(dict(Scenario.objects.filter(pk__in=ids).values_list("pk", "version")))
+
+
 class Group(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255, unique=True)
@@ -37,6 +50,11 @@ class LlmModel(models.Model):
     provider = models.CharField(max_length=64)
     name = models.CharField(max_length=128)
     params = models.JSONField(default=dict, blank=True)
+    # CHAT_TOKENIZERS 的名稱，空白時使用 CHAT_DEFAULT_TOKENIZER
+    tokenizer = models.CharField(max_length=64, blank=True, default="")
+    # provider 的速率上限（maiagent/chat/rate_limit.py），NULL 表示不限制
+    requests_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    tokens_per_minute = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -47,11 +65,19 @@ class LlmModel(models.Model):
     def __str__(self) -> str:  # pragma: no cover
         return f"{self.provider}:{self.name}"
 
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            bump_scenario_versions(self.scenario_bindings.values_list("scenario_id", flat=True))
+
 
 class Scenario(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255, unique=True)
     config_json = models.JSONField(validators=[validate_scenario_config_json])
+    # 每次儲存遞增，各行程的場景快取據此丟棄舊版本
+    version = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -60,6 +86,20 @@ class Scenario(models.Model):
     def __str__(self) -> str:  # pragma: no cover
         return self.name
 
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        from .scenario_cache import scenarios_changed  # scenario_cache 匯入本模組
+
+        # 以資料庫的值遞增，從舊的實例儲存也不會讓版本倒退
+        self.version = F("version") + 1
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=["version"])
+        scenarios_changed({self.pk: self.version})
+
 
 class ScenarioModel(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -72,6 +112,15 @@ class ScenarioModel(models.Model):
         unique_together = ("scenario", "llm_model")
         indexes = [models.Index(fields=["scenario", "is_default"])]
 
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        super().save(*args, **kwargs)
+        bump_scenario_versions([self.scenario_id])
+
+    def delete(self, *args: Any, **kwargs: Any) -> Any:
+        result = super().delete(*args, **kwargs)
+        bump_scenario_versions([self.scenario_id])
+        return result
+
 
 class Session(models.Model):
     class Status(models.TextChoices):
@@ -79,6 +128,8 @@ class Session(models.Model):
         WAITING = "Waiting", "Waiting"
         REPLYED = "Replyed", "Replyed"
         CLOSED = "Closed", "Closed"
+        # 超過回覆期限仍未產生回覆（maiagent/chat/deadlines.py），可重新送出訊息
+        EXPIRED = "Expired", "Expired"
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sessions")
@@ -87,6 +138,10 @@ class Session(models.Model):
     status = models.CharField(max_length=16, choices=Status.choices, default=Status.ACTIVE)
     last_activity_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # 下一則訊息的序號，由 allocate_sequence_numbers 以單一 UPDATE 原子遞增
+    next_sequence = models.PositiveIntegerField(default=1)
+    # 生成 token：目前等待回覆的使用者訊息 ID，先前訊息的生成隨之失效（maiagent/chat/cancellation.py）
+    generation = models.UUIDField(null=True, blank=True, editable=False)
 
     class Meta:
         db_table = "chat_session"
@@ -95,6 +150,54 @@ class Session(models.Model):
             models.Index(fields=["scenario", "status"]),
         ]
 
+    @classmethod
+    def allocate_sequence_numbers(cls, session_id: Any, count: int = 1) -> int:
+        """保留 `count` 個連續序號並回傳第一個。
+
+        以 `UPDATE ... RETURNING` 一次完成遞增與讀取；需與寫入訊息在同一交易，
+        寫入失敗時計數一併回滾，不會留下空號。
+        """
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {quote(cls._meta.db_table)} SET {quote('next_sequence')} = {quote('next_sequence')} + %s "
+                f"WHERE {quote('id')} = %s RETURNING {quote('next_sequence')}",
+                [count, cls._meta.pk.get_db_prep_value(session_id, connection)],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise cls.DoesNotExist(f"Session {session_id} does not exist")
+        return row[0] - count
+
+
+class MessageManager(models.Manager["Message"]):
+    # 單次 INSERT 的筆數上限
+    bulk_batch_size = 1000
+
+    def append_many(
+        self, session: Session, messages: Iterable[Dict[str, Any]], tokenizer: Any = None
+    ) -> list["Message"]:
+        """依序寫入多則訊息（`role`、`content`），有 tokenizer 時一併寫入 token 數。
+
+        一次保留連續的序號區段再 `bulk_create`，查詢數與訊息數量無關。
+        """
+        items = list(messages)
+        if not items:
+            return []
+        with transaction.atomic(savepoint=False):
+            first = Session.allocate_sequence_numbers(session.pk, len(items))
+            rows = [
+                self.model(
+                    session_id=session.pk,
+                    role=item["role"],
+                    content=item["content"],
+                    sequence_number=first + i,
+                    token_count=tokenizer.count(item["content"]) if tokenizer is not None else None,
+                )
+                for i, item in enumerate(items)
+            ]
+            return self.bulk_create(rows, batch_size=self.bulk_batch_size)
+
 
 class Message(models.Model):
     class Role(models.TextChoices):
@@ -106,25 +209,31 @@ class Message(models.Model):
     role = models.CharField(max_length=16, choices=Role.choices)
     content = models.TextField()
     sequence_number = models.PositiveIntegerField(null=True, blank=True)
+    # 寫入時以會話使用的模型計算（maiagent/chat/tokenizers.py）；舊資料以 backfill_token_counts 補上
+    token_count = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = MessageManager()
+
     class Meta:
         db_table = "chat_message"
         unique_together = ("session", "sequence_number")
         indexes = [models.Index(fields=["session", "sequence_number"])]
 
     def save(self, *args: Any, **kwargs: Any) -> None:
-        # 序號自動遞增（按 session 群組），避免競態：鎖住 Session 進行分配
+        # 序號按 session 遞增：一次 UPDATE 分配序號、一次 INSERT 寫入，不需鎖定後再取 Max
         if self.sequence_number in (None, 0):
-            with transaction.atomic():
-                Session.objects.select_for_update().get(pk=self.session_id)
-                max_seq = (
-                    Message.objects.filter(session_id=self.session_id).aggregate(max_seq=Max("sequence_number"))
-                )["max_seq"]
-                self.sequence_number = (max_seq or 0) + 1
+            with transaction.atomic(savepoint=False):
+                self.sequence_number = Session.allocate_sequence_numbers(self.session_id)
                 super().save(*args, **kwargs)
-                return
+            return
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if adding:
+            # 指定序號寫入時，確保之後分配的序號不會重複
+            Session.objects.filter(pk=self.session_id).update(
+                next_sequence=Greatest(F("next_sequence"), self.sequence_number + 1)
+            )
 
 
 class GroupScenarioAccess(models.Model):
@@ -138,3 +247,90 @@ class GroupScenarioAccess(models.Model):
         indexes = [models.Index(fields=["group", "scenario"])]
 
 
+
+
+class OutboxMessage(models.Model):
+    """待發送的 Celery 任務，與業務資料同一交易寫入，由 relay_outbox 發送。"""
+
+    # 遞增主鍵即發送順序
+    id = models.BigAutoField(primary_key=True)
+    task_name = models.CharField(max_length=255)
+    args = models.JSONField(default=list, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    available_at = models.DateTimeField(default=timezone.now)
+    # 公平排程的 flow 與權重（maiagent/chat/fair_queue.py）；空白表示依寫入順序發送
+    flow = models.CharField(max_length=64, blank=True, default="")
+    weight = models.PositiveSmallIntegerField(default=1)
+    # 任務的期限，relay 以 Celery 的 expires 發送；空白表示不過期
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # 任務已重試的次數，relay 以 Celery 的 retries 發送（asyncio 執行模式的重試）
+    retries = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "chat_outbox_message"
+        indexes = [models.Index(fields=["available_at", "id"]), models.Index(fields=["flow", "available_at", "id"])]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.task_name}{self.args}"
+
+
+class SemanticCacheEntry(models.Model):
+    """語意快取的一筆問答，見 maiagent/chat/semantic_cache.py。"""
+
+    # 遞增主鍵，各 worker 依此只載入新增的向量
+    id = models.BigAutoField(primary_key=True)
+    scenario = models.ForeignKey(Scenario, on_delete=models.CASCADE, related_name="semantic_cache_entries")
+    # provider、模型、提示詞、參數與 embedder 的雜湊，任一改變即不再命中
+    context_hash = models.CharField(max_length=64)
+    question = models.TextField()
+    # float32 向量（embedder 輸出，已正規化）
+    embedding = models.BinaryField()
+    reply = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "chat_semantic_cache_entry"
+        indexes = [
+            models.Index(fields=["scenario", "context_hash", "id"]),
+            models.Index(fields=["scenario", "created_at"]),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return self.question
+
+
+class HedgeDecision(models.Model):
+    """一輪回覆的 hedging 決策，見 maiagent/chat/hedging.py。"""
+
+    class Role(models.TextChoices):
+        PRIMARY = "primary", "primary"
+        BACKUP = "backup", "backup"
+
+    class SkipReason(models.TextChoices):
+        # 場景沒有其他模型
+        NO_BACKUP = "no_backup", "no_backup"
+        # 備援模型的速率額度不足
+        RATE_LIMITED = "rate_limited", "rate_limited"
+
+    id = models.BigAutoField(primary_key=True)
+    scenario = models.ForeignKey(Scenario, on_delete=models.CASCADE, related_name="hedge_decisions")
+    # 本輪的使用者訊息
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="hedge_decisions")
+    primary_model = models.ForeignKey(LlmModel, on_delete=models.SET_NULL, null=True, related_name="+")
+    backup_model = models.ForeignKey(LlmModel, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    first_token_timeout = models.FloatField()
+    # 是否送出備援請求；未送出時 skip_reason 說明原因（空白表示主要模型在門檻內回應）
+    hedged = models.BooleanField(default=False)
+    skip_reason = models.CharField(max_length=16, choices=SkipReason.choices, blank=True, default="")
+    # 空白表示兩者皆失敗
+    winner = models.CharField(max_length=16, choices=Role.choices, blank=True, default="")
+    # 自送出請求至首字的毫秒數；未產生首字（失敗或被取消）為 NULL
+    primary_first_token_ms = models.PositiveIntegerField(null=True, blank=True)
+    backup_first_token_ms = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "chat_hedge_decision"
+        indexes = [models.Index(fields=["scenario", "created_at"])]
@@ -0,0 +1,333 @@
+"""會話事件通知。
+
+`process_message` 寫入助手訊息並提交後，透過 broker 發佈到該會話的頻道；
+長輪詢端點先訂閱頻道再阻塞等待，等待期間不需查詢資料庫。
+
+- `RedisReplyBroker`：Redis pub/sub，可跨多個 web / worker 行程
+- `InMemoryReplyBroker`：單一行程內的替身，供測試使用
+
+同步訂閱每個等待者各用一條連線（受限於執行緒數）；非同步訂閱在每個事件迴圈
+共用一條 pub/sub 連線，單一 uvicorn worker 可同時掛住大量長輪詢。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from functools import cache
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+from redis import asyncio as aioredis
+
+from .redis_client import connection_kwargs, get_redis_client, new_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def session_channel(session_id: Any) -> str:
+    return f"chat:session:{session_id}"
+
+
+class Subscription:
+    """訂閱一或多個頻道；`get()` 阻塞直到收到事件或逾時。"""
+
+    def get(self, timeout: float) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def __enter__(self) -> Subscription:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class AsyncSubscription:
+    """`Subscription` 的非同步版本，以 `async with` 開啟與關閉。"""
+
+    async def open(self) -> None:
+        raise NotImplementedError
+
+    async def get(self, timeout: float) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        raise NotImplementedError
+
+    async def __aenter__(self) -> AsyncSubscription:
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+
+class ReplyBroker:
+    def publish(self, channel: str, payload: dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        raise NotImplementedError
+
+    def asubscribe(self, channels: Iterable[str]) -> AsyncSubscription:
+        raise NotImplementedError
+
+
+class _RedisSubscription(Subscription):
+    def __init__(self, channels: list[str]) -> None:
+        self._client = new_redis_client()
+        self._pubsub = self._client.pubsub()
+        self._pubsub.subscribe(*channels)
+        # 等待 SUBSCRIBE 確認，確保之後發佈的事件不會遺漏
+        confirmed = 0
+        deadline = time.monotonic() + 5
+        while confirmed < len(channels) and time.monotonic() < deadline:
+            message = self._pubsub.get_message(timeout=1.0)
+            if message and message["type"] == "subscribe":
+                confirmed += 1
+
+    def get(self, timeout: float) -> dict[str, Any] | None:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            message = self._pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message and message["type"] == "message":
+                return json.loads(message["data"])
+
+    def close(self) -> None:
+        try:
+            self._pubsub.close()
+        finally:
+            self._client.close()
+
+
+class _RedisHub:
+    """單一事件迴圈內共用的 pub/sub 連線，依頻道分派事件給訂閱者。"""
+
+    def __init__(self) -> None:
+        self._client = aioredis.Redis.from_url(settings.REDIS_URL, **connection_kwargs())
+        self._pubsub = self._client.pubsub()
+        self._lock = asyncio.Lock()
+        self._listeners: dict[str, set[asyncio.Queue[dict[str, Any]]]] = {}
+        self._confirmed: dict[str, asyncio.Event] = {}
+        self._reader: asyncio.Task[None] | None = None
+
+    async def add(self, channel: str, inbox: asyncio.Queue[dict[str, Any]]) -> None:
+        async with self._lock:
+            self._listeners.setdefault(channel, set()).add(inbox)
+            confirmed = self._confirmed.get(channel)
+            if confirmed is None:
+                confirmed = self._confirmed[channel] = asyncio.Event()
+                await self._pubsub.subscribe(channel)
+                if self._reader is None or self._reader.done():
+                    self._reader = asyncio.create_task(self._read())
+        await asyncio.wait_for(confirmed.wait(), timeout=5)
+
+    async def discard(self, channel: str, inbox: asyncio.Queue[dict[str, Any]]) -> None:
+        async with self._lock:
+            listeners = self._listeners.get(channel)
+            if listeners is None:
+                return
+            listeners.discard(inbox)
+            if not listeners:
+                del self._listeners[channel]
+                self._confirmed.pop(channel, None)
+                await self._pubsub.unsubscribe(channel)
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # noqa: BLE001
+                logger.exception("Reply hub read failed; retrying")
+                await asyncio.sleep(1.0)
+                continue
+            if not message:
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            if message["type"] == "subscribe":
+                confirmed = self._confirmed.get(channel)
+                if confirmed is not None:
+                    confirmed.set()
+            elif message["type"] == "message":
+                payload = json.loads(message["data"])
+                for inbox in list(self._listeners.get(channel, ())):
+                    inbox.put_nowait(payload)
+
+
+_hubs: dict[asyncio.AbstractEventLoop, _RedisHub] = {}
+
+
+def _current_hub() -> _RedisHub:
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        for stale in [other for other in _hubs if other.is_closed()]:
+            del _hubs[stale]
+        hub = _hubs[loop] = _RedisHub()
+    return hub
+
+
+class _AsyncRedisSubscription(AsyncSubscription):
+    def __init__(self, channels: list[str]) -> None:
+        self.channels = channels
+        self._inbox: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self._hub: _RedisHub | None = None
+
+    async def open(self) -> None:
+        self._hub = _current_hub()
+        for channel in self.channels:
+            await self._hub.add(channel, self._inbox)
+
+    async def get(self, timeout: float) -> dict[str, Any] | None:
+        try:
+            return await asyncio.wait_for(self._inbox.get(), timeout=max(timeout, 0))
+        except TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        if self._hub is None:
+            return
+        for channel in self.channels:
+            await self._hub.discard(channel, self._inbox)
+
+
+class RedisReplyBroker(ReplyBroker):
+    def publish(self, channel: str, payload: dict[str, Any]) -> None:
+        get_redis_client().publish(channel, json.dumps(payload, cls=DjangoJSONEncoder))
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        return _RedisSubscription(list(channels))
+
+    def asubscribe(self, channels: Iterable[str]) -> AsyncSubscription:
+        return _AsyncRedisSubscription(list(channels))
+
+
+class _InMemorySubscription(Subscription):
+    def __init__(self, broker: InMemoryReplyBroker, channels: list[str]) -> None:
+        self._broker = broker
+        self.channels = channels
+        self.queue: queue.Queue[dict[str, Any]] = queue.Queue()
+
+    def deliver(self, data: dict[str, Any]) -> None:
+        self.queue.put(data)
+
+    def get(self, timeout: float) -> dict[str, Any] | None:
+        try:
+            return self.queue.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self._broker._remove(self)
+
+
+class _AsyncInMemorySubscription(AsyncSubscription):
+    def __init__(self, broker: InMemoryReplyBroker, channels: list[str]) -> None:
+        self._broker = broker
+        self.channels = channels
+        self._inbox: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def deliver(self, data: dict[str, Any]) -> None:
+        # 發佈端可能在其他執行緒，交由訂閱者所在的事件迴圈處理
+        assert self._loop is not None
+        self._loop.call_soon_threadsafe(self._inbox.put_nowait, data)
+
+    async def open(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._broker._add(self)
+
+    async def get(self, timeout: float) -> dict[str, Any] | None:
+        try:
+            return await asyncio.wait_for(self._inbox.get(), timeout=max(timeout, 0))
+        except TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        self._broker._remove(self)
+
+
+class InMemoryReplyBroker(ReplyBroker):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscriptions: dict[str, set[Any]] = {}
+
+    def publish(self, channel: str, payload: dict[str, Any]) -> None:
+        # 經過 JSON 來回轉換，與 Redis 版本的行為一致
+        data = json.loads(json.dumps(payload, cls=DjangoJSONEncoder))
+        with self._lock:
+            targets = list(self._subscriptions.get(channel, ()))
+        for subscription in targets:
+            subscription.deliver(data)
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        subscription = _InMemorySubscription(self, list(channels))
+        self._add(subscription)
+        return subscription
+
+    def asubscribe(self, channels: Iterable[str]) -> AsyncSubscription:
+        return _AsyncInMemorySubscription(self, list(channels))
+
+    def _add(self, subscription: Any) -> None:
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+
+    def _remove(self, subscription: Any) -> None:
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+
+@cache
+def _load_broker(path: str) -> ReplyBroker:
+    return import_string(path)()
+
+
+def get_reply_broker() -> ReplyBroker:
+    return _load_broker(settings.CHAT_REPLY_BROKER)
+
+
+def publish_reply(session_id: Any, message_data: dict[str, Any]) -> None:
+    """通知等待中的客戶端：該會話已有新的助手訊息。
+
+    發佈失敗僅記錄錯誤；客戶端下次輪詢仍會從資料庫讀到回覆。
+    """
+    try:
+        get_reply_broker().publish(
+            session_channel(session_id),
+            {"type": "message", "session_id": str(session_id), "message": message_data},
+        )
+    except Exception:  # noqa: BLE001
+        logger.exception("Failed to publish reply for session %s", session_id)
+
+
+def publish_expired(session_id: Any, reply_to: Any, detail: str) -> None:
+    """通知等待中的客戶端：該會話的回覆已逾時，不會再產生，需重新送出訊息。"""
+    try:
+        get_reply_broker().publish(
+            session_channel(session_id),
+            {"type": "expired", "session_id": str(session_id), "reply_to": str(reply_to), "detail": detail},
+        )
+    except Exception:  # noqa: BLE001
+        logger.exception("Failed to publish expiry for session %s", session_id)
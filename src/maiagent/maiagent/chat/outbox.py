@@ -0,0 +1,113 @@
+"""交易式 outbox。
+
+post_message 在寫入使用者訊息的同一交易中寫入 `OutboxMessage`，HTTP 回應不等待 broker；
+獨立的 relay 程序（`manage.py relay_outbox`）批次取出並發送到 Celery，發送成功後刪除。
+
+- 交易回滾時 outbox 一併回滾，不會發送指向不存在訊息的任務
+- broker 無法連線時資料列保留，依退避時間重試，訊息不會停在 WAITING 而沒有任務
+- 發送成功、刪除前程序中止時會重送（至少一次），任務需可重複執行
+- 多個 relay 以 `SELECT ... FOR UPDATE SKIP LOCKED` 取批，不會重複發送同一列
+- 帶 flow 的資料列（回覆任務）經公平排程發送，見 maiagent/chat/fair_queue.py
+- 已超過 `expires_at` 的資料列不發送，直接刪除；回覆任務改由 relay 執行 `expire_reply`
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .deadlines import expire_reply
+from .fair_queue import lock_fair_batch
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# 發送失敗的退避上限（秒）
+MAX_BACKOFF_SECONDS = 60
+
+
+def enqueue_task(
+    task_name: str,
+    *args: Any,
+    countdown: float = 0,
+    flow: str = "",
+    weight: int = 1,
+    expires: datetime | None = None,
+    retries: int = 0,
+) -> OutboxMessage:
+    """在目前交易中寫入待發送的 Celery 任務（參數需可序列化為 JSON），`countdown` 秒後才發送。
+
+    `flow` / `weight` 見 `fair_queue.flow_for`；未指定時依寫入順序發送。
+    `expires` 之後 worker 收到任務也不執行（Celery 的 `expires`）；`retries` 為任務已重試的次數（Celery 的 `retries`）。
+    """
+    return OutboxMessage.objects.create(
+        task_name=task_name,
+        args=list(args),
+        available_at=timezone.now() + timedelta(seconds=countdown),
+        flow=flow,
+        weight=weight,
+        expires_at=expires,
+        retries=retries,
+    )
+
+
+def relay_batch(batch_size: int | None = None) -> int:
+    """發送一批到期的 outbox 資料列，回傳本批處理（發送或因過期丟棄）的數量。
+
+    發送失敗時（通常是 broker 無法連線）記錄錯誤、延後該列並結束本批，其餘資料列留待下次。
+    """
+    batch_size = batch_size or settings.CHAT_OUTBOX_BATCH_SIZE
+    sent: list[int] = []
+    with transaction.atomic():
+        # 先丟棄已過期的資料列，不佔用公平排程與 ai_queue 的容量
+        dropped = drop_expired(batch_size)
+        rows = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(available_at__lte=timezone.now(), flow="")
+            .order_by("id")[: batch_size - dropped]
+        )
+        rows += lock_fair_batch(batch_size - dropped - len(rows))
+        for row in rows:
+            try:
+                # 以任務名稱發送，沿用 CELERY_TASK_ROUTES 的佇列設定（process_message → ai_queue）
+                current_app.send_task(row.task_name, args=row.args, expires=row.expires_at, retries=row.retries)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Outbox relay failed: id=%s task=%s error=%s", row.pk, row.task_name, exc)
+                row.attempts += 1
+                row.last_error = str(exc)
+                row.available_at = timezone.now() + timedelta(seconds=min(2**row.attempts, MAX_BACKOFF_SECONDS))
+                row.save(update_fields=["attempts", "last_error", "available_at"])
+                break
+            sent.append(row.pk)
+        if sent:
+            OutboxMessage.objects.filter(pk__in=sent).delete()
+    return dropped + len(sent)
+
+
+def drop_expired(limit: int) -> int:
+    """刪除已超過 `expires_at` 的資料列（需在交易中呼叫），回傳刪除的數量。
+
+    送出後 worker 也只會丟棄；回覆任務在此標記會話逾時並通知等待中的客戶端。
+    """
+    from .tasks import process_message  # tasks 匯入本模組
+
+    rows = list(
+        OutboxMessage.objects.select_for_update(skip_locked=True)
+        .filter(expires_at__lte=timezone.now())
+        .order_by("id")[:limit]
+    )
+    if not rows:
+        return 0
+    OutboxMessage.objects.filter(pk__in=[row.pk for row in rows]).delete()
+    for row in rows:
+        if row.task_name == process_message.name:
+            expire_reply(*row.args[:2])
+        else:
+            logger.warning("Outbox task expired before relay: id=%s task=%s", row.pk, row.task_name)
+    return len(rows)
@@ -0,0 +1,162 @@
+"""LLM 呼叫的叢集共用速率限制（token bucket）。
+
+每個模型（`LlmModel`，以 `provider:name` 區分）有兩個桶，所有 worker 共用：
+
+- 請求數：容量 `requests_per_minute`，每秒補充 requests_per_minute / 60
+- token 數：容量 `tokens_per_minute`，每秒補充 tokens_per_minute / 60
+
+`process_message` 呼叫 LLM 前以預估的 token 數（提示詞 + 回覆上限）取得額度；
+兩個桶都足夠才一起扣除，否則回傳需等待的秒數，任務經 outbox 延後重新排入，不在 worker 內等待。
+回覆完成後以實際的 token 數修正 token 桶。未設定上限（NULL）的桶不限制。
+
+- `RedisRateLimiter`：Redis hash `chat:ratelimit:{provider}:{name}:{requests|tokens}`，以 Lua 腳本原子更新
+- `InMemoryRateLimiter`：單一行程內的替身，供測試使用
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from functools import cache
+from typing import Any
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# 閒置超過此秒數的桶視為已補滿，讓 Redis 回收鍵
+BUCKET_TTL = 120
+
+Bucket = tuple[str, int, float]
+
+
+def bucket_keys(llm_model: Any) -> tuple[str, str]:
+    prefix = f"chat:ratelimit:{llm_model.provider}:{llm_model.name}"
+    return f"{prefix}:requests", f"{prefix}:tokens"
+
+
+def _buckets(llm_model: Any, tokens: int) -> list[Bucket]:
+    """（鍵, 每分鐘上限, 本次用量）；超過容量的用量以容量計，否則永遠取不到。"""
+    requests_key, tokens_key = bucket_keys(llm_model)
+    limits = [(requests_key, llm_model.requests_per_minute, 1), (tokens_key, llm_model.tokens_per_minute, tokens)]
+    return [(key, limit, min(cost, limit)) for key, limit, cost in limits if limit]
+
+
+class RateLimiter:
+    def acquire(self, llm_model: Any, tokens: int) -> float:
+        """扣除 1 次請求與 `tokens` 個 token；額度不足時不扣除，回傳需等待的秒數（0 表示已取得）。"""
+        raise NotImplementedError
+
+    def adjust(self, llm_model: Any, tokens: int) -> None:
+        """以實際用量修正 token 桶：正數為多用的 token，負數為退回。"""
+        raise NotImplementedError
+
+
+# KEYS：各桶的鍵；ARGV：每個桶的（上限, 用量），最後為 TTL
+# 回傳需等待的秒數（字串，Lua 數值回傳時會被截成整數）
+_ACQUIRE_SCRIPT = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2 - 1])
+    local cost = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'level', 'updated')
+    local level = limit
+    if state[1] then
+        level = math.min(limit, tonumber(state[1]) + (now - tonumber(state[2])) * limit / 60)
+    end
+    levels[i] = level
+    if level < cost then
+        wait = math.max(wait, (cost - level) * 60 / limit)
+    end
+end
+if wait == 0 then
+    local ttl = tonumber(ARGV[#KEYS * 2 + 1])
+    for i, key in ipairs(KEYS) do
+        redis.call('HSET', key, 'level', tostring(levels[i] - tonumber(ARGV[i * 2])), 'updated', tostring(now))
+        redis.call('EXPIRE', key, ttl)
+    end
+end
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    def acquire(self, llm_model: Any, tokens: int) -> float:
+        buckets = _buckets(llm_model, tokens)
+        if not buckets:
+            return 0.0
+        script = get_redis_client().register_script(_ACQUIRE_SCRIPT)
+        args = [value for _, limit, cost in buckets for value in (limit, cost)]
+        try:
+            return float(script(keys=[key for key, _, _ in buckets], args=[*args, BUCKET_TTL]))
+        except RedisError:
+            # Redis 無法使用時不限制，由 provider 的 429 與重試策略處理
+            logger.exception("Rate limiter unavailable: model=%s", llm_model)
+            return 0.0
+
+    def adjust(self, llm_model: Any, tokens: int) -> None:
+        if not tokens or not llm_model.tokens_per_minute:
+            return
+        _, tokens_key = bucket_keys(llm_model)
+        client = get_redis_client()
+        try:
+            # 桶已過期（視為補滿）時不需修正
+            if client.exists(tokens_key):
+                client.hincrbyfloat(tokens_key, "level", -tokens)
+        except RedisError:
+            logger.exception("Rate limiter unavailable: model=%s", llm_model)
+
+
+class InMemoryRateLimiter(RateLimiter):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._levels: dict[str, tuple[float, float]] = {}
+
+    def _level(self, key: str, limit: int, now: float) -> float:
+        if key not in self._levels:
+            return float(limit)
+        level, updated = self._levels[key]
+        return min(limit, level + (now - updated) * limit / 60)
+
+    def acquire(self, llm_model: Any, tokens: int) -> float:
+        buckets = _buckets(llm_model, tokens)
+        with self._lock:
+            now = time.monotonic()
+            levels = [self._level(key, limit, now) for key, limit, _ in buckets]
+            wait = max(
+                [(cost - level) * 60 / limit for (_, limit, cost), level in zip(buckets, levels) if level < cost],
+                default=0.0,
+            )
+            if not wait:
+                for (key, _, cost), level in zip(buckets, levels):
+                    self._levels[key] = (level - cost, now)
+            return wait
+
+    def adjust(self, llm_model: Any, tokens: int) -> None:
+        _, tokens_key = bucket_keys(llm_model)
+        with self._lock:
+            if tokens and tokens_key in self._levels:
+                level, updated = self._levels[tokens_key]
+                self._levels[tokens_key] = (level - tokens, updated)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._levels.clear()
+
+
+@cache
+def _load_limiter(path: str) -> RateLimiter:
+    return import_string(path)()
+
+
+def get_rate_limiter() -> RateLimiter:
+    return _load_limiter(settings.CHAT_RATE_LIMITER)
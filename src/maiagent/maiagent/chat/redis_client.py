@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import ssl
+from functools import cache
+
+from django.conf import settings
+from redis import ConnectionPool, Redis
+
+
+def connection_kwargs() -> dict:
+    if getattr(settings, "REDIS_SSL", False):
+        return {"ssl_cert_reqs": ssl.CERT_NONE}
+    return {}
+
+
+@cache
+def _shared_pool(url: str) -> ConnectionPool:
+    # 依 Celery_Design.md：連線池上限 20
+    return ConnectionPool.from_url(
+        url,
+        max_connections=getattr(settings, "REDIS_MAX_CONNECTIONS", 20),
+        **connection_kwargs(),
+    )
+
+
+def get_redis_client() -> Redis:
+    """取得共用連線池的 Redis client（同一行程內重複使用連線）。"""
+    return Redis(connection_pool=_shared_pool(settings.REDIS_URL))
+
+
+def new_redis_client() -> Redis:
+    """建立獨立連線的 Redis client。
+
+    pub/sub 訂閱會長時間佔用連線，不應從共用連線池借用。
+    """
+    return Redis.from_url(settings.REDIS_URL, **connection_kwargs())
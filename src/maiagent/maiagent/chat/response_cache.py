@@ -0,0 +1,97 @@
+"""LLM 回覆快取（完全比對）。
+
+同一場景、同一模型與生成參數、同一提示詞，且對話內容（記憶視窗加本輪問題）正規化後相同時，
+直接使用先前的回覆，不呼叫 LLM。鍵為上述內容的 SHA-256：
+
+    chat:llm-response:{scenario_id}:{sha256}
+
+場景以 `config_json["response_cache"]` 設定，預設啟用：
+
+    {"enabled": false}          # 停用（例如需要即時資料或個人化回覆的場景）
+    {"ttl": 86400}              # 存活時間（秒），預設 CHAT_RESPONSE_CACHE_TTL
+
+快取存放於 `CHAT_RESPONSE_CACHE_ALIAS` 指定的 Django cache。正式環境為獨立的 Redis，
+設定 `maxmemory` 與 `maxmemory-policy allkeys-lru`，記憶體用滿時淘汰最久未使用的回覆，
+不影響 broker 與其他快取。每個場景的命中 / 未命中次數記錄於同一個 cache（不過期）。
+
+完全比對未命中時，場景啟用語意快取（semantic_cache）則再比對換句話說的問題。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import unicodedata
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .llm import LlmRequest
+
+
+def _cache() -> Any:
+    return caches[settings.CHAT_RESPONSE_CACHE_ALIAS]
+
+
+def normalize_text(text: str) -> str:
+    """全形轉半形（NFKC）、合併連續空白、不分大小寫。"""
+    return " ".join(unicodedata.normalize("NFKC", text).split()).casefold()
+
+
+def cache_config(scenario_config: dict[str, Any] | None) -> dict[str, Any]:
+    return (scenario_config or {}).get("response_cache") or {}
+
+
+def is_enabled(scenario_config: dict[str, Any] | None) -> bool:
+    return settings.CHAT_RESPONSE_CACHE_ENABLED and cache_config(scenario_config).get("enabled", True)
+
+
+def response_key(scenario_id: Any, provider: str, request: LlmRequest) -> str:
+    material = json.dumps(
+        {
+            "provider": provider,
+            "model": request.model,
+            "system": request.system,
+            "params": request.params,
+            "messages": [[m["role"], normalize_text(m["content"])] for m in request.messages],
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return f"chat:llm-response:{scenario_id}:{hashlib.sha256(material.encode()).hexdigest()}"
+
+
+def _stats_key(scenario_id: Any, outcome: str) -> str:
+    return f"chat:llm-response-stats:{scenario_id}:{outcome}"
+
+
+def record_outcome(scenario_id: Any, outcome: str) -> None:
+    key = _stats_key(scenario_id, outcome)
+    cache = _cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 剛好被淘汰，下次重新計數
+        pass
+
+
+def get_cached_response(scenario_id: Any, key: str) -> str | None:
+    reply = _cache().get(key)
+    record_outcome(scenario_id, "hits" if reply is not None else "misses")
+    return reply
+
+
+def store_response(key: str, reply: str, scenario_config: dict[str, Any] | None) -> None:
+    ttl = cache_config(scenario_config).get("ttl", settings.CHAT_RESPONSE_CACHE_TTL)
+    _cache().set(key, reply, ttl)
+
+
+def response_cache_stats(scenario_id: Any) -> dict[str, int]:
+    """完全比對的命中 / 未命中、未命中後由語意快取（semantic_cache）命中，
+    以及等待相同請求結果（single_flight）而省下的 LLM 呼叫次數。"""
+    outcomes = ("hits", "misses", "semantic_hits", "coalesced")
+    values = _cache().get_many([_stats_key(scenario_id, outcome) for outcome in outcomes])
+    return {outcome: values.get(_stats_key(scenario_id, outcome), 0) for outcome in outcomes}
@@ -0,0 +1,175 @@
+"""每個行程在記憶體保留的場景設定（`ScenarioRuntime`）。
+
+`process_message` 每一輪都需要場景的設定、系統提示詞與綁定的模型，原本每次都查詢 `Scenario` 與
+`ScenarioModel`。改為每個 worker 行程快取：
+
+- 驗證後的 `config_json`、組好的系統提示詞、綁定的模型（預設模型優先，其餘依建立順序）
+- 以 `Scenario.version` 標示版本：場景、其 `ScenarioModel` 或綁定的 `LlmModel` 以 `save()` / `delete()`
+  變更時遞增版本（`bump_scenario_versions`），本行程立即丟棄舊版本，提交後經 reply broker
+  （Redis pub/sub）廣播到 `chat:scenario:invalidate`，其他行程收到後丟棄
+- 每個行程一個訂閱執行緒；重新訂閱時清空快取（中斷期間可能漏收廣播），
+  並以 `CHAT_SCENARIO_CACHE_TTL` 秒作為快取的上限。`QuerySet.update()` 不經過 `save()`，
+  需自行呼叫 `bump_scenario_versions`
+
+快取命中時不查詢資料庫。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import LlmModel, Scenario, ScenarioModel, validate_scenario_config_json
+from .notifications import get_reply_broker
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "chat:scenario:invalidate"
+# 訂閱中斷後重新訂閱前的等待（秒）
+RESUBSCRIBE_DELAY = 1
+
+
+def system_prompt(prompt: Any) -> str:
+    """場景提示詞可為字串，或 {"system": "...", "user_template": "..."} 形式的物件。"""
+    if isinstance(prompt, dict):
+        return prompt.get("system", "")
+    return prompt or ""
+
+
+@dataclass(frozen=True)
+class ScenarioRuntime:
+    scenario_id: Any
+    version: int
+    config: dict[str, Any]
+    system_prompt: str
+    models: tuple[LlmModel, ...]
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def default_model(self) -> LlmModel | None:
+        return self.models[0] if self.models else None
+
+    def model(self, llm_model_id: Any) -> LlmModel | None:
+        return next((model for model in self.models if str(model.pk) == str(llm_model_id)), None)
+
+    def other_models(self, llm_model: LlmModel) -> list[LlmModel]:
+        return [model for model in self.models if model.pk != llm_model.pk]
+
+
+def load_runtime(scenario_id: Any) -> ScenarioRuntime:
+    scenario = Scenario.objects.only("id", "version", "config_json").get(pk=scenario_id)
+    config = scenario.config_json or {}
+    try:
+        validate_scenario_config_json(config)
+    except ValidationError as exc:
+        # 舊資料可能未經驗證，沿用原本的行為（缺少的鍵以預設值處理）
+        logger.warning("Invalid scenario config: scenario=%s error=%s", scenario_id, exc)
+    bindings = (
+        ScenarioModel.objects.filter(scenario_id=scenario_id).select_related("llm_model").order_by("-is_default", "id")
+    )
+    return ScenarioRuntime(
+        scenario_id=scenario.pk,
+        version=scenario.version,
+        config=config,
+        system_prompt=system_prompt(config.get("prompt")),
+        models=tuple(binding.llm_model for binding in bindings),
+    )
+
+
+class ScenarioCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: dict[str, ScenarioRuntime] = {}
+        # 各場景收到的最新版本；載入期間收到更新版本的廣播時，載入的結果不寫入快取
+        self._versions: dict[str, int] = {}
+        self._pid: int | None = None
+
+    def get(self, scenario_id: Any) -> ScenarioRuntime:
+        if not settings.CHAT_SCENARIO_CACHE_ENABLED:
+            return load_runtime(scenario_id)
+        self._ensure_listener()
+        key = str(scenario_id)
+        runtime = self._entries.get(key)
+        if runtime is not None and time.monotonic() - runtime.loaded_at < settings.CHAT_SCENARIO_CACHE_TTL:
+            return runtime
+        runtime = load_runtime(scenario_id)
+        with self._lock:
+            if runtime.version >= self._versions.get(key, 0):
+                self._entries[key] = runtime
+        return runtime
+
+    def invalidate(self, scenario_id: Any, version: int) -> None:
+        key = str(scenario_id)
+        with self._lock:
+            self._versions[key] = max(version, self._versions.get(key, 0))
+            runtime = self._entries.get(key)
+            if runtime is not None and runtime.version < version:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def _ensure_listener(self) -> None:
+        # prefork 的子行程不會繼承訂閱執行緒，依 pid 在每個行程各啟動一次
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._entries.clear()
+            self._versions.clear()
+            subscribed = threading.Event()
+            threading.Thread(target=self._listen, args=(subscribed,), name="scenario-cache", daemon=True).start()
+            # 訂閱完成後才載入，之後的變更不會漏收
+            subscribed.wait(5)
+            self._pid = os.getpid()
+
+    def _listen(self, subscribed: threading.Event) -> None:
+        while True:
+            try:
+                with get_reply_broker().subscribe([INVALIDATE_CHANNEL]) as subscription:
+                    if subscribed.is_set():
+                        self.clear()
+                    subscribed.set()
+                    while True:
+                        event = subscription.get(timeout=60)
+                        if event is not None:
+                            self.invalidate(event["scenario_id"], event["version"])
+            except Exception:  # noqa: BLE001
+                logger.exception("Scenario cache lost its subscription, resubscribing")
+                subscribed.set()
+                time.sleep(RESUBSCRIBE_DELAY)
+
+
+_cache = ScenarioCache()
+
+
+def get_runtime(scenario_id: Any) -> ScenarioRuntime:
+    return _cache.get(scenario_id)
+
+
+def scenarios_changed(versions: dict[Any, int]) -> None:
+    """場景已更新到 `versions` 的版本：本行程立即丟棄舊版本，提交後廣播給其他行程。"""
+    for scenario_id, version in versions.items():
+        _cache.invalidate(scenario_id, version)
+
+    def broadcast() -> None:
+        broker = get_reply_broker()
+        for scenario_id, version in versions.items():
+            try:
+                broker.publish(INVALIDATE_CHANNEL, {"scenario_id": str(scenario_id), "version": version})
+            except Exception:  # noqa: BLE001
+                # 其他行程以 CHAT_SCENARIO_CACHE_TTL 為上限重新載入
+                logger.exception("Failed to broadcast scenario change: scenario=%s", scenario_id)
+
+    transaction.on_commit(broadcast)
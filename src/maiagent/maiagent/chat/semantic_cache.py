@@ -0,0 +1,181 @@
+"""語意快取：換句話說的問題使用先前的回覆。
+
+完全比對的回覆快取（response_cache）無法命中「怎麼重設密碼」與「密碼要如何重設」這類改寫。
+場景以 `config_json["semantic_cache"]` 啟用（預設停用）：
+
+    {"enabled": true, "threshold": 0.9, "ttl": 86400}
+
+- 只有不帶對話記憶的問題（第一輪，或記憶設定為 none）才會比對與寫入，回覆不依賴前文
+- 問題向量由 `CHAT_SEMANTIC_CACHE_EMBEDDER` 產生，與場景內既有問題的餘弦相似度
+  達到 `threshold`（預設 CHAT_SEMANTIC_CACHE_THRESHOLD）時使用該筆回覆
+- 問答存於 `SemanticCacheEntry`，所有 worker 共用；每個 worker 行程依
+  （場景, context_hash）在記憶體保留一個連續的 float32 矩陣，查詢為一次矩陣與向量的內積，
+  之後每次查詢只載入 id 大於已載入最大值的新問答
+- 每個索引最多保留最新的 `CHAT_SEMANTIC_CACHE_MAX_ENTRIES` 筆；超過 ttl 的問答不參與比對，
+  並於寫入新問答時刪除
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from datetime import timedelta
+from typing import Any
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .embeddings import Embedder, get_embedder
+from .llm import LlmRequest
+from .models import SemanticCacheEntry
+
+
+def cache_config(scenario_config: dict[str, Any] | None) -> dict[str, Any]:
+    return (scenario_config or {}).get("semantic_cache") or {}
+
+
+def context_hash(provider: str, request: LlmRequest, embedder: Embedder) -> str:
+    material = json.dumps(
+        [provider, request.model, request.system, request.params, embedder.identity],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class VectorIndex:
+    """單一（場景, context_hash）的問題向量，存於預先配置的連續矩陣。"""
+
+    def __init__(self, dimensions: int, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        self.created = np.empty(0, dtype=np.float64)
+        self.replies: list[str] = []
+        self.size = 0
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+    def append(self, entry_ids: list[int], vectors: np.ndarray, created: np.ndarray, replies: list[str]) -> None:
+        count = len(replies)
+        if self.size + count > len(self.vectors):
+            # 容量加倍，攤銷後每筆寫入為常數時間
+            capacity = max(2 * len(self.vectors), self.size + count, 64)
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[: self.size] = self.vectors[: self.size]
+            grown_created = np.empty(capacity, dtype=np.float64)
+            grown_created[: self.size] = self.created[: self.size]
+            self.vectors, self.created = grown, grown_created
+        self.vectors[self.size : self.size + count] = vectors
+        self.created[self.size : self.size + count] = created
+        self.replies.extend(replies)
+        self.size += count
+        self.last_id = max(self.last_id, entry_ids[-1])
+
+        overflow = self.size - self.max_entries
+        if overflow > 0:
+            # 捨棄最舊的問答
+            self.vectors[: self.max_entries] = self.vectors[overflow : self.size]
+            self.created[: self.max_entries] = self.created[overflow : self.size]
+            del self.replies[:overflow]
+            self.size = self.max_entries
+
+    def search(self, query: np.ndarray, min_created: float) -> tuple[int, float] | None:
+        """最相似的一筆（索引, 相似度）；沒有未過期的問答時回傳 None。"""
+        if not self.size:
+            return None
+        scores = self.vectors[: self.size] @ query
+        scores[self.created[: self.size] < min_created] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            return None
+        return best, float(scores[best])
+
+
+_indexes: dict[tuple[str, str], VectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_for(scenario_id: Any, context: str, dimensions: int) -> VectorIndex:
+    key = (str(scenario_id), context)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = VectorIndex(dimensions, settings.CHAT_SEMANTIC_CACHE_MAX_ENTRIES)
+        return index
+
+
+def clear_indexes() -> None:
+    with _indexes_lock:
+        _indexes.clear()
+
+
+class SemanticQuery:
+    """一個待回覆問題的語意快取查詢與寫入，向量只計算一次。"""
+
+    def __init__(
+        self, scenario_id: Any, scenario_config: dict[str, Any] | None, provider: str, request: LlmRequest
+    ) -> None:
+        config = cache_config(scenario_config)
+        self.scenario_id = scenario_id
+        self.question = request.messages[-1]["content"]
+        self.threshold = config.get("threshold", settings.CHAT_SEMANTIC_CACHE_THRESHOLD)
+        self.ttl = config.get("ttl", settings.CHAT_SEMANTIC_CACHE_TTL)
+        self.embedder = get_embedder()
+        self.context = context_hash(provider, request, self.embedder)
+        self.vector = self.embedder.embed([self.question])[0]
+
+    @classmethod
+    def from_request(
+        cls, scenario_id: Any, scenario_config: dict[str, Any] | None, provider: str, request: LlmRequest
+    ) -> SemanticQuery | None:
+        """場景未啟用，或問題帶有對話記憶時回傳 None。"""
+        if not settings.CHAT_SEMANTIC_CACHE_ENABLED or not cache_config(scenario_config).get("enabled", False):
+            return None
+        if len(request.messages) != 1:
+            return None
+        return cls(scenario_id, scenario_config, provider, request)
+
+    def _expires_before(self) -> float:
+        return (timezone.now() - timedelta(seconds=self.ttl)).timestamp()
+
+    def _refresh(self, index: VectorIndex) -> None:
+        rows = SemanticCacheEntry.objects.filter(
+            scenario_id=self.scenario_id, context_hash=self.context, id__gt=index.last_id
+        )
+        if not index.last_id:
+            rows = rows.filter(created_at__gte=timezone.now() - timedelta(seconds=self.ttl))
+        newest = rows.order_by("-id").values_list("id", "embedding", "reply", "created_at")[: index.max_entries]
+        rows = list(newest)[::-1]
+        if not rows:
+            return
+        vectors = np.frombuffer(b"".join(bytes(row[1]) for row in rows), dtype=np.float32)
+        index.append(
+            [row[0] for row in rows],
+            vectors.reshape(len(rows), self.embedder.dimensions),
+            np.array([row[3].timestamp() for row in rows]),
+            [row[2] for row in rows],
+        )
+
+    def lookup(self) -> str | None:
+        index = _index_for(self.scenario_id, self.context, self.embedder.dimensions)
+        with index.lock:
+            self._refresh(index)
+            match = index.search(self.vector, self._expires_before())
+            if match is None or match[1] < self.threshold:
+                return None
+            return index.replies[match[0]]
+
+    def store(self, reply: str) -> None:
+        SemanticCacheEntry.objects.create(
+            scenario_id=self.scenario_id,
+            context_hash=self.context,
+            question=self.question,
+            embedding=self.vector.astype(np.float32).tobytes(),
+            reply=reply,
+        )
+        SemanticCacheEntry.objects.filter(
+            scenario_id=self.scenario_id, created_at__lt=timezone.now() - timedelta(seconds=self.ttl)
+        ).delete()
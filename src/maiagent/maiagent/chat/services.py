@@ -0,0 +1,136 @@
+"""訊息提交流程（同步與非同步 API 共用）。"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import status
+
+from maiagent.chat.deadlines import reply_deadline
+from maiagent.chat.fair_queue import flow_for
+from maiagent.chat.models import LlmModel, Message, OutboxMessage, Scenario, Session
+from maiagent.chat.outbox import enqueue_task
+from maiagent.chat.tasks import process_message, select_llm_model
+from maiagent.chat.tokenizers import get_tokenizer
+from maiagent.chat.status_cache import peek_session_state, record_session_state
+from maiagent.users.permissions import filter_sessions_for_user, user_can_view_session, user_has_scenario_access
+
+logger = logging.getLogger(__name__)
+
+
+class MessageSubmissionError(Exception):
+    """提交流程中可預期的錯誤，由 API 層轉為對應的 HTTP 回應。"""
+
+    def __init__(self, detail: str, status_code: int) -> None:
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def submit_user_message(
+    user: Any,
+    *,
+    content: str,
+    session_id: Any = None,
+    scenario_id: Any = None,
+    llm_model_id: Any = None,
+) -> tuple[Session, Message]:
+    """建立使用者訊息、將會話設為 WAITING 並寫入回覆任務的 outbox（單一交易）。
+
+    - 有 session_id：使用指定會話
+    - 否則以 scenario_id 建立新會話
+    """
+    if session_id:
+        # 快取顯示仍在等待回覆時直接拒絕，不開啟交易
+        cached = peek_session_state(session_id)
+        if cached is not None and cached.visible_to(user) and cached.status == Session.Status.WAITING:
+            raise MessageSubmissionError("會話狀態不允許提交訊息", status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        # 案例1：請求體中有 session_id - 使用指定會話
+        if session_id:
+            session = Session.objects.select_related("user").filter(pk=session_id).first()
+            if session is None:
+                raise MessageSubmissionError("會話不存在", status.HTTP_404_NOT_FOUND)
+            # 檢查使用者權限
+            if not user_can_view_session(user, session.user_id, session.user.group_id):
+                raise MessageSubmissionError("無權限存取該會話", status.HTTP_403_FORBIDDEN)
+            # 檢查場景存取權
+            if not user_has_scenario_access(user, session.scenario_id):
+                raise MessageSubmissionError("無場景存取權", status.HTTP_403_FORBIDDEN)
+            # 檢查會話狀態（回覆逾時的會話可重新送出）
+            if session.status not in (Session.Status.ACTIVE, Session.Status.REPLYED, Session.Status.EXPIRED):
+                raise MessageSubmissionError("會話狀態不允許提交訊息", status.HTTP_400_BAD_REQUEST)
+
+        # 案例2：建立新會話
+        else:
+            if not scenario_id:
+                raise MessageSubmissionError("建立新對話時需要指定場景 ID", status.HTTP_400_BAD_REQUEST)
+            scenario = Scenario.objects.filter(pk=scenario_id).first()
+            if scenario is None:
+                raise MessageSubmissionError("場景不存在", status.HTTP_404_NOT_FOUND)
+            # 檢查場景存取權
+            if not user_has_scenario_access(user, scenario_id):
+                raise MessageSubmissionError("無場景存取權", status.HTTP_403_FORBIDDEN)
+            session = Session.objects.create(user=user, scenario=scenario, status=Session.Status.ACTIVE)
+
+        # 驗證 LLM model（如果有提供）
+        llm_model = None
+        if llm_model_id:
+            llm_model = LlmModel.objects.filter(pk=llm_model_id).first()
+            if llm_model is None:
+                raise MessageSubmissionError("指定的模型不存在", status.HTTP_404_NOT_FOUND)
+
+        # 建立使用者訊息，token 數以回覆所用模型的 tokenizer 計算
+        tokenizer = get_tokenizer((llm_model or select_llm_model(session)).tokenizer)
+        message = Message.objects.create(
+            session=session, role=Message.Role.USER, content=content, token_count=tokenizer.count(content)
+        )
+        logger.info("Message created: id=%s, sequence=%s", message.id, message.sequence_number)
+
+        # 更新 Session 狀態為 Waiting；先前訊息仍在進行的生成隨之失效，見 maiagent/chat/cancellation.py
+        session.status = Session.Status.WAITING
+        session.generation = message.pk
+        session.save(update_fields=["status", "generation", "last_activity_at"])
+        record_session_state(session)
+
+        # 回覆任務與訊息同一交易寫入 outbox，由 relay_outbox 發送，請求不等待 broker；
+        # 超過期限（使用者已不再等待）的任務不執行，見 maiagent/chat/deadlines.py
+        task_args = [str(session.id), str(message.id)]
+        if llm_model_id:
+            task_args.append(str(llm_model_id))
+        enqueue_task(process_message.name, *task_args, expires=reply_deadline(), **flow_for(user))
+
+    return session, message
+
+
+def cancel_session_replies(session_id: Any) -> int:
+    """在刪除會話的交易內呼叫：刪除 outbox 中尚未發送的回覆任務。
+
+    已發送或進行中的生成於下次檢查時查無會話而停止。回傳刪除的 outbox 資料列數。
+    """
+    deleted, _ = OutboxMessage.objects.filter(task_name=process_message.name, args__0=str(session_id)).delete()
+    return deleted
+
+
+def new_assistant_messages(user: Any, cursors: dict[Any, int]) -> dict[str, list[Message]]:
+    """批次輪詢：取得各會話序號大於讀取位置的助手訊息（單一查詢，已依權限過濾）。
+
+    使用者不可見的會話不會出現在結果中。
+    """
+    condition = Q()
+    for session_id, last_sequence in cursors.items():
+        condition |= Q(session_id=session_id, sequence_number__gt=last_sequence)
+    messages = Message.objects.filter(
+        condition,
+        role=Message.Role.ASSISTANT,
+        session__in=filter_sessions_for_user(Session.objects.all(), user).values("pk"),
+    ).order_by("session_id", "sequence_number")
+
+    updates: dict[str, list[Message]] = {}
+    for message in messages:
+        updates.setdefault(str(message.session_id), []).append(message)
+    return updates
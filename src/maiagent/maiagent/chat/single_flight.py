@@ -0,0 +1,214 @@
+"""相同 LLM 請求的合併（single-flight）。
+
+公告發出後，同一群組的使用者常在幾秒內問相同的問題，每則問題都各自呼叫一次 LLM。
+以請求內容的雜湊（同 response_cache 的鍵）為 key，同時間只有一個任務（leader）呼叫 LLM，
+其他相同的任務延後重新排入（不在 worker 內等待），取得其結果後各自寫入助手訊息。
+
+leader 鎖與結果由所有 worker 行程共用（prefork 的子行程各自一份快取時，相同的請求不會合併），
+存放於 `CHAT_SINGLE_FLIGHT_STORE`：
+
+- `RedisFlightStore`：Redis 字串，鎖以 `SET NX PX` 取得，釋放時以 Lua 腳本比對持有者後刪除
+- `InMemoryFlightStore`：單一行程內的替身，供測試使用
+
+鍵：
+
+- `chat:single-flight:{key}:lock`：leader 持有，存活 `CHAT_SINGLE_FLIGHT_LOCK_TTL` 秒（leader 異常結束時自動釋放）
+- `chat:single-flight:{key}:result:{leader}`：leader 成功後寫入，存活 `CHAT_SINGLE_FLIGHT_RESULT_TTL` 秒，
+  只供等待該 leader 的任務讀取；請求完成後才到達的任務不會取得（是否重複使用由 response_cache 決定）
+- `chat:single-flight:{key}:waiter:{waiter}`：等待中的任務（使用者訊息 ID）所等待的 leader 與開始等待的時間，
+  重新排入後據此讀取結果
+
+leader 失敗（未寫入結果即釋放鎖）時，等待中的任務之一接手成為 leader；等待超過鎖的存活時間則自行呼叫 LLM。
+Redis 無法使用時讀不到鎖，不等待，照常呼叫 LLM。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+import uuid
+from functools import cache
+from typing import Any
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class FlightStore:
+    """single-flight 的共用儲存；值為字串，`ttl` 以秒計。"""
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        """鍵不存在時寫入並回傳 True。"""
+        raise NotImplementedError
+
+    def get(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str, value: str | None = None) -> None:
+        """刪除鍵；指定 `value` 時只在目前的值相同時刪除。"""
+        raise NotImplementedError
+
+
+_DELETE_IF_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisFlightStore(FlightStore):
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        try:
+            return bool(get_redis_client().set(key, value, nx=True, px=int(ttl * 1000)))
+        except RedisError:
+            logger.exception("Single-flight store unavailable: key=%s", key)
+            return False
+
+    def get(self, key: str) -> str | None:
+        try:
+            value = get_redis_client().get(key)
+        except RedisError:
+            logger.exception("Single-flight store unavailable: key=%s", key)
+            return None
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        try:
+            get_redis_client().set(key, value, px=int(ttl * 1000))
+        except RedisError:
+            logger.exception("Single-flight store unavailable: key=%s", key)
+
+    def delete(self, key: str, value: str | None = None) -> None:
+        client = get_redis_client()
+        try:
+            if value is None:
+                client.delete(key)
+            else:
+                client.register_script(_DELETE_IF_SCRIPT)(keys=[key], args=[value])
+        except RedisError:
+            logger.exception("Single-flight store unavailable: key=%s", key)
+
+
+class InMemoryFlightStore(FlightStore):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # 鍵 →（值, 到期時間）
+        self._values: dict[str, tuple[str, float]] = {}
+
+    def _live(self, key: str, now: float) -> str | None:
+        entry = self._values.get(key)
+        if entry is None or entry[1] <= now:
+            self._values.pop(key, None)
+            return None
+        return entry[0]
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._live(key, now) is not None:
+                return False
+            self._values[key] = (value, now + ttl)
+            return True
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            return self._live(key, time.monotonic())
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key: str, value: str | None = None) -> None:
+        with self._lock:
+            if value is None or self._live(key, time.monotonic()) == value:
+                self._values.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+@cache
+def _load_store(path: str) -> FlightStore:
+    return import_string(path)()
+
+
+def get_flight_store() -> FlightStore:
+    return _load_store(settings.CHAT_SINGLE_FLIGHT_STORE)
+
+
+class SingleFlight:
+    def __init__(self, key: str, waiter: str) -> None:
+        self.lock_key = f"chat:single-flight:{key}:lock"
+        self.result_prefix = f"chat:single-flight:{key}:result"
+        self.waiter_key = f"chat:single-flight:{key}:waiter:{waiter}"
+        self.token = uuid.uuid4().hex
+        self.leading = False
+        self.waiting = False
+
+    def _result_key(self, token: str) -> str:
+        return f"{self.result_prefix}:{token}"
+
+    def join(self) -> str | None:
+        """取得進行中請求的結果，不等待。
+
+        回傳 None 時：`leading` 為 True 由本任務呼叫 LLM；`waiting` 為 True 表示相同的請求進行中，
+        呼叫端於 `CHAT_SINGLE_FLIGHT_POLL_INTERVAL` 秒後重新排入再 join；兩者皆否時照常呼叫 LLM。
+        """
+        # 先前排入時等待的 leader；結果依 leader 區分，已完成的請求不會被之後到達的任務使用
+        store = get_flight_store()
+        record = store.get(self.waiter_key)
+        joined: dict[str, Any] | None = json.loads(record) if record is not None else None
+        leader: str | None = None
+        # leader 在兩次讀取之間結束時，再讀一次其結果
+        for _ in range(2):
+            if joined is not None:
+                result = store.get(self._result_key(joined["leader"]))
+                if result is not None:
+                    store.delete(self.waiter_key)
+                    return result
+            if store.add(self.lock_key, self.token, settings.CHAT_SINGLE_FLIGHT_LOCK_TTL):
+                self.leading = True
+                store.delete(self.waiter_key)
+                return None
+            leader = store.get(self.lock_key)
+            if leader is not None or joined is None:
+                break
+        if leader is None:
+            # 讀不到鎖（Redis 無法使用），不等待
+            return None
+        since = joined["since"] if joined is not None else time.time()
+        if time.time() - since >= settings.CHAT_SINGLE_FLIGHT_LOCK_TTL:
+            # 等待超過鎖的存活時間，自行呼叫 LLM
+            store.delete(self.waiter_key)
+            return None
+        record = json.dumps({"leader": leader, "since": since})
+        store.set(self.waiter_key, record, settings.CHAT_SINGLE_FLIGHT_LOCK_TTL)
+        self.waiting = True
+        return None
+
+    def share(self, reply: str) -> None:
+        """寫入結果並釋放鎖，等待中的任務隨即取得。"""
+        if not self.leading:
+            return
+        get_flight_store().set(self._result_key(self.token), reply, settings.CHAT_SINGLE_FLIGHT_RESULT_TTL)
+        self.release()
+
+    def release(self) -> None:
+        """釋放鎖；未寫入結果時，等待中的任務之一接手呼叫 LLM。"""
+        if not self.leading:
+            return
+        self.leading = False
+        # 鎖可能已過期並由其他任務取得，只刪除自己的鎖
+        get_flight_store().delete(self.lock_key, self.token)
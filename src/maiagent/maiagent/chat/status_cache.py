@@ -0,0 +1,152 @@
+"""會話狀態快取。
+
+polling / post_message / retrieve 等熱路徑先讀快取，未命中才查詢資料庫。
+快取存放於 Django cache，鍵為 `chat:session-state:{session_id}`，內容：
+
+    status, last_assistant_message_id, last_activity_at, user_id, group_id
+
+擁有者資訊（user_id / group_id）讓讀取端不查資料庫即可判斷可見性。
+
+一致性：
+- 寫入端在交易內先刪除快取，提交後才寫入新狀態（`record_session_state`），
+  交易期間讀取端會未命中而讀取資料庫，不會讀到過期狀態
+- 讀取端回填使用 `cache.add`，不會覆蓋寫入端較新的狀態
+- 設有 TTL，快取寫入失敗時最多過期 `CHAT_SESSION_STATE_TTL` 秒
+- 狀態由 worker 寫入、web 讀取，預設快取需跨行程共用（local 與正式環境為 Redis）；
+  行程內的 LocMemCache 會讓 web 讀到過期的 WAITING，系統檢查 `chat.W001` 提出警告
+"""
+
+from __future__ import annotations
+
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils.dateparse import parse_datetime
+
+from maiagent.users.permissions import user_can_view_session
+
+from .models import Message, Session
+
+
+@dataclass(frozen=True)
+class SessionState:
+    status: str
+    last_assistant_message_id: str | None
+    last_activity_at: datetime | None
+    user_id: Any
+    group_id: Any
+
+    def visible_to(self, user: Any) -> bool:
+        return user_can_view_session(user, self.user_id, self.group_id)
+
+    def to_cache(self) -> dict[str, Any]:
+        data = asdict(self)
+        data["last_activity_at"] = self.last_activity_at.isoformat() if self.last_activity_at else None
+        return data
+
+    @classmethod
+    def from_cache(cls, data: dict[str, Any]) -> SessionState:
+        last_activity_at = data.get("last_activity_at")
+        return cls(**{**data, "last_activity_at": parse_datetime(last_activity_at) if last_activity_at else None})
+
+
+def state_key(session_id: Any) -> str:
+    return f"chat:session-state:{session_id}"
+
+
+def _load_from_db(session_id: Any) -> SessionState | None:
+    last_assistant = (
+        Message.objects.filter(session_id=OuterRef("pk"), role=Message.Role.ASSISTANT)
+        .order_by("-sequence_number")
+        .values("id")[:1]
+    )
+    row = (
+        Session.objects.filter(pk=session_id)
+        .annotate(last_assistant_message_id=Subquery(last_assistant))
+        .values("status", "last_assistant_message_id", "last_activity_at", "user_id", "user__group_id")
+        .first()
+    )
+    if row is None:
+        return None
+    return SessionState(
+        status=row["status"],
+        last_assistant_message_id=str(row["last_assistant_message_id"]) if row["last_assistant_message_id"] else None,
+        last_activity_at=row["last_activity_at"],
+        user_id=row["user_id"],
+        group_id=row["user__group_id"],
+    )
+
+
+def peek_session_state(session_id: Any) -> SessionState | None:
+    """僅讀取快取，不查詢資料庫。"""
+    cached = cache.get(state_key(session_id))
+    return SessionState.from_cache(cached) if cached is not None else None
+
+
+def get_session_state(session_id: Any) -> SessionState | None:
+    """先讀快取，未命中時查詢資料庫並回填；會話不存在回傳 None。"""
+    try:
+        session_id = uuid.UUID(str(session_id))
+    except ValueError:
+        return None
+    state = peek_session_state(session_id)
+    if state is not None:
+        return state
+    state = _load_from_db(session_id)
+    if state is not None:
+        cache.add(state_key(session_id), state.to_cache(), settings.CHAT_SESSION_STATE_TTL)
+    return state
+
+
+async def aget_session_state(session_id: Any) -> SessionState | None:
+    cached = await cache.aget(state_key(session_id))
+    if cached is not None:
+        return SessionState.from_cache(cached)
+    return await sync_to_async(get_session_state)(session_id)
+
+
+def last_assistant_message(session_id: Any, state: SessionState) -> Message | None:
+    """取得最新助手訊息；快取有訊息 ID 時以主鍵查詢。"""
+    if state.last_assistant_message_id:
+        message = Message.objects.filter(pk=state.last_assistant_message_id).first()
+        if message is not None:
+            return message
+    return Message.objects.filter(session_id=session_id, role=Message.Role.ASSISTANT).order_by("-sequence_number").first()
+
+
+async def alast_assistant_message(session_id: Any, state: SessionState) -> Message | None:
+    return await sync_to_async(last_assistant_message)(session_id, state)
+
+
+def record_session_state(session: Session, *, last_assistant_message_id: Any = None) -> None:
+    """在寫入 Session 的交易內呼叫：立即刪除快取，提交後寫入新狀態。
+
+    未提供 `last_assistant_message_id` 時沿用快取中的值（僅在 REPLYED 時由讀取端使用）。
+    """
+    key = state_key(session.pk)
+    if last_assistant_message_id is None:
+        previous = cache.get(key)
+        last_assistant_message_id = previous.get("last_assistant_message_id") if previous else None
+    state = SessionState(
+        status=session.status,
+        last_assistant_message_id=str(last_assistant_message_id) if last_assistant_message_id else None,
+        last_activity_at=session.last_activity_at,
+        user_id=session.user_id,
+        group_id=session.user.group_id,
+    )
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.set(key, state.to_cache(), settings.CHAT_SESSION_STATE_TTL))
+
+
+def forget_session_state(session_id: Any) -> None:
+    """會話刪除後清除快取。"""
+    key = state_key(session_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
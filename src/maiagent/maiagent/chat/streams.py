@@ -0,0 +1,167 @@
+"""助手回覆串流。
+
+`process_message` 產生回覆時，逐段寫入該會話的串流（Redis Stream
+`chat:stream:{session_id}`）；SSE 端點讀取並轉送給客戶端，斷線後可依
+`Last-Event-ID` 從中斷處續讀，不需重新產生回覆。
+
+每筆事件皆帶 `reply_to`（對應的使用者訊息 ID），讀取端只轉送目前這一輪的事件：
+
+    {"type": "chunk", "reply_to": "...", "index": 0, "content": "..."}
+    {"type": "done",  "reply_to": "...", "message": {...}}   # 已寫入資料庫的完整 Message
+    {"type": "error", "reply_to": "...", "detail": "..."}
+
+- `RedisReplyStream`：Redis Stream，可跨多個 web / worker 行程
+- `InMemoryReplyStream`：單一行程內的替身，供測試使用
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from functools import cache
+from typing import Any
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+from redis import asyncio as aioredis
+
+from .redis_client import connection_kwargs, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# 串流從頭讀取
+STREAM_START = "0"
+
+Entry = tuple[str, dict[str, Any]]
+
+
+def stream_key(session_id: Any) -> str:
+    return f"chat:stream:{session_id}"
+
+
+class ReplyStream:
+    def reset(self, session_id: Any) -> None:
+        """清除舊的事件，開始新一輪回覆。"""
+        raise NotImplementedError
+
+    def append(self, session_id: Any, event: dict[str, Any]) -> str:
+        """寫入一筆事件，回傳事件 ID。"""
+        raise NotImplementedError
+
+    async def aread(self, session_id: Any, after: str, timeout: float) -> list[Entry]:
+        """讀取 ID 大於 `after` 的事件；沒有事件時最多等待 `timeout` 秒（0 表示不等待）。"""
+        raise NotImplementedError
+
+
+_stream_clients: dict[asyncio.AbstractEventLoop, aioredis.Redis] = {}
+
+
+def _async_client() -> aioredis.Redis:
+    # XREAD BLOCK 會佔用連線，每個事件迴圈使用獨立的連線池
+    loop = asyncio.get_running_loop()
+    client = _stream_clients.get(loop)
+    if client is None:
+        for stale in [other for other in _stream_clients if other.is_closed()]:
+            del _stream_clients[stale]
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.CHAT_STREAM_MAX_READERS,
+            timeout=None,
+            **connection_kwargs(),
+        )
+        client = _stream_clients[loop] = aioredis.Redis(connection_pool=pool)
+    return client
+
+
+def _decode(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisReplyStream(ReplyStream):
+    def reset(self, session_id: Any) -> None:
+        get_redis_client().delete(stream_key(session_id))
+
+    def append(self, session_id: Any, event: dict[str, Any]) -> str:
+        key = stream_key(session_id)
+        pipe = get_redis_client().pipeline()
+        pipe.xadd(key, {"data": json.dumps(event, cls=DjangoJSONEncoder)}, maxlen=settings.CHAT_STREAM_MAXLEN)
+        pipe.expire(key, settings.CHAT_STREAM_TTL)
+        entry_id, _ = pipe.execute()
+        return _decode(entry_id)
+
+    async def aread(self, session_id: Any, after: str, timeout: float) -> list[Entry]:
+        block = int(timeout * 1000) if timeout > 0 else None
+        response = await _async_client().xread({stream_key(session_id): after}, block=block)
+        if not response:
+            return []
+        _, entries = response[0]
+        return [(_decode(entry_id), json.loads(fields[b"data"])) for entry_id, fields in entries]
+
+
+class InMemoryReplyStream(ReplyStream):
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._streams: dict[str, list[Entry]] = {}
+        self._counter = itertools.count(1)
+
+    def reset(self, session_id: Any) -> None:
+        with self._condition:
+            self._streams.pop(stream_key(session_id), None)
+
+    def append(self, session_id: Any, event: dict[str, Any]) -> str:
+        # ID 格式與 Redis Stream 相同（<毫秒>-<序號>），且嚴格遞增
+        data = json.loads(json.dumps(event, cls=DjangoJSONEncoder))
+        with self._condition:
+            entry_id = f"{int(time.time() * 1000)}-{next(self._counter)}"
+            self._streams.setdefault(stream_key(session_id), []).append((entry_id, data))
+            self._condition.notify_all()
+        return entry_id
+
+    def read(self, session_id: Any, after: str, timeout: float) -> list[Entry]:
+        key = stream_key(session_id)
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                entries = [e for e in self._streams.get(key, []) if _id_key(e[0]) > _id_key(after)]
+                remaining = deadline - time.monotonic()
+                if entries or remaining <= 0:
+                    return entries
+                self._condition.wait(remaining)
+
+    async def aread(self, session_id: Any, after: str, timeout: float) -> list[Entry]:
+        return await asyncio.to_thread(self.read, session_id, after, timeout)
+
+
+def _id_key(entry_id: str) -> tuple[int, int]:
+    millis, _, seq = entry_id.partition("-")
+    return int(millis), int(seq or 0)
+
+
+@cache
+def _load_stream(path: str) -> ReplyStream:
+    return import_string(path)()
+
+
+def get_reply_stream() -> ReplyStream:
+    return _load_stream(settings.CHAT_REPLY_STREAM)
+
+
+def publish_stream_event(session_id: Any, event: dict[str, Any]) -> str | None:
+    """寫入串流事件；失敗僅記錄錯誤，回覆仍會寫入資料庫並以通知送達。"""
+    try:
+        return get_reply_stream().append(session_id, event)
+    except Exception:  # noqa: BLE001
+        logger.exception("Failed to append stream event for session %s", session_id)
+        return None
+
+
+def reset_stream(session_id: Any) -> None:
+    try:
+        get_reply_stream().reset(session_id)
+    except Exception:  # noqa: BLE001
+        logger.exception("Failed to reset reply stream for session %s", session_id)
@@ -1,38 +1,484 @@
 from __future__ import annotations
 
-from datetime import datetime
 import logging
-import ssl
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Any, Iterator
 
 from celery import shared_task
+from celery.signals import task_revoked
 from django.conf import settings
-from django.db import connection
-from redis import Redis
+from django.db import connection, transaction
 
-from .models import Message, Session
+from .api.serializers import MessageSerializer
+from .cancellation import CancellationCheck, GenerationCancelled, is_awaiting, is_current
+from .circuit_breaker import CLOSED, CircuitOpenError, get_circuit_breaker, is_failure
+from .deadlines import capped_countdown, expire_reply, expired_count, is_expired, parse_deadline
+from .fair_queue import backlog_by_flow, flow_for
+from .hedging import BACKUP, PRIMARY, Attempt, Hedge, backup_model, hedge_config
+from .hedging import is_enabled as hedging_enabled
+from .llm import LlmError, LlmRequest, get_llm_client
+from .memory import conversation_memory, remember_message
+from .models import LlmModel, Message, Session
+from .notifications import publish_reply
+from .outbox import enqueue_task
+from .rate_limit import get_rate_limiter
+from .redis_client import new_redis_client
+from .response_cache import get_cached_response, is_enabled, record_outcome, response_key, store_response
+from .scenario_cache import ScenarioRuntime, get_runtime
+from .semantic_cache import SemanticQuery
+from .single_flight import SingleFlight
+from .status_cache import record_session_state
+from .streams import publish_stream_event, reset_stream
+from .tokenizers import get_tokenizer
 
+logger = logging.getLogger(__name__)
+
+# LLM 呼叫最終失敗時回覆給使用者的訊息
+LLM_ERROR_REPLY = "抱歉，目前無法產生回覆，請稍後再試。"
+
+
+def select_llm_model(session: Session, llm_model_id: Any = None) -> LlmModel:
+    """提交時指定的模型優先，其次為場景的預設模型，皆無則使用 CHAT_LLM_DEFAULT_MODEL。"""
+    runtime = get_runtime(session.scenario_id)
+    if llm_model_id:
+        # 場景綁定的模型取自場景快取，其他模型才查詢
+        llm_model = runtime.model(llm_model_id) or LlmModel.objects.filter(pk=llm_model_id).first()
+        if llm_model is not None:
+            return llm_model
+    return runtime.default_model or LlmModel(**settings.CHAT_LLM_DEFAULT_MODEL)
+
+
+def fallback_model(runtime: ScenarioRuntime, llm_model: LlmModel) -> LlmModel | None:
+    """斷路器開啟時改用的模型：場景中斷路器允許呼叫的下一個模型（預設模型優先）。"""
+    breaker = get_circuit_breaker()
+    return next((model for model in runtime.other_models(llm_model) if breaker.allow(model)), None)
+
+
+def _llm_params(llm_model: LlmModel, config: dict[str, Any]) -> dict[str, Any]:
+    # 場景設定覆寫模型預設參數
+    return {**(llm_model.params or {}), **(config.get("llm") or {})}
+
+
+def _build_llm_request(
+    session: Session, runtime: ScenarioRuntime, llm_model: LlmModel, user_sequence: int | None
+) -> LlmRequest:
+    """場景提示詞、記憶設定內的最近對話（至本輪使用者訊息為止）與生成參數。"""
+    config = runtime.config
+    return LlmRequest(
+        model=llm_model.name,
+        messages=conversation_memory(
+            session.pk, config.get("memory"), upto=user_sequence, tokenizer=get_tokenizer(llm_model.tokenizer)
+        ),
+        system=runtime.system_prompt,
+        params=_llm_params(llm_model, config),
+    )
+
+
+def _build_hedge(runtime: ScenarioRuntime, llm_model: LlmModel, request: LlmRequest) -> Hedge:
+    """主要模型與場景的下一個模型；備援請求使用相同的對話，模型名稱與參數換成備援模型的。"""
+    config = runtime.config
+    backup = backup_model(runtime, llm_model)
+    if backup is not None and get_circuit_breaker().state(backup) != CLOSED:
+        backup = None
+    timeout = hedge_config(config).get("first_token_timeout", settings.CHAT_HEDGE_FIRST_TOKEN_TIMEOUT)
+    if backup is None:
+        return Hedge(timeout, Attempt(PRIMARY, llm_model, request), None)
+    backup_request = replace(request, model=backup.name, params=_llm_params(backup, config))
+    return Hedge(
+        timeout,
+        Attempt(PRIMARY, llm_model, request),
+        Attempt(BACKUP, backup, backup_request),
+        backup_tokens=_estimate_tokens(backup_request, backup),
+    )
+
+
+def _cached_reply(scenario_id: Any, cache_key: str | None, semantic: SemanticQuery | None) -> str | None:
+    """先查完全比對的快取，未命中再比對語意相近的問題。"""
+    if cache_key is not None:
+        reply = get_cached_response(scenario_id, cache_key)
+        if reply is not None:
+            return reply
+    if semantic is not None:
+        reply = semantic.lookup()
+        if reply is not None:
+            record_outcome(scenario_id, "semantic_hits")
+            return reply
+    return None
+
+
+def _save_reply(session: Session, user_message_id: str, reply_text: str, llm_model: LlmModel) -> Message:
+    """寫入助手回覆；會話已刪除或等待的訊息已被取代時拋出 GenerationCancelled。"""
+    token_count = get_tokenizer(llm_model.tokenizer).count(reply_text)
+    with transaction.atomic():
+        # 鎖定會話資料列：刪除會話與提交新訊息都會寫入此列，鎖定後的 token 比對不會與其交錯
+        if not is_current(session.pk, user_message_id, lock=True):
+            raise GenerationCancelled(f"generation cancelled: session={session.pk}")
+        message = Message.objects.create(
+            session=session, role=Message.Role.ASSISTANT, content=reply_text, token_count=token_count
+        )
+
+        # 更新 Session 狀態為 Replyed
+        session.status = Session.Status.REPLYED
+        session.save(update_fields=["status", "last_activity_at"])
+        # 狀態快取需在通知之前更新，被喚醒的讀取端不會讀到舊狀態
+        record_session_state(session, last_assistant_message_id=message.pk)
+        # 回覆接上對話記憶的快取，下一輪只需讀取新的使用者訊息
+        remember_message(session.pk, message)
+
+        # 提交後才通知，等待端收到事件時資料必定已可見
+        message_data = MessageSerializer(message).data
+        transaction.on_commit(lambda: publish_reply(session.pk, message_data))
+        # 最後一筆串流事件帶完整訊息，讀取端據此結束串流
+        done_event = {"type": "done", "reply_to": user_message_id, "message": message_data}
+        transaction.on_commit(lambda: publish_stream_event(session.pk, done_event))
+    return message
+
+
+def _reply_token_budget(request: LlmRequest) -> int:
+    """速率限制預估的回覆 token 數：生成參數的 max_tokens，未設定時為 CHAT_RATE_LIMIT_REPLY_TOKENS。"""
+    return int(request.params.get("max_tokens") or settings.CHAT_RATE_LIMIT_REPLY_TOKENS)
 
-@shared_task(bind=True, max_retries=3, default_retry_delay=5)
-def process_message(self, session_id: str, user_message_id: str) -> None:
-    session = Session.objects.select_related("scenario").get(pk=session_id)
 
-    # 這裡先以簡單回覆代替 LLM 呼叫
-    reply_text = f"[auto-reply] 收到訊息於 {datetime.utcnow().isoformat()}Z"
+def _estimate_tokens(request: LlmRequest, llm_model: LlmModel) -> int:
+    tokenizer = get_tokenizer(llm_model.tokenizer)
+    prompt = tokenizer.count(request.system) + sum(tokenizer.count(m["content"]) for m in request.messages)
+    return prompt + _reply_token_budget(request)
 
-    Message.objects.create(session=session, role=Message.Role.ASSISTANT, content=reply_text)
 
-    # 更新 Session 狀態為 Replyed
-    session.status = Session.Status.REPLYED
-    session.save(update_fields=["status", "last_activity_at"])
+def _save_whole_reply(session: Session, user_message_id: str, reply_text: str, llm_model: LlmModel) -> None:
+    """不經 LLM 取得的回覆：整段作為單一片段送出後寫入。"""
+    publish_stream_event(session.pk, {"type": "chunk", "reply_to": user_message_id, "index": 0, "content": reply_text})
+    _save_reply(session, user_message_id, reply_text, llm_model)
+
+
+def reply_task_args(session_id: Any, user_message_id: Any, llm_model_id: Any = None) -> list[str]:
+    """重新排入 process_message 時的參數。"""
+    return [str(session_id), str(user_message_id)] + ([str(llm_model_id)] if llm_model_id else [])
+
+
+@dataclass
+class Generation:
+    """需要呼叫 LLM 的一輪回覆：`prepare_generation` 建立，產生回覆後以 `finish_generation` 寫入。
+
+    prefork worker（`process_message`）與 asyncio 執行模式（maiagent/chat/async_worker.py）共用，
+    兩者只有呼叫 LLM 的部分不同。
+    """
+
+    session: Session
+    user_message_id: str
+    llm_model_id: str | None
+    llm_model: LlmModel
+    request: LlmRequest
+    scenario_config: dict[str, Any]
+    cache_key: str | None
+    semantic: SemanticQuery | None
+    flight: SingleFlight | None
+    hedge: Hedge | None = None
+    # 回覆期限（maiagent/chat/deadlines.py），重新排入時沿用
+    deadline: datetime | None = None
+
+    @property
+    def task_args(self) -> list[str]:
+        """重新排入 process_message 時的參數。"""
+        return reply_task_args(self.session.pk, self.user_message_id, self.llm_model_id)
+
+    def share(self, reply_text: str) -> None:
+        if self.flight is not None:
+            self.flight.share(reply_text)
+
+    def release(self) -> None:
+        if self.flight is not None:
+            self.flight.release()
+
+
+def prepare_generation(
+    session_id: str, user_message_id: str, llm_model_id: str | None = None, deadline: datetime | None = None
+) -> Generation | None:
+    """呼叫 LLM 之前的步驟；已回覆、已過期、由快取或合併的請求取得回覆、或延後重新排入時回傳 None。
+
+    回傳的 Generation 若持有 single-flight 鎖，呼叫端需在結束時呼叫 `release()`。
+    """
+    # 場景的設定與模型取自場景快取（maiagent/chat/scenario_cache.py），不另外查詢
+    session = Session.objects.select_related("user").filter(pk=session_id).first()
+    user_sequence = Message.objects.filter(pk=user_message_id).values_list("sequence_number", flat=True).first()
+    if session is None or not is_awaiting(session, user_message_id):
+        # 會話已刪除，或等待的訊息已被新訊息取代（maiagent/chat/cancellation.py）
+        logger.info("Generation cancelled before start: session=%s message=%s", session_id, user_message_id)
+        return None
+
+    # outbox 為至少一次發送：使用者訊息之後已有助手回覆時不再重複產生
+    if user_sequence is not None and Message.objects.filter(
+        session=session, role=Message.Role.ASSISTANT, sequence_number__gt=user_sequence
+    ).exists():
+        logger.info("Reply already generated: session=%s message=%s", session_id, user_message_id)
+        return None
+    if is_expired(deadline):
+        # 重試或延後重新排入後已超過期限，使用者不再等待
+        expire_reply(session_id, user_message_id)
+        return None
+
+    runtime = get_runtime(session.scenario_id)
+    llm_model = select_llm_model(session, llm_model_id)
+    circuit_open = not get_circuit_breaker().allow(llm_model)
+    if circuit_open:
+        fallback = fallback_model(runtime, llm_model)
+        if fallback is not None:
+            logger.warning("Circuit open, falling back: session=%s model=%s fallback=%s", session_id, llm_model, fallback)
+            llm_model, circuit_open = fallback, False
+    request = _build_llm_request(session, runtime, llm_model, user_sequence)
+    scenario_config = runtime.config
+
+    reset_stream(session.pk)
+    request_key = response_key(session.scenario_id, llm_model.provider, request)
+    cache_key = request_key if is_enabled(scenario_config) else None
+    semantic = SemanticQuery.from_request(session.scenario_id, scenario_config, llm_model.provider, request)
+    cached_reply = _cached_reply(session.scenario_id, cache_key, semantic)
+    if cached_reply is not None:
+        # 相同情境已回答過，不呼叫 LLM
+        _save_whole_reply(session, user_message_id, cached_reply, llm_model)
+        return None
+
+    # 相同的請求正由其他任務呼叫 LLM 時使用其結果
+    flight = SingleFlight(request_key, user_message_id) if settings.CHAT_SINGLE_FLIGHT_ENABLED else None
+    shared_reply = flight.join() if flight is not None else None
+    if shared_reply is not None:
+        record_outcome(session.scenario_id, "coalesced")
+        _save_whole_reply(session, user_message_id, shared_reply, llm_model)
+        return None
+    if flight is not None and flight.waiting:
+        # 結果尚未產生：延後重新排入，不在 worker 內等待（prefork 佔用行程、asyncio 執行模式佔用執行緒）
+        enqueue_task(
+            process_message.name,
+            *reply_task_args(session_id, user_message_id, llm_model_id),
+            countdown=settings.CHAT_SINGLE_FLIGHT_POLL_INTERVAL,
+            expires=deadline,
+            **flow_for(session.user),
+        )
+        return None
+
+    generation = Generation(
+        session=session,
+        user_message_id=user_message_id,
+        llm_model_id=llm_model_id,
+        llm_model=llm_model,
+        request=request,
+        scenario_config=scenario_config,
+        cache_key=cache_key,
+        semantic=semantic,
+        flight=flight,
+        deadline=deadline,
+    )
+    if circuit_open:
+        # 斷路器開啟且沒有可用的其他模型：不呼叫 LLM，立即回覆錯誤訊息
+        generation.release()
+        fail_generation(generation, CircuitOpenError(f"circuit open: {llm_model}"))
+        return None
+    # 未綁定模型的場景使用的預設模型沒有資料列，也沒有可切換的模型
+    if hedging_enabled(scenario_config) and not llm_model._state.adding:
+        generation.hedge = _build_hedge(runtime, llm_model, request)
+    try:
+        wait = get_rate_limiter().acquire(llm_model, _estimate_tokens(request, llm_model))
+    except BaseException:
+        generation.release()
+        raise
+    if wait:
+        # 模型的速率額度不足時延後重新排入，不在 worker 內等待
+        generation.release()
+        wait = capped_countdown(wait, deadline)
+        if wait is None:
+            expire_reply(session_id, user_message_id)
+            return None
+        logger.info("LLM rate limited, rescheduling in %.1fs: session=%s model=%s", wait, session_id, llm_model)
+        enqueue_task(
+            process_message.name,
+            *generation.task_args,
+            countdown=wait,
+            expires=generation.deadline,
+            **flow_for(session.user),
+        )
+        return None
+    return generation
+
+
+def publish_chunk(generation: Generation, index: int, chunk: str) -> None:
+    publish_stream_event(
+        generation.session.pk,
+        {"type": "chunk", "reply_to": generation.user_message_id, "index": index, "content": chunk},
+    )
+
+
+def publish_error(generation: Generation, exc: Exception) -> None:
+    publish_stream_event(
+        generation.session.pk, {"type": "error", "reply_to": generation.user_message_id, "detail": str(exc)}
+    )
+
+
+def retry_allowed(exc: LlmError, chunks: list[str], retries: int) -> bool:
+    # 尚未送出片段時才重試，避免串流讀取端收到重複內容
+    return exc.retryable and not chunks and retries < exc.max_retries
+
+
+def retry_countdown(generation: Generation, exc: LlmError, retries: int) -> float | None:
+    """重試前的等待秒數，以回覆期限前剩餘的時間為上限；期限已過時標記回覆逾時並回傳 None。"""
+    countdown = capped_countdown(exc.retry_countdown(retries), generation.deadline)
+    if countdown is None:
+        expire_reply(generation.session.pk, generation.user_message_id)
+    return countdown
+
+
+def fail_generation(generation: Generation, exc: LlmError) -> None:
+    """LLM 呼叫最終失敗：送出錯誤事件並回覆預設錯誤訊息，會話不會停在 WAITING。"""
+    llm_model = generation.llm_model
+    logger.error("LLM call failed: session=%s provider=%s error=%r", generation.session.pk, llm_model.provider, exc)
+    publish_error(generation, exc)
+    _save_reply(generation.session, generation.user_message_id, LLM_ERROR_REPLY, llm_model)
+
+
+def abandon_generation(generation: Generation, reply_text: str) -> None:
+    """生成已取消：不寫入回覆，依已產生的長度退回預扣的回覆 token。"""
+    logger.info("Generation cancelled: session=%s message=%s", generation.session.pk, generation.user_message_id)
+    publish_error(generation, GenerationCancelled("回覆已取消"))
+    token_count = get_tokenizer(generation.llm_model.tokenizer).count(reply_text)
+    get_rate_limiter().adjust(generation.llm_model, token_count - _reply_token_budget(generation.request))
+
+
+def _record_model_outcome(llm_model: LlmModel, first_token_latency: float | None, exc: Exception | None) -> None:
+    if exc is not None:
+        if isinstance(exc, LlmError) and is_failure(exc):
+            get_circuit_breaker().record(llm_model, ok=False)
+        return
+    slow = first_token_latency is not None and first_token_latency > settings.CHAT_CIRCUIT_BREAKER_SLOW_CALL
+    get_circuit_breaker().record(llm_model, ok=not slow)
+
+
+def record_llm_outcome(
+    generation: Generation, first_token_latency: float | None = None, exc: LlmError | None = None
+) -> None:
+    """回報斷路器：provider 端的錯誤或首字延遲超過 CHAT_CIRCUIT_BREAKER_SLOW_CALL 秒為失敗。
+
+    hedging 時每個送出的請求各自以其首字延遲或錯誤回報：落後而被取消的模型以取消前已等待的秒數計算，
+    勝出的模型不代替其回報。需在 `settle_hedge` 將 `llm_model` 換成勝出者之前呼叫。
+    """
+    hedge = generation.hedge
+    if hedge is None:
+        _record_model_outcome(generation.llm_model, first_token_latency, exc)
+        return
+    for attempt in hedge.attempts:
+        if attempt.error is None and attempt.first_token_latency is None:
+            # 首字之前即結束（空白回覆），或整輪回覆已取消
+            continue
+        _record_model_outcome(attempt.llm_model, attempt.first_token_latency, attempt.error)
+
+
+def llm_stream(generation: Generation) -> Iterator[str]:
+    if generation.hedge is not None:
+        return generation.hedge.stream()
+    return get_llm_client(generation.llm_model.provider).stream(generation.request)
+
+
+def settle_hedge(generation: Generation) -> None:
+    """記錄 hedging 決策；備援模型勝出時改以其寫入回覆，並退回被取消的請求預扣的回覆 token。"""
+    hedge = generation.hedge
+    if hedge is None:
+        return
+    if hedge.winner is not None:
+        generation.llm_model = hedge.winner.llm_model
+    loser = hedge.loser
+    if loser is not None:
+        get_rate_limiter().adjust(loser.llm_model, -_reply_token_budget(loser.request))
+    hedge.record(generation.session.scenario_id, generation.user_message_id)
+
+
+def finish_generation(generation: Generation, reply_text: str) -> None:
+    """寫入 LLM 產生的回覆，並更新快取與速率限制的用量。"""
+    # 只快取成功產生的回覆，錯誤訊息不會被重複使用
+    if reply_text:
+        if generation.cache_key is not None:
+            store_response(generation.cache_key, reply_text, generation.scenario_config)
+        if generation.semantic is not None:
+            generation.semantic.store(reply_text)
+    try:
+        reply = _save_reply(generation.session, generation.user_message_id, reply_text, generation.llm_model)
+    except GenerationCancelled:
+        abandon_generation(generation, reply_text)
+        return
+    # 預估時以回覆上限計算，依實際長度退回多扣的 token
+    get_rate_limiter().adjust(generation.llm_model, reply.token_count - _reply_token_budget(generation.request))
+
+
+def _generate_reply(task: Any, generation: Generation) -> str | None:
+    """呼叫 LLM 並逐段寫入串流；最終失敗時寫入預設錯誤訊息並回傳 None。"""
+    # 逐段寫入串流，SSE 客戶端不需等待完整回覆
+    chunks: list[str] = []
+    started, first_token_latency = time.monotonic(), None
+    check = CancellationCheck(generation.session.pk, generation.user_message_id)
+    try:
+        for index, chunk in enumerate(llm_stream(generation)):
+            if first_token_latency is None:
+                first_token_latency = time.monotonic() - started
+            chunks.append(chunk)
+            publish_chunk(generation, index, chunk)
+            # 取消時離開迴圈，串流的 generator 隨之關閉，與 provider 的連線中斷
+            check()
+    except GenerationCancelled:
+        abandon_generation(generation, "".join(chunks))
+        return None
+    except LlmError as exc:
+        record_llm_outcome(generation, exc=exc)
+        retries = task.request.retries
+        if retry_allowed(exc, chunks, retries):
+            countdown = retry_countdown(generation, exc, retries)
+            if countdown is None:
+                return None
+            logger.warning("LLM call failed, retrying: session=%s error=%r", generation.session.pk, exc)
+            raise task.retry(exc=exc, countdown=countdown, max_retries=exc.max_retries)
+        fail_generation(generation, exc)
+        return None
+    except Exception as exc:
+        publish_error(generation, exc)
+        raise
+    else:
+        record_llm_outcome(generation, first_token_latency)
+    finally:
+        settle_hedge(generation)
+    return "".join(chunks)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=5)
+def process_message(self, session_id: str, user_message_id: str, llm_model_id: str | None = None) -> None:
+    try:
+        deadline = parse_deadline(self.request.expires)
+        generation = prepare_generation(session_id, user_message_id, llm_model_id, deadline)
+        if generation is None:
+            return
+        try:
+            reply_text = _generate_reply(self, generation)
+            if reply_text:
+                generation.share(reply_text)
+        finally:
+            generation.release()
+        if reply_text is not None:
+            finish_generation(generation, reply_text)
+    except GenerationCancelled:
+        # 寫入回覆（快取命中、合併或錯誤訊息）時會話已刪除或訊息已被取代
+        logger.info("Generation cancelled: session=%s message=%s", session_id, user_message_id)
+
+
+@task_revoked.connect
+def _expire_dropped_reply(sender: Any = None, request: Any = None, expired: bool = False, **kwargs: Any) -> None:
+    """prefork worker 收到已過期（Celery 的 expires）的 process_message 時不執行，改為標記會話。"""
+    if expired and getattr(sender, "name", None) == process_message.name:
+        expire_reply(*request.args[:2])
 
 
 @shared_task(bind=True, name="maiagent.chat.tasks.system_health_check", max_retries=0)
 def system_health_check(self) -> dict:
-    """簡易系統健康檢查：資料庫與 Redis broker。
+    """簡易系統健康檢查：資料庫、Redis broker、各群組待發送的 AI 任務數、各模型的斷路器狀態與過期的回覆數。
 
     返回各服務狀態，僅做基本可用性檢查。
     """
-    logger = logging.getLogger(__name__)
     results: dict = {"database": "unknown", "redis_broker": "unknown"}
 
     # Database health check
@@ -45,12 +491,31 @@ def system_health_check(self) -> dict:
         results["database"] = f"error: {exc}"
         logger.exception("Database health check failed")
 
+    # 公平排程：各 flow（群組:角色）待發送的回覆任務數
+    try:
+        results["ai_backlog"] = {row["flow"]: row["pending"] for row in backlog_by_flow()}
+    except Exception as exc:  # noqa: BLE001
+        results["ai_backlog"] = f"error: {exc}"
+        logger.exception("AI backlog check failed")
+
+    # 各模型（provider:name）的斷路器狀態：closed / open / half_open
+    try:
+        breaker = get_circuit_breaker()
+        results["llm_circuits"] = {str(model): breaker.state(model) for model in LlmModel.objects.all()}
+    except Exception as exc:  # noqa: BLE001
+        results["llm_circuits"] = f"error: {exc}"
+        logger.exception("Circuit breaker check failed")
+
+    # 回覆期限：未產生回覆即過期而丟棄的任務數（累計）
+    try:
+        results["expired_replies"] = expired_count()
+    except Exception as exc:  # noqa: BLE001
+        results["expired_replies"] = f"error: {exc}"
+        logger.exception("Expired reply count failed")
+
     # Redis (broker) health check
     try:
-        if getattr(settings, "REDIS_SSL", False):
-            client = Redis.from_url(settings.REDIS_URL, ssl_cert_reqs=ssl.CERT_NONE)
-        else:
-            client = Redis.from_url(settings.REDIS_URL)
+        client = new_redis_client()
         client.ping()
         results["redis_broker"] = "ok"
     except Exception as exc:  # noqa: BLE001
@@ -0,0 +1,145 @@
+"""
+非同步端點測試
+測試 polling / retrieve / post_message 的 async view 與同步版本行為一致
+"""
+import asyncio
+import threading
+from unittest.mock import patch
+
+from django.urls import resolve, reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from rolepermissions.roles import assign_role
+
+from maiagent.chat.api import async_views
+from maiagent.chat.api.serializers import MessageSerializer
+from maiagent.chat.models import GroupScenarioAccess, Message, OutboxMessage, Session
+from maiagent.chat.notifications import InMemoryReplyBroker, publish_reply
+from maiagent.chat.tests.factories import (
+    GroupFactory,
+    MessageFactory,
+    ScenarioFactory,
+    SessionFactory,
+    UserFactory,
+)
+
+
+class AsyncSessionAPITestCase(APITestCase):
+    """非同步端點測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        assign_role(self.user, 'employee')
+        self.scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+        self.session = SessionFactory(
+            user=self.user,
+            scenario=self.scenario,
+            status=Session.Status.ACTIVE
+        )
+
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_routes_resolve_to_async_views(self):
+        """測試 polling / detail / messages 路徑由 async view 處理"""
+        polling_url = reverse('api:conversation-polling', kwargs={'pk': str(self.session.id)})
+        detail_url = reverse('api:conversation-detail', kwargs={'pk': str(self.session.id)})
+        messages_url = reverse('api:conversation-post-message-no-session')
+
+        self.assertIs(resolve(polling_url).func, async_views.session_polling)
+        self.assertIs(resolve(detail_url).func, async_views.session_detail)
+        self.assertIs(resolve(messages_url).func, async_views.post_message)
+
+    def test_post_message_creates_message_and_dispatches(self):
+        """測試非同步訊息提交建立訊息並發送任務"""
+        url = reverse('api:conversation-post-message-no-session')
+
+        with patch('maiagent.chat.tasks.process_message.delay') as mock_delay:
+            response = self.client.post(
+                url, {'content': '非同步訊息', 'session_id': str(self.session.id)}, format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()
+        self.assertEqual(data['session_id'], str(self.session.id))
+        self.assertEqual(data['message']['content'], '非同步訊息')
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, Session.Status.WAITING)
+        mock_delay.assert_not_called()
+        outbox = OutboxMessage.objects.get()
+        self.assertEqual(outbox.task_name, 'maiagent.chat.tasks.process_message')
+        self.assertEqual(outbox.args, [str(self.session.id), data['message']['id']])
+
+    def test_post_message_requires_authentication(self):
+        """測試未帶 token 回傳 401"""
+        self.client.credentials()
+        url = reverse('api:conversation-post-message-no-session')
+
+        response = self.client.post(url, {'content': 'x', 'session_id': str(self.session.id)}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_post_message_does_not_wait_for_broker(self):
+        """測試 broker 無法連線時仍回傳 201，任務保留於 outbox"""
+        url = reverse('api:conversation-post-message-no-session')
+
+        with patch('maiagent.chat.tasks.process_message.delay', side_effect=Exception('broker down')):
+            response = self.client.post(
+                url, {'content': '訊息', 'session_id': str(self.session.id)}, format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_retrieve_other_users_session_forbidden(self):
+        """測試查看他人會話回傳 403，不存在的會話回傳 404"""
+        other_session = SessionFactory(scenario=self.scenario)
+
+        forbidden = self.client.get(reverse('api:conversation-detail', kwargs={'pk': str(other_session.id)}))
+        missing = self.client.get(
+            reverse('api:conversation-detail', kwargs={'pk': '00000000-0000-0000-0000-000000000000'})
+        )
+
+        self.assertEqual(forbidden.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_polling_wakes_on_published_reply(self):
+        """測試非同步長輪詢在通知發佈時返回"""
+        Session.objects.filter(pk=self.session.pk).update(status=Session.Status.WAITING)
+        reply = MessageFactory(session=self.session, role=Message.Role.ASSISTANT, content='AI 回覆')
+        url = reverse('api:conversation-polling', kwargs={'pk': str(self.session.id)})
+
+        publisher = threading.Timer(0.2, publish_reply, args=(self.session.id, MessageSerializer(reply).data))
+        publisher.start()
+        response = self.client.get(url, {'timeout': 10})
+        publisher.join()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['id'], str(reply.id))
+
+
+class InMemoryBrokerAsyncTestCase(APITestCase):
+    """非同步訂閱測試案例"""
+
+    def test_many_async_waiters_share_one_event_loop(self):
+        """測試單一事件迴圈可同時等待大量訂閱"""
+        broker = InMemoryReplyBroker()
+
+        async def wait_all():
+            async def waiter(index):
+                async with broker.asubscribe([f'chat:session:{index}']) as subscription:
+                    return await subscription.get(timeout=5)
+
+            tasks = [asyncio.create_task(waiter(i)) for i in range(1000)]
+            await asyncio.sleep(0.1)
+            for i in range(1000):
+                broker.publish(f'chat:session:{i}', {'index': i})
+            return await asyncio.gather(*tasks)
+
+        results = asyncio.run(wait_all())
+
+        self.assertEqual([r['index'] for r in results], list(range(1000)))
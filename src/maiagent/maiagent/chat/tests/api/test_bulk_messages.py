@@ -0,0 +1,94 @@
+"""
+批次匯入訊息 API 測試
+POST /api/v1/conversations/{session_id}/messages/bulk/
+"""
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from rolepermissions.roles import assign_role
+
+from maiagent.chat.models import Message, Session
+from maiagent.chat.status_cache import get_session_state, peek_session_state
+from maiagent.chat.tests.factories import GroupFactory, MessageFactory, SessionFactory, UserFactory
+
+
+class BulkAppendMessagesAPITestCase(APITestCase):
+    """批次匯入訊息測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.admin = UserFactory(group=None, role='admin')
+        assign_role(self.admin, 'admin')
+        self.session = SessionFactory(status=Session.Status.REPLYED)
+        MessageFactory(session=self.session, role=Message.Role.USER, content='原有問題')
+
+        self.authenticate(self.admin)
+        self.url = reverse('api:conversation-bulk-append-messages', kwargs={'pk': str(self.session.id)})
+
+    def authenticate(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_admin_appends_messages_in_order(self):
+        """測試管理人員批次匯入，序號接續既有訊息"""
+        payload = {'messages': [
+            {'role': 'user', 'content': '請問退貨流程？'},
+            {'role': 'assistant', 'content': '請至訂單頁面申請。'},
+        ]}
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()['data']
+        self.assertEqual(data['created_count'], 2)
+        self.assertEqual((data['first_sequence'], data['last_sequence']), (2, 3))
+        contents = list(self.session.messages.order_by('sequence_number').values_list('content', flat=True))
+        self.assertEqual(contents, ['原有問題', '請問退貨流程？', '請至訂單頁面申請。'])
+
+    def test_imported_reply_invalidates_session_state(self):
+        """測試匯入助手訊息後，快取的最新回覆隨之更新"""
+        get_session_state(self.session.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'messages': [{'role': 'assistant', 'content': '匯入的回覆'}]}, format='json')
+
+        self.assertIsNone(peek_session_state(self.session.id))
+        reply = Message.objects.get(session=self.session, role=Message.Role.ASSISTANT)
+        self.assertEqual(get_session_state(self.session.id).last_assistant_message_id, str(reply.id))
+
+    def test_non_admin_is_forbidden(self):
+        """測試主管與員工沒有匯入權限"""
+        group = GroupFactory()
+        for role in ('supervisor', 'employee'):
+            user = UserFactory(group=group, role=role)
+            assign_role(user, role)
+            self.authenticate(user)
+
+            response = self.client.post(self.url, {'messages': [{'role': 'user', 'content': 'x'}]}, format='json')
+
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.session.messages.count(), 1)
+
+    @override_settings(CHAT_BULK_APPEND_MAX_MESSAGES=2)
+    def test_validates_payload(self):
+        """測試空清單、無效角色與超過上限回傳 400"""
+        payloads = [
+            {'messages': []},
+            {'messages': [{'role': 'system', 'content': 'x'}]},
+            {'messages': [{'role': 'user', 'content': 'x'}] * 3},
+        ]
+
+        for payload in payloads:
+            response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.session.messages.count(), 1)
+
+    def test_unknown_session_returns_404(self):
+        """測試會話不存在回傳 404"""
+        url = reverse('api:conversation-bulk-append-messages', kwargs={'pk': '00000000-0000-0000-0000-000000000000'})
+
+        response = self.client.post(url, {'messages': [{'role': 'user', 'content': 'x'}]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
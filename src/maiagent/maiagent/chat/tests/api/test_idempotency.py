@@ -0,0 +1,125 @@
+"""
+Idempotency-Key 測試
+POST /api/v1/conversations/messages/ 帶相同 key 的重送回傳第一次的回應
+"""
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+from rolepermissions.roles import assign_role
+
+from maiagent.chat.api.views import SessionViewSet
+from maiagent.chat.models import GroupScenarioAccess, Message, OutboxMessage, Session
+from maiagent.chat.tests.factories import GroupFactory, ScenarioFactory, SessionFactory, UserFactory
+
+
+class IdempotencyKeyTestCase(APITestCase):
+    """Idempotency-Key 測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        cache.clear()
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        assign_role(self.user, 'employee')
+        self.scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+        self.session = SessionFactory(user=self.user, scenario=self.scenario, status=Session.Status.ACTIVE)
+        self.authenticate(self.user)
+        self.url = reverse('api:conversation-post-message-no-session')
+        self.payload = {'content': '你好', 'session_id': str(self.session.id)}
+
+    def authenticate(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def post(self, payload=None, key='key-1', commit=True):
+        headers = {'Idempotency-Key': key} if key is not None else {}
+        with self.captureOnCommitCallbacks(execute=commit):
+            return self.client.post(self.url, payload or self.payload, format='json', headers=headers)
+
+    def test_replay_returns_original_response(self):
+        """測試重送回傳原本的 201，不建立訊息、不寫入 outbox、不讀寫會話"""
+        first = self.post()
+
+        with CaptureQueriesContext(connection) as ctx:
+            replay = self.post()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replay.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(Message.objects.filter(session=self.session).count(), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        touched = [q['sql'] for q in ctx.captured_queries if 'chat_' in q['sql']]
+        self.assertEqual(touched, [])
+
+    def test_different_payload_with_same_key_is_rejected(self):
+        """測試同一個 key 用於不同內容回傳 422"""
+        self.post()
+
+        response = self.post({**self.payload, 'content': '另一則'})
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_concurrent_retry_returns_409(self):
+        """測試第一次請求仍在處理中時重送回傳 409"""
+        # 第一次請求的交易尚未提交：回應尚未保存，只有處理中標記
+        self.post(key='in-flight', commit=False)
+
+        response = self.post(key='in-flight')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_failed_request_releases_key(self):
+        """測試失敗的請求不保存回應，可用同一個 key 重試"""
+        bad = self.post({'content': '你好', 'session_id': '00000000-0000-0000-0000-000000000000'})
+        self.assertEqual(bad.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.post({'content': '你好', 'session_id': '00000000-0000-0000-0000-000000000000'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+    def test_keys_are_scoped_per_user(self):
+        """測試不同使用者使用相同 key 互不影響"""
+        self.post()
+        other = UserFactory(group=self.group)
+        assign_role(other, 'employee')
+        self.authenticate(other)
+
+        response = self.post({'content': '你好', 'scenario_id': str(self.scenario.id)})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(response.json()['session_id'], str(self.session.id))
+
+    def test_invalid_key_returns_400(self):
+        """測試過長的 key 回傳 400"""
+        response = self.post(key='x' * 256)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Message.objects.exists())
+
+    def test_sync_viewset_action(self):
+        """測試同步 ViewSet 版本（CHAT_ASYNC_API 關閉時使用）"""
+        view = SessionViewSet.as_view({'post': 'post_message_no_session'})
+
+        def request():
+            req = APIRequestFactory().post(
+                '/api/v1/conversations/messages/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='sync-key'
+            )
+            force_authenticate(req, user=self.user)
+            return view(req)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = request()
+        replay = request()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(Message.objects.filter(session=self.session).count(), 1)
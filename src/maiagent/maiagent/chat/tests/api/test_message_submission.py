@@ -13,7 +13,7 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from maiagent.chat.models import Group, GroupScenarioAccess, Message, Scenario, Session
+from maiagent.chat.models import Group, GroupScenarioAccess, Message, OutboxMessage, Scenario, Session
 from maiagent.chat.tests.factories import (
     GroupFactory,
     LlmModelFactory, 
@@ -85,8 +85,9 @@ class MessageSubmissionAPITestCase(APITestCase):
         self.assertEqual(message.content, '測試訊息內容')
         self.assertEqual(message.session, self.session)
         
-        # 驗證 Celery 任務已發送
-        mock_delay.assert_called_once()
+        # 驗證回覆任務已寫入 outbox（由 relay_outbox 發送，請求不直接呼叫 broker）
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        mock_delay.assert_not_called()
     
     def test_submit_message_with_session_id_in_body(self):
         """測試使用現有會話（請求體中的session_id）"""
@@ -105,8 +106,9 @@ class MessageSubmissionAPITestCase(APITestCase):
         self.assertEqual(response_data['session_id'], str(self.session.id))
         self.assertEqual(response_data['message']['content'], '測試訊息內容')
         
-        # 驗證 Celery 任務已發送
-        mock_delay.assert_called_once()
+        # 驗證回覆任務已寫入 outbox（由 relay_outbox 發送，請求不直接呼叫 broker）
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        mock_delay.assert_not_called()
     
     def test_submit_message_create_new_session(self):
         """測試建立新會話"""
@@ -135,8 +137,9 @@ class MessageSubmissionAPITestCase(APITestCase):
         # 驗證訊息已儲存
         self.assertEqual(response_data['message']['content'], '新會話測試訊息')
         
-        # 驗證 Celery 任務已發送
-        mock_delay.assert_called_once()
+        # 驗證回覆任務已寫入 outbox（由 relay_outbox 發送，請求不直接呼叫 broker）
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        mock_delay.assert_not_called()
     
     def test_submit_message_with_llm_model_id(self):
         """測試指定 LLM 模型"""
@@ -151,7 +154,8 @@ class MessageSubmissionAPITestCase(APITestCase):
             response = self.client.post(url, data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        mock_delay.assert_called_once()
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        mock_delay.assert_not_called()
 
 
 class MessageSubmissionErrorHandlingTestCase(APITestCase):
@@ -278,7 +282,7 @@ class MessageSubmissionErrorHandlingTestCase(APITestCase):
         self.assertEqual(response_data['detail'], '會話狀態不允許提交訊息')
     
     def test_submit_message_celery_failure(self):
-        """測試 Celery 服務失敗"""
+        """測試 Celery broker 無法連線時仍接受訊息，任務保留於 outbox"""
         # 建立群組場景存取權
         GroupScenarioAccess.objects.create(
             group=self.group,
@@ -297,10 +301,10 @@ class MessageSubmissionErrorHandlingTestCase(APITestCase):
             
             response = self.client.post(url, data, format='json')
         
-        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         
-        response_data = response.json()
-        self.assertIn('訊息處理服務暫時不可用', response_data['detail'])
+        outbox = OutboxMessage.objects.get()
+        self.assertEqual(outbox.args, [response.json()['session_id'], response.json()['message']['id']])
     
     def test_submit_message_nonexistent_llm_model(self):
         """測試不存在的 LLM 模型"""
@@ -0,0 +1,135 @@
+"""
+多會話批次輪詢 API 測試
+POST /api/v1/conversations/poll-batch/
+"""
+import threading
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+from rolepermissions.roles import assign_role
+
+from maiagent.chat import services
+from maiagent.chat.api.views import SessionViewSet
+from maiagent.chat.models import GroupScenarioAccess, Message, Session
+from maiagent.chat.notifications import publish_reply
+from maiagent.chat.tests.factories import (
+    GroupFactory,
+    MessageFactory,
+    ScenarioFactory,
+    SessionFactory,
+    UserFactory,
+)
+
+
+class PollBatchAPITestCase(APITestCase):
+    """批次輪詢測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        assign_role(self.user, 'employee')
+        self.scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+
+        self.session_a = SessionFactory(user=self.user, scenario=self.scenario, status=Session.Status.WAITING)
+        self.session_b = SessionFactory(user=self.user, scenario=self.scenario, status=Session.Status.REPLYED)
+        MessageFactory(session=self.session_a, role=Message.Role.USER, content='問題 A')
+        MessageFactory(session=self.session_b, role=Message.Role.USER, content='問題 B')
+        self.reply_b = MessageFactory(session=self.session_b, role=Message.Role.ASSISTANT, content='回覆 B')
+
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.url = reverse('api:conversation-poll-batch')
+
+    def cursors(self, *pairs):
+        return [{'session_id': str(session.id), 'last_sequence': seq} for session, seq in pairs]
+
+    def test_returns_sessions_with_new_assistant_messages(self):
+        """測試只回傳有新助手訊息的會話，且僅以單一查詢讀取訊息"""
+        payload = {'sessions': self.cursors((self.session_a, 1), (self.session_b, 1)), 'timeout': 1}
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sessions = response.json()['data']['sessions']
+        self.assertEqual(len(sessions), 1)
+        self.assertEqual(sessions[0]['session_id'], str(self.session_b.id))
+        self.assertEqual([m['id'] for m in sessions[0]['messages']], [str(self.reply_b.id)])
+        self.assertEqual(sessions[0]['last_sequence'], self.reply_b.sequence_number)
+        message_queries = [q for q in ctx.captured_queries if 'FROM "chat_message"' in q['sql']]
+        self.assertEqual(len(message_queries), 1)
+
+    def test_no_updates_returns_204(self):
+        """測試皆無更新時逾時回傳 204"""
+        payload = {
+            'sessions': self.cursors((self.session_a, 1), (self.session_b, self.reply_b.sequence_number)),
+            'timeout': 1,
+        }
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_other_users_sessions_are_ignored(self):
+        """測試他人的會話即使有新訊息也不回傳"""
+        other = SessionFactory(scenario=self.scenario, status=Session.Status.REPLYED)
+        MessageFactory(session=other, role=Message.Role.ASSISTANT, content='他人的回覆')
+
+        response = self.client.post(self.url, {'sessions': self.cursors((other, 0)), 'timeout': 1}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_long_poll_wakes_on_reply(self):
+        """測試等待中收到任一會話的通知後重新查詢並回傳"""
+        real_query = services.new_assistant_messages
+        calls = []
+
+        def query_after_first_call(user, cursors):
+            calls.append(cursors)
+            return {} if len(calls) == 1 else real_query(user, cursors)
+
+        publisher = threading.Timer(0.2, publish_reply, args=(self.session_b.id, {'id': str(self.reply_b.id)}))
+        payload = {'sessions': self.cursors((self.session_a, 1), (self.session_b, 1)), 'timeout': 10}
+        with patch('maiagent.chat.api.async_views.new_assistant_messages', side_effect=query_after_first_call):
+            publisher.start()
+            response = self.client.post(self.url, payload, format='json')
+            publisher.join()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(response.json()['data']['sessions'][0]['session_id'], str(self.session_b.id))
+
+    @override_settings(CHAT_POLL_BATCH_MAX_SESSIONS=2)
+    def test_validates_payload(self):
+        """測試空清單與超過上限回傳 400"""
+        empty = self.client.post(self.url, {'sessions': []}, format='json')
+        too_many = self.client.post(
+            self.url,
+            {'sessions': self.cursors((self.session_a, 0), (self.session_b, 0), (SessionFactory(), 0))},
+            format='json',
+        )
+
+        self.assertEqual(empty.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(too_many.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sync_viewset_action(self):
+        """測試同步 ViewSet 版本（CHAT_ASYNC_API 關閉時使用）"""
+        view = SessionViewSet.as_view({'post': 'poll_batch'})
+        request = APIRequestFactory().post(
+            '/api/v1/conversations/poll-batch/',
+            {'sessions': self.cursors((self.session_b, 0)), 'timeout': 1},
+            format='json',
+        )
+        force_authenticate(request, user=self.user)
+
+        response = view(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['sessions'][0]['session_id'], str(self.session_b.id))
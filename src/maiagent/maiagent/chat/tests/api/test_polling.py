@@ -0,0 +1,103 @@
+"""
+長輪詢 API 測試
+測試 polling 由 process_message 通知喚醒，等待期間不查詢資料庫
+"""
+import threading
+import time
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from rolepermissions.roles import assign_role
+
+from maiagent.chat.api.serializers import MessageSerializer
+from maiagent.chat.models import GroupScenarioAccess, Message, Session
+from maiagent.chat.notifications import publish_reply
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import (
+    GroupFactory,
+    MessageFactory,
+    ScenarioFactory,
+    SessionFactory,
+    UserFactory,
+)
+
+
+class SessionPollingAPITestCase(APITestCase):
+    """長輪詢測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        assign_role(self.user, 'employee')
+        self.scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+        self.session = SessionFactory(
+            user=self.user,
+            scenario=self.scenario,
+            status=Session.Status.WAITING
+        )
+        MessageFactory(session=self.session, role=Message.Role.USER)
+
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.url = reverse('api:conversation-polling', kwargs={'pk': str(self.session.id)})
+
+    def test_polling_returns_existing_reply_immediately(self):
+        """測試會話已回覆時立即回傳最後一則助手訊息"""
+        reply = MessageFactory(session=self.session, role=Message.Role.ASSISTANT, content='已回覆')
+        Session.objects.filter(pk=self.session.pk).update(status=Session.Status.REPLYED)
+
+        response = self.client.get(self.url, {'timeout': 5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['id'], str(reply.id))
+
+    def test_polling_wakes_on_published_reply(self):
+        """測試等待中的輪詢在通知發佈時立即返回"""
+        reply = MessageFactory(session=self.session, role=Message.Role.ASSISTANT, content='AI 回覆')
+        message_data = MessageSerializer(reply).data
+
+        publisher = threading.Timer(0.2, publish_reply, args=(self.session.id, message_data))
+        publisher.start()
+        started = time.monotonic()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'timeout': 10})
+        elapsed = time.monotonic() - started
+        publisher.join()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['content'], 'AI 回覆')
+        self.assertLess(elapsed, 5)
+        # 等待期間不輪詢資料庫：查詢數與等待時間無關
+        self.assertLess(len(queries), 10)
+
+    def test_polling_times_out_with_no_content(self):
+        """測試逾時仍無回覆時回傳 204"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'timeout': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertLess(len(queries), 10)
+
+    def test_process_message_publishes_after_commit(self):
+        """測試 process_message 於提交後才發佈回覆通知"""
+        user_message = self.session.messages.first()
+
+        with patch('maiagent.chat.tasks.publish_reply') as mock_publish:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                process_message.run(str(self.session.id), str(user_message.id))
+            mock_publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        assistant = Message.objects.get(session=self.session, role=Message.Role.ASSISTANT)
+        mock_publish.assert_called_once()
+        session_id, message_data = mock_publish.call_args.args
+        self.assertEqual(session_id, self.session.id)
+        self.assertEqual(message_data['id'], str(assistant.id))
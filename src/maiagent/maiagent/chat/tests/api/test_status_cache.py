@@ -0,0 +1,196 @@
+"""
+會話狀態快取測試
+測試 WAITING → REPLYED 轉換時快取與資料庫的一致性、熱路徑改讀快取，
+以及 web 與 worker 的設定使用跨行程共用的快取
+"""
+import os
+import subprocess
+import sys
+import uuid
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from redis import Redis
+from redis.exceptions import RedisError
+from rolepermissions.roles import assign_role
+
+from maiagent.chat import status_cache
+from maiagent.chat.checks import check_shared_cache
+from maiagent.chat.models import GroupScenarioAccess, Message, Session
+from maiagent.chat.status_cache import get_session_state, peek_session_state
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import (
+    GroupFactory,
+    ScenarioFactory,
+    SessionFactory,
+    UserFactory,
+)
+
+
+# 以 web 與 worker 的設定模組啟動 Django 所需的環境變數（正式環境的必要設定以假值代替）
+SETTINGS_ENV = {
+    'USE_DOCKER': 'no',
+    'DJANGO_SECRET_KEY': 'test',
+    'DJANGO_ADMIN_URL': 'admin/',
+    'DJANGO_AWS_ACCESS_KEY_ID': 'test',
+    'DJANGO_AWS_SECRET_ACCESS_KEY': 'test',
+    'DJANGO_AWS_STORAGE_BUCKET_NAME': 'test',
+    'MAILGUN_API_KEY': 'test',
+    'MAILGUN_DOMAIN': 'test',
+}
+
+
+def redis_available():
+    try:
+        return Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1).ping()
+    except RedisError:
+        return False
+
+
+def run_with_settings(module, code):
+    """以指定的設定模組在新的行程中執行程式碼，回傳標準輸出"""
+    env = {**os.environ, **SETTINGS_ENV, 'DJANGO_SETTINGS_MODULE': module, 'REDIS_URL': settings.REDIS_URL}
+    result = subprocess.run(
+        [sys.executable, '-c', f'import django; django.setup(); {code}'],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=60, check=True,
+    )
+    return result.stdout.strip()
+
+
+def session_queries(queries):
+    """篩選出查詢 chat_session 資料表的 SQL"""
+    return [q['sql'] for q in queries if 'FROM "chat_session"' in q['sql']]
+
+
+class SessionStateCacheTestCase(APITestCase):
+    """會話狀態快取測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        assign_role(self.user, 'employee')
+        self.scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+        self.session = SessionFactory(user=self.user, scenario=self.scenario, status=Session.Status.ACTIVE)
+
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.messages_url = reverse('api:conversation-post-message-no-session')
+        self.polling_url = reverse('api:conversation-polling', kwargs={'pk': str(self.session.id)})
+
+    def submit(self, content='你好'):
+        with patch('maiagent.chat.tasks.process_message.delay'), self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                self.messages_url, {'content': content, 'session_id': str(self.session.id)}, format='json'
+            )
+
+    def test_waiting_to_replyed_transition(self):
+        """測試 WAITING → REPLYED：交易期間不會讀到舊狀態，提交後快取與資料庫一致"""
+        response = self.submit()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user_message_id = response.json()['message']['id']
+        self.assertEqual(peek_session_state(self.session.id).status, Session.Status.WAITING)
+
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=False) as callbacks:
+            process_message(str(self.session.id), user_message_id)
+
+            # 提交前：快取已失效，讀取端回到資料庫
+            self.assertIsNone(peek_session_state(self.session.id))
+
+        for callback in callbacks:
+            callback()
+
+        reply = Message.objects.get(session=self.session, role=Message.Role.ASSISTANT)
+        state = peek_session_state(self.session.id)
+        self.session.refresh_from_db()
+        self.assertEqual(state.status, Session.Status.REPLYED)
+        self.assertEqual(state.status, self.session.status)
+        self.assertEqual(state.last_assistant_message_id, str(reply.id))
+        self.assertEqual(state.last_activity_at, self.session.last_activity_at)
+
+        # 熱路徑：polling 由快取取得狀態，不查詢 chat_session
+        with CaptureQueriesContext(connection) as ctx:
+            polled = self.client.get(self.polling_url, {'timeout': 1})
+        self.assertEqual(polled.status_code, status.HTTP_200_OK)
+        self.assertEqual(polled.json()['id'], str(reply.id))
+        self.assertEqual(session_queries(ctx.captured_queries), [])
+
+    def test_backfill_does_not_overwrite_newer_state(self):
+        """測試讀取端回填不會覆蓋寫入端提交後的新狀態"""
+        stale = status_cache.SessionState(
+            status=Session.Status.WAITING,
+            last_assistant_message_id=None,
+            last_activity_at=None,
+            user_id=self.user.pk,
+            group_id=self.group.pk,
+        )
+        self.submit()
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            process_message(str(self.session.id), str(Message.objects.get(session=self.session).id))
+
+        with patch.object(status_cache, '_load_from_db', return_value=stale):
+            state = get_session_state(self.session.id)
+
+        self.assertEqual(state.status, Session.Status.REPLYED)
+        self.assertEqual(peek_session_state(self.session.id).status, Session.Status.REPLYED)
+
+    def test_cache_miss_falls_back_to_database(self):
+        """測試快取未命中時讀取資料庫並回填"""
+        self.assertIsNone(peek_session_state(self.session.id))
+
+        state = get_session_state(self.session.id)
+
+        self.assertEqual(state.status, Session.Status.ACTIVE)
+        self.assertEqual(peek_session_state(self.session.id), state)
+        self.assertIsNone(get_session_state('not-a-uuid'))
+
+    def test_waiting_session_rejects_message_from_cache(self):
+        """測試快取顯示 WAITING 時直接拒絕提交，不查詢 chat_session"""
+        self.submit()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.submit('第二則')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(session_queries(ctx.captured_queries), [])
+
+    def test_cached_state_respects_visibility(self):
+        """測試快取命中時仍依角色判斷可見性"""
+        other = SessionFactory(scenario=self.scenario, status=Session.Status.REPLYED)
+        get_session_state(other.id)
+
+        response = self.client.get(reverse('api:conversation-polling', kwargs={'pk': str(other.id)}), {'timeout': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SharedCacheTestCase(SimpleTestCase):
+    """web 與 worker 共用快取測試案例"""
+
+    @skipUnless(redis_available(), '需要可連線的 REDIS_URL')
+    def test_settings_share_cache_across_processes(self):
+        """測試 web 與 worker 的設定：一個行程寫入的快取，另一個行程以自己的快取實例讀得到"""
+        for module in ('config.settings.local', 'config.settings.production'):
+            with self.subTest(module=module):
+                key = f'chat:test-shared-cache:{uuid.uuid4()}'
+                run_with_settings(module, f"from django.core.cache import cache; cache.set('{key}', 'Replyed', 30)")
+                value = run_with_settings(module, f"from django.core.cache import cache; print(cache.get('{key}'))")
+                self.assertEqual(value, Session.Status.REPLYED)
+
+    def test_process_local_cache_is_reported(self):
+        """測試預設快取為行程內的 LocMemCache 時，系統檢查提出警告"""
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            warnings = check_shared_cache()
+        self.assertEqual([warning.id for warning in warnings], ['chat.W001'])
+
+        with override_settings(CACHES={'default': {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': ''}}):
+            self.assertEqual(check_shared_cache(), [])
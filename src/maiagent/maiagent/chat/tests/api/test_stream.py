@@ -0,0 +1,135 @@
+"""
+回覆串流（SSE）測試
+測試 process_message 逐段寫入串流，以及 /stream/ 端點的轉送與續讀
+"""
+import json
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from rolepermissions.roles import assign_role
+
+from maiagent.chat.models import GroupScenarioAccess, Message, Session
+from maiagent.chat.streams import get_reply_stream
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import (
+    GroupFactory,
+    MessageFactory,
+    ScenarioFactory,
+    SessionFactory,
+    UserFactory,
+)
+
+
+def parse_sse(body):
+    """將 SSE 內容解析為 (id, event, data) 清單"""
+    events = []
+    for block in body.split('\n\n'):
+        fields = {}
+        for line in block.splitlines():
+            name, _, value = line.partition(': ')
+            fields[name] = value
+        if 'event' in fields:
+            events.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class ReplyStreamTestCase(APITestCase):
+    """回覆串流測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        assign_role(self.user, 'employee')
+        self.scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+        self.session = SessionFactory(user=self.user, scenario=self.scenario, status=Session.Status.WAITING)
+        self.user_message = MessageFactory(session=self.session, role=Message.Role.USER, content='你好')
+        self.reply_to = str(self.user_message.id)
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.url = reverse('api:conversation-stream', kwargs={'pk': str(self.session.id)})
+        self.stream = get_reply_stream()
+
+    async def read_events(self, **headers):
+        response = await self.async_client.get(self.url, headers={'authorization': f'Bearer {self.token}', **headers})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return parse_sse(body)
+
+    def test_process_message_streams_chunks_then_done(self):
+        """測試 process_message 先寫入片段，提交後寫入帶完整訊息的 done"""
+        with self.captureOnCommitCallbacks(execute=True):
+            process_message(str(self.session.id), self.reply_to)
+
+        entries = self.stream.read(self.session.id, '0', timeout=0)
+        events = [event for _, event in entries]
+        reply = Message.objects.get(session=self.session, role=Message.Role.ASSISTANT)
+
+        self.assertGreater(len(events), 2)
+        self.assertTrue(all(e['reply_to'] == self.reply_to for e in events))
+        self.assertEqual([e['type'] for e in events[:-1]], ['chunk'] * (len(events) - 1))
+        self.assertEqual(''.join(e['content'] for e in events[:-1]), reply.content)
+        self.assertEqual(events[-1]['type'], 'done')
+        self.assertEqual(events[-1]['message']['id'], str(reply.id))
+
+    def test_done_is_published_only_after_commit(self):
+        """測試交易提交前不寫入 done"""
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=False):
+            process_message(str(self.session.id), self.reply_to)
+
+        events = [event for _, event in self.stream.read(self.session.id, '0', timeout=0)]
+
+        self.assertNotIn('done', [e['type'] for e in events])
+
+    async def test_relays_current_reply_until_done(self):
+        """測試只轉送本輪回覆的事件，收到 done 後結束"""
+        self.stream.append(self.session.id, {'type': 'chunk', 'reply_to': 'previous', 'index': 0, 'content': '舊'})
+        self.stream.append(self.session.id, {'type': 'chunk', 'reply_to': self.reply_to, 'index': 0, 'content': '新'})
+        self.stream.append(self.session.id, {'type': 'done', 'reply_to': self.reply_to, 'message': {'content': '新'}})
+
+        events = await self.read_events()
+
+        self.assertEqual([e[1] for e in events], ['chunk', 'done'])
+        self.assertEqual(events[0][2]['content'], '新')
+        self.assertTrue(all(event_id for event_id, _, _ in events))
+
+    async def test_resumes_after_last_event_id(self):
+        """測試帶 Last-Event-ID 時從中斷處續讀"""
+        first = self.stream.append(self.session.id, {'type': 'chunk', 'reply_to': self.reply_to, 'index': 0, 'content': 'a'})
+        self.stream.append(self.session.id, {'type': 'chunk', 'reply_to': self.reply_to, 'index': 1, 'content': 'b'})
+        self.stream.append(self.session.id, {'type': 'done', 'reply_to': self.reply_to, 'message': {'content': 'ab'}})
+
+        events = await self.read_events(**{'last-event-id': first})
+
+        self.assertEqual([(e[1], e[2].get('index')) for e in events], [('chunk', 1), ('done', None)])
+
+    async def test_replied_session_returns_persisted_message(self):
+        """測試回覆已寫入資料庫時直接回傳 done"""
+        reply = await sync_to_async(MessageFactory)(session=self.session, role=Message.Role.ASSISTANT, content='完成')
+        await Session.objects.filter(pk=self.session.pk).aupdate(status=Session.Status.REPLYED)
+
+        events = await self.read_events()
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0][1], 'done')
+        self.assertEqual(events[0][2]['message']['id'], str(reply.id))
+
+    def test_accepts_query_token_and_rejects_bad_event_id(self):
+        """測試 EventSource 可用 ?token= 驗證，Last-Event-ID 格式錯誤回傳 400"""
+        response = self.client.get(self.url, {'token': self.token, 'last_event_id': 'abc'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_session_not_found(self):
+        """測試無法串流他人會話"""
+        other = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+        url = reverse('api:conversation-stream', kwargs={'pk': str(other.id)})
+
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,141 @@
+"""
+asyncio 執行模式測試
+測試 aprocess_message 與 process_message 產生相同的回覆與串流事件、可重試錯誤與未到期的任務經 outbox 重新排入，
+以及多個回覆在同一個事件迴圈上同時進行
+"""
+import asyncio
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase
+from django.utils import timezone
+
+from maiagent.chat.async_worker import AsyncWorker, aprocess_message
+from maiagent.chat.llm import LlmRateLimitError, get_llm_client
+from maiagent.chat.models import LlmModel, Message, OutboxMessage, ScenarioModel, Session
+from maiagent.chat.outbox import relay_batch
+from maiagent.chat.streams import get_reply_stream
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+
+
+async def run_in_test_thread(func, *args):
+    # 測試資料在主執行緒的交易中，同步步驟需回到主執行緒執行才看得到
+    return await sync_to_async(func)(*args)
+
+
+class AsyncProcessMessageTestCase(TestCase):
+    """aprocess_message 測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.scenario = ScenarioFactory()
+        self.llm_model = LlmModel.objects.create(provider='fake', name='fake-gpt')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=self.llm_model, is_default=True)
+        patcher = patch('maiagent.chat.async_worker.run_sync', run_in_test_thread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def waiting_session(self, content='退貨流程？'):
+        session = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+        return session, MessageFactory(session=session, role=Message.Role.USER, content=content)
+
+    def run_async(self, coroutine_function, *args, **kwargs):
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            return async_to_sync(coroutine_function)(*args, **kwargs)
+
+    def test_reply_is_streamed_and_saved(self):
+        """測試以 astream 產生回覆，逐段寫入串流後寫入助手訊息"""
+        session, user_message = self.waiting_session()
+
+        self.run_async(aprocess_message, str(session.id), str(user_message.id))
+
+        session.refresh_from_db()
+        reply = Message.objects.get(session=session, role=Message.Role.ASSISTANT)
+        self.assertEqual(session.status, Session.Status.REPLYED)
+        self.assertEqual(reply.content, '[fake-gpt] 收到：退貨流程？')
+        self.assertIsNotNone(reply.token_count)
+        events = [event for _, event in get_reply_stream().read(session.id, '0', timeout=0)]
+        self.assertEqual(''.join(e['content'] for e in events if e['type'] == 'chunk'), reply.content)
+        self.assertEqual(events[-1]['type'], 'done')
+
+    def test_retryable_error_is_sent_back_through_outbox(self):
+        """測試可重試的錯誤以 countdown 與遞增的重試次數經 outbox 重新排入，relay 帶重試次數發送"""
+        session, user_message = self.waiting_session()
+        client = get_llm_client('fake')
+
+        async def failing_stream(request):
+            raise LlmRateLimitError('429', retry_after=7)
+            yield  # pragma: no cover
+
+        before = timezone.now()
+        with patch.object(client, 'astream', failing_stream):
+            self.run_async(aprocess_message, str(session.id), str(user_message.id), retries=1)
+
+        row = OutboxMessage.objects.get(task_name='maiagent.chat.tasks.process_message')
+        self.assertEqual(row.args, [str(session.id), str(user_message.id)])
+        self.assertEqual(row.retries, 2)
+        self.assertAlmostEqual((row.available_at - before).total_seconds(), 7, delta=1)
+        session.refresh_from_db()
+        self.assertEqual(session.status, Session.Status.WAITING)
+
+        OutboxMessage.objects.update(available_at=timezone.now())
+        with patch('maiagent.chat.outbox.current_app') as app, \
+                patch('maiagent.chat.fair_queue.ready_count', return_value=0):
+            relay_batch(10)
+        app.send_task.assert_called_once_with(
+            'maiagent.chat.tasks.process_message', args=row.args, expires=None, retries=2
+        )
+
+    def test_future_eta_is_deferred_through_outbox(self):
+        """測試帶 eta 的任務未到期時經 outbox 延後並 ack，不佔用並行名額等待"""
+        session, user_message = self.waiting_session()
+        worker = AsyncWorker(concurrency=1)
+        eta = (timezone.now() + timedelta(seconds=30)).isoformat()
+        headers = {'task': 'maiagent.chat.tasks.process_message', 'id': 't1', 'retries': 1, 'eta': eta}
+        message = MagicMock(headers=headers)
+
+        with patch('maiagent.chat.async_worker.aprocess_message') as aprocess:
+            self.run_async(worker._handle, [[str(session.id), str(user_message.id)], {}, {}], message)
+
+        aprocess.assert_not_called()
+        self.assertIs(worker._acks.get_nowait(), message)
+        row = OutboxMessage.objects.get(task_name='maiagent.chat.tasks.process_message')
+        self.assertEqual(row.retries, 1)
+        self.assertGreater(row.available_at, timezone.now() + timedelta(seconds=25))
+
+    def test_threads_default_to_concurrency(self):
+        """測試執行緒數預設與並行上限相同"""
+        with self.settings(CHAT_ASYNC_WORKER_THREADS=0):
+            self.assertEqual(AsyncWorker(concurrency=50).threads, 50)
+
+    def test_generations_run_concurrently(self):
+        """測試多個回覆在同一個事件迴圈上同時等待 LLM"""
+        pending = [self.waiting_session(f'問題 {i}') for i in range(20)]
+        client = get_llm_client('fake')
+
+        async def run_all():
+            await asyncio.gather(*(aprocess_message(str(s.id), str(m.id)) for s, m in pending))
+
+        started = time.monotonic()
+        with patch.object(client, 'default', client.default.updated({'first_token_latency': 0.2})):
+            self.run_async(run_all)
+
+        # 依序執行需 4 秒以上
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(Message.objects.filter(role=Message.Role.ASSISTANT).count(), 20)
+
+    def test_worker_acks_after_handling(self):
+        """測試 worker 完成任務後才 ack，不支援的任務記錄錯誤後同樣 ack"""
+        session, user_message = self.waiting_session()
+        worker = AsyncWorker(concurrency=1, threads=1)
+        message = MagicMock(headers={'task': 'maiagent.chat.tasks.process_message', 'id': 't1', 'retries': 0})
+        unsupported = MagicMock(headers={'task': 'maiagent.chat.tasks.system_health_check', 'id': 't2'})
+
+        self.run_async(worker._handle, [[str(session.id), str(user_message.id)], {}, {}], message)
+        self.run_async(worker._handle, [[], {}, {}], unsupported)
+
+        self.assertTrue(Message.objects.filter(session=session, role=Message.Role.ASSISTANT).exists())
+        self.assertIs(worker._acks.get_nowait(), message)
+        self.assertIs(worker._acks.get_nowait(), unsupported)
@@ -0,0 +1,161 @@
+"""
+取消進行中的回覆測試
+測試刪除會話撤銷尚未發送的任務、已發送的任務不呼叫 LLM，以及訊息被取代時串流中途停止
+"""
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from maiagent.chat.async_worker import aprocess_message
+from maiagent.chat.cancellation import is_current
+from maiagent.chat.models import GroupScenarioAccess, LlmModel, Message, OutboxMessage, ScenarioModel, Session
+from maiagent.chat.services import submit_user_message
+from maiagent.chat.streams import get_reply_stream
+from maiagent.chat.tasks import prepare_generation, process_message
+from maiagent.chat.tests.factories import GroupFactory, MessageFactory, ScenarioFactory, SessionFactory, UserFactory
+
+
+async def run_in_test_thread(func, *args):
+    # 測試資料在主執行緒的交易中，同步步驟需回到主執行緒執行才看得到
+    return await sync_to_async(func)(*args)
+
+
+@override_settings(CHAT_CANCEL_CHECK_INTERVAL=0)
+class CancellationTestCase(TestCase):
+    """取消生成測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        self.scenario = ScenarioFactory(config_json={'response_cache': {'enabled': False}})
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+        self.llm_model = LlmModel.objects.create(provider='fake', name='fake-gpt')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=self.llm_model, is_default=True)
+        self.consumed = []
+
+    def superseding_stream(self, session, chunks=5):
+        """第三個片段時，會話改為等待新的訊息。"""
+        newer = MessageFactory(session=session, role=Message.Role.USER, content='改問別的')
+
+        def stream(request):
+            for index in range(chunks):
+                self.consumed.append(index)
+                if index == 2:
+                    # 新訊息的交易已提交
+                    Session.objects.filter(pk=session.pk).update(generation=newer.id)
+                yield f't{index} '
+        return stream
+
+    def superseding_astream(self, session, chunks=5):
+        """asyncio 執行模式的串流在事件迴圈上，寫入會話需回到主執行緒。"""
+        stream = self.superseding_stream(session, chunks)
+
+        async def astream(request):
+            pending = stream(request)
+            while True:
+                chunk = await run_in_test_thread(next, pending, None)
+                if chunk is None:
+                    return
+                yield chunk
+        return astream
+
+    def waiting_session(self):
+        session = SessionFactory(user=self.user, scenario=self.scenario, status=Session.Status.WAITING)
+        message = MessageFactory(session=session, role=Message.Role.USER, content='退貨流程？')
+        Session.objects.filter(pk=session.pk).update(generation=message.id)
+        return session, message
+
+    def assert_cancelled(self, session):
+        self.assertEqual(self.consumed, [0, 1, 2])
+        self.assertFalse(Message.objects.filter(session=session, role=Message.Role.ASSISTANT).exists())
+        session.refresh_from_db()
+        self.assertEqual(session.status, Session.Status.WAITING)
+        events = [event for _, event in get_reply_stream().read(session.id, '0', timeout=0)]
+        self.assertEqual(events[-1]['type'], 'error')
+
+    def test_delete_revokes_queued_reply(self):
+        """測試刪除會話時刪除尚未發送的任務，已發送的任務不呼叫 LLM"""
+        with self.captureOnCommitCallbacks(execute=True):
+            session, message = submit_user_message(self.user, content='退貨流程？', scenario_id=self.scenario.id)
+        self.assertEqual(OutboxMessage.objects.filter(task_name=process_message.name).count(), 1)
+        token = str(RefreshToken.for_user(self.user).access_token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                reverse('api:conversation-detail', kwargs={'pk': str(session.id)}),
+                HTTP_AUTHORIZATION=f'Bearer {token}',
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(OutboxMessage.objects.filter(task_name=process_message.name).exists())
+        with patch('maiagent.chat.tasks.get_llm_client') as get_client:
+            process_message(str(session.id), str(message.id))
+        get_client.assert_not_called()
+
+    def test_superseded_message_stops_stream(self):
+        """測試等待的訊息被取代時，串流於下一個片段停止，不寫入回覆"""
+        session, message = self.waiting_session()
+
+        with patch('maiagent.chat.tasks.get_llm_client') as get_client:
+            get_client.return_value.stream.side_effect = self.superseding_stream(session)
+            process_message(str(session.id), str(message.id))
+
+        self.assert_cancelled(session)
+
+    def test_superseded_message_stops_async_stream(self):
+        """測試 asyncio 執行模式同樣於下一個片段停止"""
+        session, message = self.waiting_session()
+
+        with patch('maiagent.chat.async_worker.run_sync', run_in_test_thread), \
+                patch('maiagent.chat.async_worker.get_llm_client') as get_client:
+            get_client.return_value.astream.side_effect = self.superseding_astream(session)
+            async_to_sync(aprocess_message)(str(session.id), str(message.id))
+
+        self.assert_cancelled(session)
+
+    def test_rolled_back_submission_keeps_running_generation(self):
+        """測試提交訊息的交易回滾時不改寫 token，進行中的生成不受影響"""
+        session, message = self.waiting_session()
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            newer = MessageFactory(session=session, role=Message.Role.USER, content='改問別的')
+            Session.objects.filter(pk=session.pk).update(generation=newer.id)
+            raise IntegrityError('rollback')
+
+        self.assertTrue(is_current(session.id, message.id))
+
+    def test_new_message_supersedes_previous_generation(self):
+        """測試提交新訊息後前一則訊息的任務取消；token 存於會話資料列，不受快取清空影響"""
+        with self.captureOnCommitCallbacks(execute=True):
+            session, message = submit_user_message(self.user, content='退貨流程？', scenario_id=self.scenario.id)
+        Session.objects.filter(pk=session.pk).update(status=Session.Status.REPLYED)
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            _, newer = submit_user_message(self.user, content='改問別的', session_id=session.id)
+        cache.clear()
+
+        self.assertFalse(is_current(session.id, message.id))
+        self.assertIsNone(prepare_generation(str(session.id), str(message.id)))
+        generation = prepare_generation(str(session.id), str(newer.id))
+        self.assertIsNotNone(generation)
+        generation.release()
+
+    def test_session_deleted_during_stream(self):
+        """測試串流期間會話被刪除時放棄寫入回覆，任務不會失敗"""
+        session, message = self.waiting_session()
+
+        def stream(request):
+            yield '回覆'
+            Session.objects.filter(pk=session.pk).delete()
+
+        with patch('maiagent.chat.tasks.get_llm_client') as get_client:
+            get_client.return_value.stream.side_effect = stream
+            process_message(str(session.id), str(message.id))
+
+        self.assertFalse(Message.objects.filter(session_id=session.id).exists())
@@ -0,0 +1,123 @@
+"""
+LLM 斷路器測試
+測試連續失敗後開啟、half-open 只放行一個試探請求，以及開啟時 process_message 改用其他模型或立即回覆錯誤
+"""
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from maiagent.chat.circuit_breaker import CLOSED, HALF_OPEN, OPEN, InMemoryCircuitBreaker, get_circuit_breaker
+from maiagent.chat.llm import LlmRateLimitError, LlmTimeoutError
+from maiagent.chat.llm.stub import StubLlmClient
+from maiagent.chat.models import LlmModel, Message, ScenarioModel, Session
+from maiagent.chat.tasks import LLM_ERROR_REPLY, process_message, system_health_check
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+
+
+@override_settings(CHAT_CIRCUIT_BREAKER_FAILURE_THRESHOLD=3, CHAT_CIRCUIT_BREAKER_OPEN_SECONDS=30)
+class InMemoryCircuitBreakerTestCase(TestCase):
+    """斷路器狀態測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.breaker = InMemoryCircuitBreaker()
+        self.model = LlmModel(provider='fake', name='flaky')
+
+    def test_opens_after_consecutive_failures(self):
+        """測試連續失敗達門檻後開啟，中間的成功會重新計算"""
+        for ok in (False, False, True, False, False):
+            self.breaker.record(self.model, ok)
+        self.assertEqual(self.breaker.state(self.model), CLOSED)
+
+        self.breaker.record(self.model, False)
+
+        self.assertEqual(self.breaker.state(self.model), OPEN)
+        self.assertFalse(self.breaker.allow(self.model))
+
+    def test_half_open_allows_single_probe(self):
+        """測試開啟秒數過後只放行一個試探請求，成功則關閉、失敗則再次開啟"""
+        for _ in range(3):
+            self.breaker.record(self.model, False)
+
+        with patch('maiagent.chat.circuit_breaker.time.monotonic', return_value=10**9):
+            self.assertTrue(self.breaker.allow(self.model))
+            self.assertFalse(self.breaker.allow(self.model))
+            self.assertEqual(self.breaker.state(self.model), HALF_OPEN)
+            self.breaker.record(self.model, False)
+        self.assertEqual(self.breaker.state(self.model), OPEN)
+
+        with patch('maiagent.chat.circuit_breaker.time.monotonic', return_value=2 * 10**9):
+            self.assertTrue(self.breaker.allow(self.model))
+        self.breaker.record(self.model, True)
+        self.assertEqual(self.breaker.state(self.model), CLOSED)
+        self.assertTrue(self.breaker.allow(self.model))
+
+
+@override_settings(CHAT_CIRCUIT_BREAKER_FAILURE_THRESHOLD=2)
+class ProcessMessageCircuitBreakerTestCase(TestCase):
+    """process_message 斷路器測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.scenario = ScenarioFactory()
+        self.primary = LlmModel.objects.create(provider='fake', name='primary')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=self.primary, is_default=True)
+
+    def ask(self, stream=None, content='退貨流程？'):
+        session = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+        message = MessageFactory(session=session, role=Message.Role.USER, content=content)
+        with patch.object(StubLlmClient, 'stream', stream or StubLlmClient.stream), \
+                patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            process_message.apply(args=[str(session.id), str(message.id)])
+        return Message.objects.filter(session=session, role=Message.Role.ASSISTANT).first()
+
+    def timing_out(self):
+        calls = []
+
+        def stream(client, request):
+            calls.append(request.model)
+            raise LlmTimeoutError('read timeout')
+            yield  # pragma: no cover
+
+        return stream, calls
+
+    def test_open_circuit_fails_fast_without_retries(self):
+        """測試失敗達門檻後開啟，之後的任務不呼叫 LLM 也不重試，直接回覆錯誤訊息"""
+        stream, calls = self.timing_out()
+        with patch('maiagent.chat.llm.base.LlmTimeoutError.retry_countdown', return_value=0):
+            reply = self.ask(stream)
+
+        # 第 1 次呼叫與第 1 次重試失敗後開啟，其餘重試不再呼叫
+        self.assertEqual(calls, ['primary', 'primary'])
+        self.assertEqual(reply.content, LLM_ERROR_REPLY)
+        self.assertEqual(get_circuit_breaker().state(self.primary), OPEN)
+
+        self.assertEqual(self.ask(stream).content, LLM_ERROR_REPLY)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(system_health_check.apply().get()['llm_circuits'], {'fake:primary': OPEN})
+
+    def test_open_circuit_falls_back_to_other_model(self):
+        """測試開啟時改用場景中斷路器關閉的其他模型"""
+        fallback = LlmModel.objects.create(provider='fake', name='fallback')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=fallback)
+        for _ in range(2):
+            get_circuit_breaker().record(self.primary, False)
+
+        reply = self.ask()
+
+        self.assertEqual(reply.content, '[fallback] 收到：退貨流程？')
+
+    def test_rate_limit_errors_and_slow_calls(self):
+        """測試 429 不計入失敗，首字延遲超過門檻的呼叫計入"""
+        def rate_limited(client, request):
+            raise LlmRateLimitError('429')
+            yield  # pragma: no cover
+
+        with patch('maiagent.chat.llm.base.LlmRateLimitError.retry_countdown', return_value=0):
+            self.ask(rate_limited)
+        self.assertEqual(get_circuit_breaker().state(self.primary), CLOSED)
+
+        with override_settings(CHAT_CIRCUIT_BREAKER_SLOW_CALL=-1):
+            self.ask(content='運費多少？')
+            self.ask(content='可以換貨嗎？')
+        self.assertEqual(get_circuit_breaker().state(self.primary), OPEN)
@@ -0,0 +1,223 @@
+"""
+回覆期限測試
+測試提交時帶期限、過期的任務不呼叫 LLM 並標記會話、relay 與 prefork / asyncio 執行模式丟棄過期任務，
+逾時通知等待中的客戶端，以及逾時的會話可重新送出
+"""
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from asgiref.sync import async_to_sync, sync_to_async
+from celery.exceptions import Retry
+from celery.signals import task_revoked
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from rolepermissions.roles import assign_role
+
+from maiagent.chat.async_worker import AsyncWorker, aprocess_message
+from maiagent.chat.deadlines import EXPIRED_REPLY, expire_reply, expired_count, reply_deadline
+from maiagent.chat.llm import LlmUnavailableError, get_llm_client
+from maiagent.chat.models import GroupScenarioAccess, LlmModel, Message, OutboxMessage, ScenarioModel, Session
+from maiagent.chat.notifications import get_reply_broker, publish_expired, session_channel
+from maiagent.chat.outbox import enqueue_task, relay_batch
+from maiagent.chat.services import submit_user_message
+from maiagent.chat.streams import get_reply_stream
+from maiagent.chat.tasks import _generate_reply, prepare_generation, process_message
+from maiagent.chat.tests.factories import GroupFactory, MessageFactory, ScenarioFactory, SessionFactory, UserFactory
+
+
+async def run_in_test_thread(func, *args):
+    # 測試資料在主執行緒的交易中，同步步驟需回到主執行緒執行才看得到
+    return await sync_to_async(func)(*args)
+
+
+class ReplyDeadlineTestCase(TestCase):
+    """回覆期限測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        self.scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+        llm_model = LlmModel.objects.create(provider='fake', name='fake-gpt')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=llm_model, is_default=True)
+        self.session = SessionFactory(user=self.user, scenario=self.scenario, status=Session.Status.WAITING)
+        self.message = MessageFactory(session=self.session, role=Message.Role.USER, content='退貨流程？')
+        self.past = timezone.now() - timedelta(seconds=1)
+
+    def assert_expired(self):
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, Session.Status.EXPIRED)
+        self.assertFalse(Message.objects.filter(session=self.session, role=Message.Role.ASSISTANT).exists())
+        events = [event for _, event in get_reply_stream().read(self.session.id, '0', timeout=0)]
+        self.assertEqual(events[-1], {'type': 'error', 'reply_to': str(self.message.id), 'detail': EXPIRED_REPLY})
+
+    @override_settings(CHAT_REPLY_DEADLINE=30)
+    def test_submission_attaches_deadline_to_task(self):
+        """測試提交訊息時 outbox 帶期限，relay 以 Celery 的 expires 發送"""
+        before = timezone.now()
+        submit_user_message(self.user, content='新的問題', scenario_id=self.scenario.id)
+
+        row = OutboxMessage.objects.get(task_name=process_message.name)
+        self.assertAlmostEqual((row.expires_at - before).total_seconds(), 30, delta=5)
+        with patch('maiagent.chat.outbox.current_app') as app, \
+                patch('maiagent.chat.fair_queue.ready_count', return_value=0):
+            relay_batch(10)
+        self.assertEqual(app.send_task.call_args.kwargs['expires'], row.expires_at)
+
+    def test_expired_task_does_not_call_llm(self):
+        """測試超過期限的任務不呼叫 LLM，會話標記為逾時並累計過期數"""
+        count = expired_count()
+
+        with patch('maiagent.chat.tasks.get_llm_client') as get_client, self.captureOnCommitCallbacks(execute=True):
+            generation = prepare_generation(str(self.session.id), str(self.message.id), deadline=self.past)
+
+        self.assertIsNone(generation)
+        get_client.assert_not_called()
+        self.assert_expired()
+        self.assertEqual(expired_count(), count + 1)
+
+    def test_relay_drops_expired_row(self):
+        """測試 relay 不發送已過期的 outbox 資料列，刪除後標記會話"""
+        enqueue_task(process_message.name, str(self.session.id), str(self.message.id), expires=self.past)
+
+        with patch('maiagent.chat.outbox.current_app') as app, \
+                patch('maiagent.chat.fair_queue.ready_count', return_value=0), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(relay_batch(10), 1)
+
+        app.send_task.assert_not_called()
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assert_expired()
+
+    def test_expiry_notifies_session_channel(self):
+        """測試逾時時在會話頻道發佈 expired 事件，WebSocket 訂閱者與長輪詢都會收到"""
+        with get_reply_broker().subscribe([session_channel(self.session.id)]) as subscription:
+            with self.captureOnCommitCallbacks(execute=True):
+                expire_reply(str(self.session.id), str(self.message.id))
+            event = subscription.get(timeout=1)
+
+        self.assertEqual(event, {
+            'type': 'expired',
+            'session_id': str(self.session.id),
+            'reply_to': str(self.message.id),
+            'detail': EXPIRED_REPLY,
+        })
+
+    def test_polling_waiter_receives_expiry(self):
+        """測試等待中的長輪詢收到 expired 事件後回應 409"""
+        assign_role(self.user, 'employee')
+        token = str(RefreshToken.for_user(self.user).access_token)
+        timer = threading.Timer(0.2, publish_expired, args=(self.session.id, self.message.id, EXPIRED_REPLY))
+
+        timer.start()
+        try:
+            response = self.client.get(
+                reverse('api:conversation-polling', kwargs={'pk': str(self.session.id)}) + '?timeout=5',
+                HTTP_AUTHORIZATION=f'Bearer {token}',
+            )
+        finally:
+            timer.cancel()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'detail': EXPIRED_REPLY, 'status': Session.Status.EXPIRED})
+
+    def test_prefork_worker_drops_expired_task(self):
+        """測試 Celery 丟棄過期任務（task_revoked）時標記會話"""
+        request = SimpleNamespace(args=[str(self.session.id), str(self.message.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task_revoked.send(sender=process_message, request=request, terminated=False, signum=None, expired=True)
+
+        self.assert_expired()
+
+    def test_async_worker_drops_expired_task(self):
+        """測試 asyncio 執行模式比對標頭的 expires，過期時不執行並 ack"""
+        worker = AsyncWorker(concurrency=1, threads=1)
+        message = MagicMock(headers={'task': process_message.name, 'id': 'x', 'expires': self.past.isoformat()})
+        body = ([str(self.session.id), str(self.message.id)], {}, {})
+
+        with patch('maiagent.chat.async_worker.run_sync', run_in_test_thread), \
+                patch('maiagent.chat.async_worker.aprocess_message') as aprocess, \
+                self.captureOnCommitCallbacks(execute=True):
+            async_to_sync(worker._handle)(body, message)
+
+        aprocess.assert_not_called()
+        self.assertIs(worker._acks.get_nowait(), message)
+        self.assert_expired()
+
+    def llm_unavailable(self):
+        """LLM 回應 503。"""
+        async def unavailable_astream(request):
+            raise LlmUnavailableError('503')
+            yield  # pragma: no cover
+
+        def unavailable_stream(request):
+            raise LlmUnavailableError('503')
+
+        client = get_llm_client('fake')
+        self.enterContext(patch.object(client, 'stream', unavailable_stream))
+        self.enterContext(patch.object(client, 'astream', unavailable_astream))
+
+    def unavailable_generation(self, deadline):
+        """LLM 回應 503 的生成，以及記錄重試參數的 task。"""
+        self.llm_unavailable()
+        generation = prepare_generation(str(self.session.id), str(self.message.id), deadline=deadline)
+        self.addCleanup(generation.release)
+        task = SimpleNamespace(request=SimpleNamespace(retries=0), retry=MagicMock(return_value=Retry()))
+        return generation, task
+
+    def test_unavailable_retry_lands_before_deadline(self):
+        """測試預設期限下 503 的重試（預設間隔 60 秒）在期限前執行"""
+        deadline = reply_deadline()
+        generation, task = self.unavailable_generation(deadline)
+
+        with self.assertRaises(Retry):
+            _generate_reply(task, generation)
+
+        countdown = task.retry.call_args.kwargs['countdown']
+        self.assertLess(timezone.now() + timedelta(seconds=countdown), deadline)
+
+    def test_async_unavailable_retry_lands_before_deadline(self):
+        """測試 asyncio 執行模式經 outbox 重新排入的 503 重試同樣在期限前執行"""
+        deadline = reply_deadline()
+        self.llm_unavailable()
+
+        with patch('maiagent.chat.async_worker.run_sync', run_in_test_thread):
+            async_to_sync(aprocess_message)(str(self.session.id), str(self.message.id), deadline=deadline)
+
+        row = OutboxMessage.objects.get(task_name=process_message.name)
+        self.assertEqual(row.retries, 1)
+        self.assertLess(row.available_at, deadline)
+        self.assertEqual(row.expires_at, deadline)
+
+    def test_retry_after_deadline_expires_reply(self):
+        """測試期限已過時 503 不再重試，直接標記逾時"""
+        generation, task = self.unavailable_generation(reply_deadline())
+        generation.deadline = self.past
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(_generate_reply(task, generation))
+
+        task.retry.assert_not_called()
+        self.assert_expired()
+
+    def test_expired_session_can_be_retried(self):
+        """測試逾時的會話 polling 回應 409，且可重新送出訊息"""
+        Session.objects.filter(pk=self.session.pk).update(status=Session.Status.EXPIRED)
+        assign_role(self.user, 'employee')
+        token = str(RefreshToken.for_user(self.user).access_token)
+
+        response = self.client.get(
+            reverse('api:conversation-polling', kwargs={'pk': str(self.session.id)}) + '?timeout=1',
+            HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['detail'], EXPIRED_REPLY)
+
+        session, _ = submit_user_message(self.user, content='再問一次', session_id=self.session.id)
+        self.assertEqual(session.status, Session.Status.WAITING)
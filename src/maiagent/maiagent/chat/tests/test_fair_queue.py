@@ -0,0 +1,119 @@
+"""
+跨群組公平排程測試
+測試 deficit round-robin 依權重分配、大量送出的群組不會讓小群組等待其積壓，
+以及 broker 佇列已滿時積壓留在 outbox
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from kombu import Connection
+
+from maiagent.chat.fair_queue import DeficitRoundRobin, flow_for, ready_count
+from maiagent.chat.models import GroupScenarioAccess, OutboxMessage
+from maiagent.chat.outbox import enqueue_task, relay_batch
+from maiagent.chat.services import submit_user_message
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import GroupFactory, ScenarioFactory, UserFactory
+
+
+class DeficitRoundRobinTestCase(TestCase):
+    """DeficitRoundRobin 測試案例"""
+
+    def test_capacity_is_shared_by_weight(self):
+        """測試名額依權重分配，積壓較少的 flow 用完後由其他 flow 使用"""
+        scheduler = DeficitRoundRobin()
+
+        served = scheduler.allocate({'a': (100, 1), 'b': (100, 2), 'c': (2, 1)}, 32)
+
+        self.assertEqual(served.count('c'), 2)
+        self.assertEqual((served.count('a'), served.count('b')), (10, 20))
+
+    def test_rotation_continues_across_batches(self):
+        """測試下一批從上一批停止的 flow 之後繼續，不會總是先服務同一個 flow"""
+        scheduler = DeficitRoundRobin()
+
+        first = scheduler.allocate({'a': (10, 1), 'b': (10, 1)}, 1)
+        second = scheduler.allocate({'a': (9, 1), 'b': (10, 1)}, 1)
+
+        self.assertEqual(first + second, ['a', 'b'])
+
+    def test_missing_queue_counts_as_empty(self):
+        """測試 broker 中尚不存在的佇列（Redis 在佇列清空時刪除）視為沒有待處理的任務"""
+        with patch('maiagent.chat.fair_queue.current_app') as app:
+            app.connection_for_read.return_value = Connection('memory://')
+
+            self.assertEqual(ready_count('missing_queue'), 0)
+
+
+@override_settings(CHAT_FAIR_QUEUE_MAX_READY=10)
+class FairRelayTestCase(TestCase):
+    """公平排程 relay 測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.flood, self.small = GroupFactory(), GroupFactory()
+        patcher = patch('maiagent.chat.fair_queue.ready_count', return_value=0)
+        self.ready_count = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def relay(self):
+        with patch('maiagent.chat.outbox.current_app') as app:
+            relay_batch(100)
+        return [call.kwargs['args'][0] for call in app.send_task.call_args_list]
+
+    def test_small_group_is_not_starved_by_flood(self):
+        """測試大量送出的群組積壓時，之後送出的小群組任務在第一批即發送"""
+        flood = flow_for(UserFactory(group=self.flood))
+        for i in range(300):
+            enqueue_task(process_message.name, f'flood-{i}', **flood)
+        small = flow_for(UserFactory(group=self.small))
+        for i in range(3):
+            enqueue_task(process_message.name, f'small-{i}', **small)
+
+        sent = self.relay()
+
+        # 依寫入順序需等 30 批；公平排程下等待與大群組的積壓量無關
+        self.assertEqual(len(sent), 10)
+        self.assertEqual([task for task in sent if task.startswith('small')], ['small-0', 'small-1', 'small-2'])
+        self.assertEqual(sent[0], 'flood-0')
+        self.assertEqual(OutboxMessage.objects.count(), 293)
+
+    def test_admin_flow_has_priority(self):
+        """測試管理員的 flow 權重較高，取得較多名額"""
+        admin, employee = UserFactory(role='admin', group=None), UserFactory(group=self.flood)
+        self.assertEqual(flow_for(admin), {'flow': '-:admin', 'weight': 4})
+        for i in range(20):
+            enqueue_task(process_message.name, f'admin-{i}', **flow_for(admin))
+            enqueue_task(process_message.name, f'employee-{i}', **flow_for(employee))
+
+        sent = self.relay()
+
+        self.assertEqual(sum(task.startswith('admin') for task in sent), 8)
+
+    def test_full_broker_queue_holds_backlog(self):
+        """測試 ai_queue 待處理數已達上限時回覆任務留在 outbox，其他任務照常發送"""
+        self.ready_count.return_value = 10
+        enqueue_task(process_message.name, 'reply', **flow_for(UserFactory(group=self.small)))
+        enqueue_task('maiagent.chat.tasks.system_health_check', 'other')
+
+        self.assertEqual(self.relay(), ['other'])
+        self.assertEqual(OutboxMessage.objects.get().args, ['reply'])
+
+        self.ready_count.return_value = 0
+        self.assertEqual(self.relay(), ['reply'])
+
+    def test_submission_uses_user_flow_and_stats_command(self):
+        """測試訊息提交以使用者的群組與角色寫入 flow，fair_queue_stats 顯示各 flow 的積壓"""
+        user = UserFactory(role='supervisor', group=self.small)
+        scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.small, scenario=scenario)
+
+        submit_user_message(user, content='你好', scenario_id=scenario.id)
+
+        row = OutboxMessage.objects.get()
+        self.assertEqual((row.flow, row.weight), (f'{self.small.id}:supervisor', 2))
+        out = StringIO()
+        call_command('fair_queue_stats', stdout=out)
+        self.assertIn(f'{self.small.name} / supervisor（權重 2）：待發送 1', out.getvalue())
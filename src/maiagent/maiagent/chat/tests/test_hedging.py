@@ -0,0 +1,195 @@
+"""
+Hedged requests 測試
+測試主要模型逾時未產生首字時改由備援模型回覆、主要模型失敗時立即切換、
+備援額度不足時不送出，以及每次決策的紀錄
+"""
+import asyncio
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from maiagent.chat.async_worker import aprocess_message
+from maiagent.chat.circuit_breaker import get_circuit_breaker
+from maiagent.chat.llm import LlmServerError
+from maiagent.chat.llm.base import sleep
+from maiagent.chat.llm.stub import StubLlmClient
+from maiagent.chat.models import HedgeDecision, LlmModel, Message, ScenarioModel, Session
+from maiagent.chat.rate_limit import get_rate_limiter
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+
+ORIGINAL_STREAM = StubLlmClient.stream
+ORIGINAL_ASTREAM = StubLlmClient.astream
+
+
+def delayed_stream(delays, errors=()):
+    """依模型名稱延遲首字或直接失敗的 StubLlmClient.stream"""
+    def stream(self, request):
+        if request.model in errors:
+            raise LlmServerError('500')
+        time.sleep(delays.get(request.model, 0))
+        yield from ORIGINAL_STREAM(self, request)
+    return stream
+
+
+def delayed_astream(delays):
+    async def astream(self, request):
+        await asyncio.sleep(delays.get(request.model, 0))
+        async for chunk in ORIGINAL_ASTREAM(self, request):
+            yield chunk
+    return astream
+
+
+async def run_in_test_thread(func, *args):
+    return await sync_to_async(func)(*args)
+
+
+class HedgingTestCase(TestCase):
+    """Hedged requests 測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        get_rate_limiter().clear()
+        self.scenario = ScenarioFactory(config_json={
+            'prompt': '你是客服助手',
+            'llm': {},
+            'memory': {'type': 'none'},
+            'hedging': {'enabled': True, 'first_token_timeout': 0.05},
+        })
+        self.primary = LlmModel.objects.create(provider='fake', name='primary')
+        self.backup = LlmModel.objects.create(provider='fake', name='backup', params={'temperature': 0.2})
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=self.primary, is_default=True)
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=self.backup)
+        self.session = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+        self.user_message = MessageFactory(session=self.session, role=Message.Role.USER, content='退貨流程？')
+
+    def run_task(self, stream):
+        with patch.object(StubLlmClient, 'stream', stream), patch('maiagent.chat.tasks.publish_reply'), \
+                self.captureOnCommitCallbacks(execute=True):
+            process_message(str(self.session.id), str(self.user_message.id))
+        return Message.objects.get(session=self.session, role=Message.Role.ASSISTANT)
+
+    def test_slow_primary_is_hedged_and_backup_wins(self):
+        """測試主要模型逾時未產生首字時送出備援請求，由先回應的備援模型回覆"""
+        reply = self.run_task(delayed_stream({'primary': 1}))
+
+        self.assertEqual(reply.content, '[backup] 收到：退貨流程？')
+        decision = HedgeDecision.objects.get()
+        self.assertEqual(decision.message_id, self.user_message.id)
+        self.assertEqual((decision.primary_model, decision.backup_model), (self.primary, self.backup))
+        self.assertTrue(decision.hedged)
+        self.assertEqual(decision.winner, HedgeDecision.Role.BACKUP)
+        self.assertIsNone(decision.primary_first_token_ms)
+        self.assertIsNotNone(decision.backup_first_token_ms)
+
+    @override_settings(CHAT_CIRCUIT_BREAKER_SLOW_CALL=0.35)
+    def test_breaker_records_each_attempt(self):
+        """測試斷路器依各自的首字延遲回報：落後的主要模型計為慢呼叫，勝出的備援模型不代替其回報"""
+        hedging = {'enabled': True, 'first_token_timeout': 0.3}
+        self.scenario.config_json = {**self.scenario.config_json, 'hedging': hedging}
+        self.scenario.save()
+
+        # 主要模型等待約 0.4 秒後被取消；備援模型自送出起 0.1 秒產生首字
+        with patch.object(get_circuit_breaker(), 'record') as record:
+            self.run_task(delayed_stream({'primary': 1, 'backup': 0.1}))
+
+        self.assertCountEqual(
+            [(call.args[0], call.kwargs['ok']) for call in record.call_args_list],
+            [(self.primary, False), (self.backup, True)],
+        )
+
+    def test_primary_failure_is_recorded_before_switching(self):
+        """測試主要模型在首字之前失敗時，失敗計入主要模型的斷路器"""
+        with patch.object(get_circuit_breaker(), 'record') as record, patch.object(process_message, 'retry'):
+            self.run_task(delayed_stream({}, errors={'primary'}))
+
+        self.assertCountEqual(
+            [(call.args[0], call.kwargs['ok']) for call in record.call_args_list],
+            [(self.primary, False), (self.backup, True)],
+        )
+
+    def test_fast_primary_is_not_hedged(self):
+        """測試主要模型在門檻內回應時不送出備援請求"""
+        reply = self.run_task(delayed_stream({}))
+
+        self.assertEqual(reply.content, '[primary] 收到：退貨流程？')
+        decision = HedgeDecision.objects.get()
+        self.assertFalse(decision.hedged)
+        self.assertEqual((decision.winner, decision.skip_reason), (HedgeDecision.Role.PRIMARY, ''))
+
+    def test_primary_failure_switches_to_backup_immediately(self):
+        """測試主要模型在首字之前失敗時立即改用備援模型，不重試"""
+        with patch.object(process_message, 'retry') as retry:
+            reply = self.run_task(delayed_stream({}, errors={'primary'}))
+
+        retry.assert_not_called()
+        self.assertEqual(reply.content, '[backup] 收到：退貨流程？')
+        self.assertEqual(HedgeDecision.objects.get().winner, HedgeDecision.Role.BACKUP)
+
+    def test_rate_limited_backup_is_not_called(self):
+        """測試備援模型額度不足時不送出，等待主要模型"""
+        self.backup.requests_per_minute = 1
+        self.backup.save()
+        get_rate_limiter().acquire(self.backup, 0)
+
+        reply = self.run_task(delayed_stream({'primary': 0.2}))
+
+        self.assertEqual(reply.content, '[primary] 收到：退貨流程？')
+        decision = HedgeDecision.objects.get()
+        self.assertFalse(decision.hedged)
+        self.assertEqual(decision.skip_reason, HedgeDecision.SkipReason.RATE_LIMITED)
+
+    def test_scenario_without_hedging_records_nothing(self):
+        """測試場景未啟用時只呼叫主要模型，不記錄決策"""
+        self.scenario.config_json = {**self.scenario.config_json, 'hedging': {'enabled': False}}
+        self.scenario.save()
+
+        reply = self.run_task(delayed_stream({'primary': 0.1}))
+
+        self.assertEqual(reply.content, '[primary] 收到：退貨流程？')
+        self.assertFalse(HedgeDecision.objects.exists())
+
+    def test_cancelled_primary_stops_without_next_chunk(self):
+        """測試備援模型勝出時中止主要模型的串流，不等到其下一個片段"""
+        primary_finished = threading.Event()
+
+        def stream(self, request):
+            if request.model == 'primary':
+                try:
+                    if not sleep(5):
+                        return
+                finally:
+                    primary_finished.set()
+            yield from ORIGINAL_STREAM(self, request)
+
+        reply = self.run_task(stream)
+
+        self.assertEqual(reply.content, '[backup] 收到：退貨流程？')
+        self.assertTrue(primary_finished.wait(1))
+
+    def test_async_worker_cancels_slow_primary(self):
+        """測試 asyncio 執行模式同樣由備援模型回覆，並取消主要模型的請求"""
+        with patch.object(StubLlmClient, 'astream', delayed_astream({'primary': 5})), \
+                patch('maiagent.chat.async_worker.run_sync', run_in_test_thread), \
+                patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            started = time.monotonic()
+            async_to_sync(aprocess_message)(str(self.session.id), str(self.user_message.id))
+
+        self.assertLess(time.monotonic() - started, 2)
+        reply = Message.objects.get(session=self.session, role=Message.Role.ASSISTANT)
+        self.assertEqual(reply.content, '[backup] 收到：退貨流程？')
+        self.assertEqual(HedgeDecision.objects.get().winner, HedgeDecision.Role.BACKUP)
+
+    def test_hedge_stats_command(self):
+        """測試 hedge_stats 彙整各場景的決策"""
+        self.run_task(delayed_stream({'primary': 1}))
+
+        out = StringIO()
+        call_command('hedge_stats', stdout=out)
+
+        self.assertIn(f'{self.scenario.name}：1 次，送出備援 1，備援勝出 1', out.getvalue())
@@ -0,0 +1,279 @@
+"""
+LLM 用戶端測試
+以本機 HTTP 伺服器模擬 provider，測試串流解析、連線重複使用、錯誤分類與 process_message 的重試策略
+"""
+import json
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from maiagent.chat.llm import (
+    LlmAuthenticationError,
+    LlmConfigurationError,
+    LlmRateLimitError,
+    LlmRequest,
+    LlmServerError,
+    StreamAbort,
+    abortable,
+    get_llm_client,
+)
+from maiagent.chat.llm.anthropic import AnthropicClient
+from maiagent.chat.llm.openai import OpenAIClient
+from maiagent.chat.models import LlmModel, Message, ScenarioModel, Session
+from maiagent.chat.streams import get_reply_stream
+from maiagent.chat.tasks import LLM_ERROR_REPLY, process_message
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+
+
+def sse(*events):
+    return ''.join(f'data: {json.dumps(e, ensure_ascii=False) if isinstance(e, dict) else e}\n\n' for e in events).encode()
+
+
+class ProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        server.requests.append({
+            'path': self.path,
+            'headers': dict(self.headers),
+            'body': json.loads(self.rfile.read(int(self.headers['Content-Length']))),
+            'client': self.client_address,
+        })
+        status_code, headers, body = server.responses.pop(0) if server.responses else server.default
+        self.send_response(status_code)
+        for name, value in {'Content-Length': str(len(body)), **headers}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeProviderServer:
+    """在背景執行緒啟動的 HTTP/1.1 伺服器，依序回傳預先設定的回應"""
+
+    def __init__(self, default):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), ProviderHandler)
+        self.httpd.requests, self.httpd.responses, self.httpd.default = [], [], default
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+OPENAI_STREAM = sse(
+    {'choices': [{'delta': {'role': 'assistant'}}]},
+    {'choices': [{'delta': {'content': '您好，'}}]},
+    {'choices': [{'delta': {'content': '請問需要什麼協助？'}}]},
+    '[DONE]',
+)
+
+
+class HttpLlmClientTestCase(TestCase):
+    """HTTP provider 用戶端測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.server = FakeProviderServer((200, {'Content-Type': 'text/event-stream'}, OPENAI_STREAM))
+        self.addCleanup(self.server.close)
+        self.request = LlmRequest(
+            model='gpt-4o',
+            system='你是客服助手',
+            messages=[{'role': 'user', 'content': '你好'}],
+            params={'temperature': 0.3, 'max_tokens': 100, 'memory': 'ignored'},
+        )
+
+    def test_openai_stream_and_payload(self):
+        """測試 OpenAI 串流解析與請求內容"""
+        client = OpenAIClient(api_key='sk-test', base_url=self.server.url)
+
+        self.assertEqual(list(client.stream(self.request)), ['您好，', '請問需要什麼協助？'])
+
+        sent = self.server.httpd.requests[0]
+        self.assertEqual(sent['path'], '/chat/completions')
+        self.assertEqual(sent['headers']['Authorization'], 'Bearer sk-test')
+        self.assertEqual(sent['body']['messages'][0], {'role': 'system', 'content': '你是客服助手'})
+        self.assertEqual((sent['body']['temperature'], sent['body']['max_tokens']), (0.3, 100))
+        self.assertNotIn('memory', sent['body'])
+
+    def test_connections_are_reused_across_requests(self):
+        """測試連續請求重複使用同一個 keep-alive 連線"""
+        client = OpenAIClient(api_key='sk-test', base_url=self.server.url)
+
+        for _ in range(3):
+            client.complete(self.request)
+
+        clients = {r['client'] for r in self.server.httpd.requests}
+        self.assertEqual(len(self.server.httpd.requests), 3)
+        self.assertEqual(len(clients), 1)
+
+    def test_anthropic_stream(self):
+        """測試 Anthropic 串流解析，system 與 max_tokens 放在最上層"""
+        self.server.httpd.default = (200, {}, sse(
+            {'type': 'message_start', 'message': {}},
+            {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': '您好'}},
+            {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': '！'}},
+            {'type': 'message_stop'},
+        ))
+        client = AnthropicClient(api_key='ak-test', base_url=self.server.url)
+
+        self.assertEqual(client.complete(self.request), '您好！')
+
+        sent = self.server.httpd.requests[0]
+        self.assertEqual(sent['headers']['x-api-key'], 'ak-test')
+        self.assertEqual(sent['body']['system'], '你是客服助手')
+        self.assertEqual(sent['body']['messages'], [{'role': 'user', 'content': '你好'}])
+
+    def test_error_statuses_are_classified(self):
+        """測試 401 / 429 分類，429 帶 Retry-After"""
+        client = OpenAIClient(api_key='sk-test', base_url=self.server.url)
+        self.server.httpd.responses = [(401, {}, b'{"error": "invalid key"}'), (429, {'Retry-After': '7'}, b'{}')]
+
+        with self.assertRaises(LlmAuthenticationError):
+            client.complete(self.request)
+        with self.assertRaises(LlmRateLimitError) as ctx:
+            client.complete(self.request)
+
+        self.assertFalse(LlmAuthenticationError.retryable)
+        self.assertEqual(ctx.exception.retry_countdown(0), 7)
+
+    def test_server_error_is_retried_once_immediately(self):
+        """測試 5xx 先立即重試一次，仍失敗才拋出 LlmServerError"""
+        client = OpenAIClient(api_key='sk-test', base_url=self.server.url)
+        self.server.httpd.responses = [(500, {}, b'oops')]
+
+        self.assertEqual(client.complete(self.request), '您好，請問需要什麼協助？')
+
+        self.server.httpd.responses = [(502, {}, b'oops'), (500, {}, b'oops')]
+        with self.assertRaises(LlmServerError):
+            client.complete(self.request)
+        self.assertEqual(len(self.server.httpd.requests), 4)
+
+    def test_async_stream_and_errors(self):
+        """測試非同步串流（httpx）的解析、5xx 立即重試與錯誤分類與同步版本相同"""
+        client = OpenAIClient(api_key='sk-test', base_url=self.server.url)
+        self.server.httpd.responses = [(500, {}, b'oops')]
+
+        async def collect():
+            return [chunk async for chunk in client.astream(self.request)]
+
+        self.assertEqual(async_to_sync(collect)(), ['您好，', '請問需要什麼協助？'])
+        self.assertEqual(len(self.server.httpd.requests), 2)
+        self.assertEqual(self.server.httpd.requests[1]['body']['messages'][0]['role'], 'system')
+
+        self.server.httpd.responses = [(429, {'Retry-After': '7'}, b'{}')]
+        with self.assertRaises(LlmRateLimitError) as ctx:
+            async_to_sync(collect)()
+        self.assertEqual(ctx.exception.retry_countdown(0), 7)
+
+    def test_abort_closes_stalled_stream(self):
+        """測試中止時關閉停滯中的回應，讀取的執行緒不需等到讀取逾時"""
+        body = sse({'choices': [{'delta': {'content': '您好，'}}]})
+        # 宣告的長度大於實際送出的內容，用戶端持續等待其餘內容
+        self.server.httpd.default = (200, {'Content-Length': str(len(body) + 100)}, body)
+        client = OpenAIClient(api_key='sk-test', base_url=self.server.url)
+        abort, finished = StreamAbort(), threading.Event()
+
+        def read():
+            with abortable(abort):
+                list(client.stream(self.request))
+            finished.set()
+
+        threading.Thread(target=read, daemon=True).start()
+        while not self.server.httpd.requests:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        abort.abort()
+
+        self.assertTrue(finished.wait(2))
+
+    def test_missing_api_key_and_unknown_provider(self):
+        """測試未設定 API key 與未知 provider 為設定錯誤"""
+        with self.assertRaises(LlmConfigurationError):
+            OpenAIClient(api_key='', base_url=self.server.url).complete(self.request)
+        with self.assertRaises(LlmConfigurationError):
+            get_llm_client('no-such-provider')
+        self.assertIs(get_llm_client('fake'), get_llm_client('fake'))
+
+
+class ProcessMessageLlmTestCase(TestCase):
+    """process_message 呼叫 LLM 的測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.scenario = ScenarioFactory(config_json={
+            'prompt': '你是客服助手',
+            'llm': {'temperature': 0.1},
+            'memory': {'type': 'conversation', 'max_turns': 1},
+        })
+        self.llm_model = LlmModel.objects.create(provider='fake', name='fake-gpt', params={'temperature': 0.9})
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=self.llm_model, is_default=True)
+        self.session = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+        MessageFactory(session=self.session, role=Message.Role.USER, content='舊問題')
+        MessageFactory(session=self.session, role=Message.Role.ASSISTANT, content='舊回覆')
+        self.user_message = MessageFactory(session=self.session, role=Message.Role.USER, content='退貨流程？')
+
+    def run_task(self):
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            process_message(str(self.session.id), str(self.user_message.id))
+
+    def last_reply(self):
+        return Message.objects.filter(session=self.session, role=Message.Role.ASSISTANT).order_by('-sequence_number')[0]
+
+    def test_uses_scenario_model_and_builds_request(self):
+        """測試使用場景預設模型，帶入提示詞、最近對話與覆寫後的參數"""
+        client = get_llm_client('fake')
+
+        with patch.object(client, 'stream', wraps=client.stream) as stream:
+            self.run_task()
+
+        request = stream.call_args.args[0]
+        self.assertEqual(request.model, 'fake-gpt')
+        self.assertEqual(request.system, '你是客服助手')
+        self.assertEqual(request.params, {'temperature': 0.1})
+        self.assertEqual([m['content'] for m in request.messages], ['舊回覆', '退貨流程？'])
+        self.assertEqual(self.last_reply().content, '[fake-gpt] 收到：退貨流程？')
+
+    @override_settings(CHAT_LLM_DEFAULT_MODEL={'provider': 'fake', 'name': 'default-echo'})
+    def test_scenario_without_model_uses_default(self):
+        """測試場景未綁定模型時使用 CHAT_LLM_DEFAULT_MODEL"""
+        ScenarioModel.objects.all().delete()
+
+        self.run_task()
+
+        self.assertTrue(self.last_reply().content.startswith('[default-echo]'))
+
+    def test_retryable_error_schedules_retry(self):
+        """測試可重試的錯誤依錯誤類別設定 countdown 與重試次數"""
+        error = LlmRateLimitError('429')
+        with patch('maiagent.chat.tasks.get_llm_client') as get_client, \
+                patch.object(process_message, 'retry', side_effect=RuntimeError('retry')) as retry:
+            get_client.return_value.stream.side_effect = error
+            with self.assertRaisesMessage(RuntimeError, 'retry'):
+                self.run_task()
+
+        retry.assert_called_once_with(exc=error, countdown=2, max_retries=5)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, Session.Status.WAITING)
+
+    def test_non_retryable_error_replies_with_default_message(self):
+        """測試不可重試的錯誤回覆預設錯誤訊息，會話不會停在 WAITING"""
+        with patch('maiagent.chat.tasks.get_llm_client') as get_client:
+            get_client.return_value.stream.side_effect = LlmAuthenticationError('401')
+            self.run_task()
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, Session.Status.REPLYED)
+        self.assertEqual(self.last_reply().content, LLM_ERROR_REPLY)
+        events = [event['type'] for _, event in get_reply_stream().read(self.session.id, '0', timeout=0)]
+        self.assertEqual(events, ['error', 'done'])
@@ -0,0 +1,121 @@
+"""
+對話記憶測試
+測試依 memory.max_turns / max_tokens 取最近對話，且快取命中時只讀取新訊息
+"""
+from django.core.cache import cache
+from django.test import TestCase
+
+from maiagent.chat.memory import conversation_memory, memory_key, remember_message
+from maiagent.chat.models import Message
+from maiagent.chat.tests.factories import MessageFactory, SessionFactory
+from maiagent.chat.tokenizers import EstimatingTokenizer
+
+MEMORY = {'type': 'conversation', 'max_turns': 2}
+
+
+class ConversationMemoryTestCase(TestCase):
+    """對話記憶測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        cache.clear()
+        self.session = SessionFactory()
+        for turn in range(1, 4):
+            self.say(Message.Role.USER, f'問題 {turn}')
+            self.say(Message.Role.ASSISTANT, f'回覆 {turn}')
+
+    def say(self, role, content):
+        return MessageFactory(session=self.session, role=role, content=content)
+
+    def contents(self, messages):
+        return [m['content'] for m in messages]
+
+    def test_returns_last_turns_in_order(self):
+        """測試只取最近 max_turns 輪，依時間順序"""
+        question = self.say(Message.Role.USER, '問題 4')
+
+        with self.assertNumQueries(1):
+            messages = conversation_memory(self.session.id, MEMORY, upto=question.sequence_number)
+
+        self.assertEqual(self.contents(messages), ['回覆 2', '問題 3', '回覆 3', '問題 4'])
+        self.assertEqual(messages[-1], {'role': 'user', 'content': '問題 4'})
+
+    def test_cached_window_only_reads_new_messages(self):
+        """測試快取命中時只查詢新的使用者訊息，回覆寫入後直接接上快取"""
+        conversation_memory(self.session.id, MEMORY)
+
+        question = self.say(Message.Role.USER, '問題 4')
+        with self.assertNumQueries(1) as ctx:
+            messages = conversation_memory(self.session.id, MEMORY, upto=question.sequence_number)
+        self.assertIn('"sequence_number" >', ctx.captured_queries[0]['sql'])
+        self.assertEqual(self.contents(messages), ['回覆 2', '問題 3', '回覆 3', '問題 4'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reply = self.say(Message.Role.ASSISTANT, '回覆 4')
+            remember_message(self.session.id, reply)
+        self.assertEqual(cache.get(memory_key(self.session.id))['last_sequence'], reply.sequence_number)
+
+        with self.assertNumQueries(1):
+            messages = conversation_memory(self.session.id, MEMORY, upto=reply.sequence_number + 1)
+        self.assertEqual(self.contents(messages), ['問題 3', '回覆 3', '問題 4', '回覆 4'])
+
+    def test_cached_window_matches_full_rebuild(self):
+        """測試逐輪延伸的視窗與重新查詢的結果相同"""
+        for turn in range(4, 9):
+            question = self.say(Message.Role.USER, f'問題 {turn}')
+            incremental = conversation_memory(self.session.id, MEMORY, upto=question.sequence_number)
+            self.say(Message.Role.ASSISTANT, f'回覆 {turn}')
+
+            cache.delete(memory_key(self.session.id))
+            rebuilt = conversation_memory(self.session.id, MEMORY, upto=question.sequence_number)
+            self.assertEqual(incremental, rebuilt)
+
+    def test_retry_of_earlier_turn_does_not_overwrite_newer_cache(self):
+        """測試重新產生較早一輪的回覆時，取得該輪的視窗且不覆寫較新的快取"""
+        latest = conversation_memory(self.session.id, MEMORY)
+
+        earlier = conversation_memory(self.session.id, MEMORY, upto=3)
+
+        self.assertEqual(self.contents(earlier), ['問題 1', '回覆 1', '問題 2'])
+        self.assertEqual(conversation_memory(self.session.id, MEMORY), latest)
+
+    def test_changed_max_turns_rebuilds_window(self):
+        """測試 max_turns 變更後重新查詢"""
+        conversation_memory(self.session.id, MEMORY)
+
+        messages = conversation_memory(self.session.id, {'type': 'conversation', 'max_turns': 3})
+
+        self.assertEqual(len(messages), 6)
+
+    def test_memory_type_none_keeps_only_current_message(self):
+        """測試 memory.type 為 none 時只帶本輪訊息"""
+        question = self.say(Message.Role.USER, '問題 4')
+
+        messages = conversation_memory(self.session.id, {'type': 'none'}, upto=question.sequence_number)
+
+        self.assertEqual(self.contents(messages), ['問題 4'])
+
+    def test_max_tokens_keeps_newest_messages_that_fit(self):
+        """測試 max_tokens 依存下的 token 數由新到舊保留，未計算的訊息以 tokenizer 計算"""
+        question = self.say(Message.Role.USER, '問題 4')
+        Message.objects.filter(session=self.session).update(token_count=10)
+        Message.objects.filter(pk=question.pk).update(token_count=None)
+        memory = {'type': 'conversation', 'max_turns': 5, 'max_tokens': 25}
+
+        with self.assertNumQueries(1):
+            messages = conversation_memory(
+                self.session.id, memory, upto=question.sequence_number, tokenizer=EstimatingTokenizer()
+            )
+
+        # 問題 4 估算為 3 個 token，再放得下兩則
+        self.assertEqual(self.contents(messages), ['問題 3', '回覆 3', '問題 4'])
+
+    def test_max_tokens_keeps_current_message_even_if_too_long(self):
+        """測試最新一則超過預算時仍保留"""
+        question = MessageFactory(session=self.session, role=Message.Role.USER, content='很長的問題', token_count=100)
+
+        messages = conversation_memory(
+            self.session.id, {'type': 'conversation', 'max_tokens': 10}, upto=question.sequence_number
+        )
+
+        self.assertEqual(self.contents(messages), ['很長的問題'])
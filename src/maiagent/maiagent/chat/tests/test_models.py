@@ -0,0 +1,104 @@
+"""
+訊息序號分配測試
+測試 Session.next_sequence 以單一 UPDATE 分配序號且不留空號
+"""
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from maiagent.chat.models import Message, Session
+from maiagent.chat.tests.factories import MessageFactory, SessionFactory
+
+
+class MessageSequenceTestCase(TestCase):
+    """訊息序號測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.session = SessionFactory()
+
+    def test_sequence_numbers_are_consecutive(self):
+        """測試序號依會話連續遞增"""
+        other = SessionFactory()
+        MessageFactory(session=other)
+
+        messages = [MessageFactory(session=self.session) for _ in range(3)]
+
+        self.assertEqual([m.sequence_number for m in messages], [1, 2, 3])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.next_sequence, 4)
+
+    def test_insert_takes_one_allocation_and_one_insert(self):
+        """測試寫入訊息僅需分配與寫入兩次查詢（不再鎖定與取 Max）"""
+        with self.assertNumQueries(2):
+            Message.objects.create(session=self.session, role=Message.Role.USER, content='你好')
+
+    def test_failed_insert_does_not_leave_gap(self):
+        """測試寫入失敗時序號分配一併回滾"""
+        first = MessageFactory(session=self.session)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MessageFactory(session=self.session, id=first.id)
+
+        self.assertEqual(MessageFactory(session=self.session).sequence_number, 2)
+
+    def test_explicit_sequence_advances_counter(self):
+        """測試指定序號寫入後，之後分配的序號不會重複"""
+        MessageFactory(session=self.session, sequence_number=5)
+
+        self.assertEqual(MessageFactory(session=self.session).sequence_number, 6)
+
+    def test_allocate_block_of_sequence_numbers(self):
+        """測試一次保留多個連續序號"""
+        first = Session.allocate_sequence_numbers(self.session.pk, 10)
+
+        self.assertEqual(first, 1)
+        self.assertEqual(Session.allocate_sequence_numbers(self.session.pk), 11)
+
+    def test_sync_message_sequences_command(self):
+        """測試依現有訊息重新計算 next_sequence"""
+        MessageFactory(session=self.session)
+        MessageFactory(session=self.session)
+        empty = SessionFactory()
+        Session.objects.update(next_sequence=1)
+
+        call_command('sync_message_sequences', stdout=StringIO())
+
+        self.session.refresh_from_db()
+        empty.refresh_from_db()
+        self.assertEqual(self.session.next_sequence, 3)
+        self.assertEqual(empty.next_sequence, 1)
+
+    def test_append_many_reserves_contiguous_block(self):
+        """測試批次寫入接續既有序號，且查詢數與訊息數量無關"""
+        MessageFactory(session=self.session)
+
+        created = Message.objects.append_many(self.session, self.turns(500))
+
+        self.assertEqual([m.sequence_number for m in created], list(range(2, 502)))
+        self.assertEqual(MessageFactory(session=self.session).sequence_number, 502)
+
+    def test_append_many_query_count_does_not_grow(self):
+        """測試訊息數量加倍時查詢數不變"""
+        # 查詢數依資料庫而定（SQLite 的 bulk_create 依參數上限分批），只比較兩者；數量在單批之內
+        counts = []
+        for size in (10, 20):
+            with CaptureQueriesContext(connection) as queries:
+                Message.objects.append_many(SessionFactory(), self.turns(size))
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def turns(self, count):
+        return [
+            {'role': Message.Role.USER if i % 2 == 0 else Message.Role.ASSISTANT, 'content': f'第 {i} 則'}
+            for i in range(count)
+        ]
+
+    def test_append_many_without_messages(self):
+        """測試空清單不分配序號也不寫入"""
+        with self.assertNumQueries(0):
+            self.assertEqual(Message.objects.append_many(self.session, []), [])
@@ -0,0 +1,94 @@
+"""
+交易式 outbox 測試
+測試任務與訊息同一交易寫入、relay 發送後刪除，以及 broker 失敗時保留重試
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from maiagent.chat.models import GroupScenarioAccess, Message, OutboxMessage, Session
+from maiagent.chat.outbox import enqueue_task, relay_batch
+from maiagent.chat.services import submit_user_message
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import GroupFactory, MessageFactory, ScenarioFactory, SessionFactory, UserFactory
+
+
+class OutboxTestCase(TestCase):
+    """Outbox 測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        self.scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+        self.session = SessionFactory(user=self.user, scenario=self.scenario, status=Session.Status.ACTIVE)
+
+    def test_submission_writes_outbox_in_same_transaction(self):
+        """測試訊息提交寫入 outbox，交易回滾時一併回滾"""
+        session, message = submit_user_message(self.user, content='你好', session_id=self.session.id)
+
+        outbox = OutboxMessage.objects.get()
+        self.assertEqual(outbox.task_name, process_message.name)
+        self.assertEqual(outbox.args, [str(session.id), str(message.id)])
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            submit_user_message(self.user, content='新會話', scenario_id=self.scenario.id)
+            raise RuntimeError
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_relay_sends_in_order_and_deletes(self):
+        """測試 relay 依寫入順序發送並刪除已發送的資料列"""
+        enqueue_task(process_message.name, 'a', '1')
+        enqueue_task(process_message.name, 'b', '2')
+
+        with patch('maiagent.chat.outbox.current_app') as app:
+            self.assertEqual(relay_batch(), 2)
+
+        sent = [call.kwargs['args'] for call in app.send_task.call_args_list]
+        self.assertEqual(sent, [['a', '1'], ['b', '2']])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_broker_failure_keeps_row_for_retry(self):
+        """測試 broker 失敗時保留資料列並延後重試，之後的資料列留待下一批"""
+        first = enqueue_task(process_message.name, 'a', '1')
+        enqueue_task(process_message.name, 'b', '2')
+
+        with patch('maiagent.chat.outbox.current_app') as app:
+            app.send_task.side_effect = ConnectionError('broker down')
+            self.assertEqual(relay_batch(), 0)
+
+        first.refresh_from_db()
+        self.assertEqual(app.send_task.call_count, 1)
+        self.assertEqual(first.attempts, 1)
+        self.assertIn('broker down', first.last_error)
+        self.assertGreater(first.available_at, timezone.now())
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    @override_settings(CHAT_OUTBOX_BATCH_SIZE=2)
+    def test_relay_command_once_drains_backlog(self):
+        """測試 relay_outbox --once 連續取批直到清空"""
+        for i in range(5):
+            enqueue_task(process_message.name, str(i))
+
+        with patch('maiagent.chat.outbox.current_app') as app:
+            call_command('relay_outbox', '--once', '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual(app.send_task.call_count, 5)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_redelivered_task_does_not_reply_twice(self):
+        """測試重複發送的任務不會產生第二則助手回覆"""
+        self.session.status = Session.Status.WAITING
+        self.session.save()
+        user_message = MessageFactory(session=self.session, role=Message.Role.USER)
+
+        with patch('maiagent.chat.tasks.publish_reply'):
+            process_message(str(self.session.id), str(user_message.id))
+            process_message(str(self.session.id), str(user_message.id))
+
+        self.assertEqual(Message.objects.filter(session=self.session, role=Message.Role.ASSISTANT).count(), 1)
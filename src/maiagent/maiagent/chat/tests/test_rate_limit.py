@@ -0,0 +1,76 @@
+"""
+LLM 速率限制測試
+測試每個模型的請求數與 token 數桶，以及額度不足時任務經 outbox 延後重新排入
+"""
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from maiagent.chat.models import LlmModel, Message, OutboxMessage, ScenarioModel, Session
+from maiagent.chat.rate_limit import InMemoryRateLimiter, get_rate_limiter
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+
+
+class InMemoryRateLimiterTestCase(TestCase):
+    """token bucket 測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.limiter = InMemoryRateLimiter()
+
+    def test_requests_per_minute(self):
+        """測試請求數用完後回傳補足一次請求所需的秒數"""
+        model = LlmModel(provider='fake', name='rpm', requests_per_minute=2)
+
+        self.assertEqual(self.limiter.acquire(model, 0), 0)
+        self.assertEqual(self.limiter.acquire(model, 0), 0)
+        self.assertAlmostEqual(self.limiter.acquire(model, 0), 30, delta=0.1)
+
+    def test_tokens_per_minute_and_adjust(self):
+        """測試 token 數不足時不扣除，依實際用量退回後可再取得"""
+        model = LlmModel(provider='fake', name='tpm', tokens_per_minute=1000)
+
+        self.assertEqual(self.limiter.acquire(model, 800), 0)
+        self.assertAlmostEqual(self.limiter.acquire(model, 300), 6, delta=0.1)
+        self.limiter.adjust(model, -500)
+        self.assertEqual(self.limiter.acquire(model, 300), 0)
+
+    def test_models_without_limits_are_not_limited(self):
+        """測試未設定上限的模型不限制"""
+        model = LlmModel(provider='fake', name='unlimited')
+
+        self.assertTrue(all(self.limiter.acquire(model, 10**6) == 0 for _ in range(100)))
+
+
+class ProcessMessageRateLimitTestCase(TestCase):
+    """process_message 速率限制測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        get_rate_limiter().clear()
+        self.scenario = ScenarioFactory()
+        self.llm_model = LlmModel.objects.create(provider='fake', name='limited-gpt', requests_per_minute=1)
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=self.llm_model, is_default=True)
+
+    def ask(self, question, *extra_args):
+        session = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+        message = MessageFactory(session=session, role=Message.Role.USER, content=question)
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            process_message(str(session.id), str(message.id), *extra_args)
+        return session, message
+
+    def test_exhausted_budget_reschedules_through_outbox(self):
+        """測試額度不足時不呼叫 LLM，任務延後重新排入且會話維持 WAITING"""
+        self.ask('第一個問題')
+
+        session, message = self.ask('第二個問題', str(self.llm_model.id))
+
+        self.assertFalse(Message.objects.filter(session=session, role=Message.Role.ASSISTANT).exists())
+        session.refresh_from_db()
+        self.assertEqual(session.status, Session.Status.WAITING)
+        outbox = OutboxMessage.objects.get()
+        self.assertEqual(outbox.task_name, process_message.name)
+        self.assertEqual(outbox.args, [str(session.id), str(message.id), str(self.llm_model.id)])
+        self.assertGreater(outbox.available_at, timezone.now())
@@ -0,0 +1,126 @@
+"""
+LLM 回覆快取測試
+測試相同情境的問題直接使用快取的回覆，且依場景設定停用與統計命中次數
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from maiagent.chat.llm import LlmAuthenticationError, LlmRequest, get_llm_client
+from maiagent.chat.models import LlmModel, Message, ScenarioModel, Session
+from maiagent.chat.response_cache import response_cache_stats, response_key
+from maiagent.chat.streams import get_reply_stream
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+
+
+class ResponseKeyTestCase(TestCase):
+    """快取鍵測試案例"""
+
+    def request(self, question, **kwargs):
+        return LlmRequest(model='fake-gpt', messages=[{'role': 'user', 'content': question}], **kwargs)
+
+    def test_normalized_questions_share_key(self):
+        """測試全形、大小寫與空白不同的問題使用同一個鍵"""
+        self.assertEqual(
+            response_key('s1', 'fake', self.request('如何  退貨？ABC')),
+            response_key('s1', 'fake', self.request('如何 退貨?abc ')),
+        )
+
+    def test_scenario_model_and_prompt_are_part_of_key(self):
+        """測試場景、模型、提示詞與參數不同時鍵不同"""
+        base = response_key('s1', 'fake', self.request('退貨'))
+        self.assertNotEqual(base, response_key('s2', 'fake', self.request('退貨')))
+        self.assertNotEqual(base, response_key('s1', 'openai', self.request('退貨')))
+        self.assertNotEqual(base, response_key('s1', 'fake', self.request('退貨', system='你是客服')))
+        self.assertNotEqual(base, response_key('s1', 'fake', self.request('退貨', params={'temperature': 1})))
+
+
+class ProcessMessageResponseCacheTestCase(TestCase):
+    """process_message 使用回覆快取的測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        cache.clear()
+        self.scenario = ScenarioFactory(config_json={
+            'prompt': '你是客服助手',
+            'llm': {},
+            'memory': {'type': 'none'},
+        })
+        llm_model = LlmModel.objects.create(provider='fake', name='fake-gpt')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=llm_model, is_default=True)
+
+    def ask(self, question):
+        session = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+        message = MessageFactory(session=session, role=Message.Role.USER, content=question)
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            process_message(str(session.id), str(message.id))
+        return session
+
+    def reply(self, session):
+        return Message.objects.get(session=session, role=Message.Role.ASSISTANT).content
+
+    def test_repeated_question_uses_cached_reply(self):
+        """測試相同問題第二次不呼叫 LLM，並以單一片段串流整段回覆"""
+        client = get_llm_client('fake')
+        first = self.ask('退貨流程？')
+
+        with patch.object(client, 'stream') as stream:
+            second = self.ask('退貨流程?')
+
+        stream.assert_not_called()
+        self.assertEqual(self.reply(second), self.reply(first))
+        second.refresh_from_db()
+        self.assertEqual(second.status, Session.Status.REPLYED)
+        events = [event for _, event in get_reply_stream().read(second.id, '0', timeout=0)]
+        self.assertEqual([event['type'] for event in events], ['chunk', 'done'])
+        self.assertEqual(events[0]['content'], self.reply(first))
+        self.assertEqual(response_cache_stats(self.scenario.id), {'hits': 1, 'misses': 1, 'semantic_hits': 0, 'coalesced': 0})
+
+    def test_opt_out_always_calls_llm(self):
+        """測試場景停用快取時每次都呼叫 LLM，也不計數"""
+        self.scenario.config_json['response_cache'] = {'enabled': False}
+        self.scenario.save()
+        self.ask('退貨流程？')
+
+        client = get_llm_client('fake')
+        with patch.object(client, 'stream', wraps=client.stream) as stream:
+            self.ask('退貨流程？')
+
+        stream.assert_called_once()
+        self.assertEqual(response_cache_stats(self.scenario.id), {'hits': 0, 'misses': 0, 'semantic_hits': 0, 'coalesced': 0})
+
+    def test_scenario_ttl_is_used(self):
+        """測試使用場景設定的存活時間"""
+        self.scenario.config_json['response_cache'] = {'ttl': 60}
+        self.scenario.save()
+
+        with patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.ask('退貨流程？')
+
+        ttls = [c.args[2] for c in cache_set.call_args_list if c.args[0].startswith('chat:llm-response:')]
+        self.assertEqual(ttls, [60])
+
+    def test_error_reply_is_not_cached(self):
+        """測試 LLM 失敗時的預設錯誤訊息不寫入快取"""
+        with patch('maiagent.chat.tasks.get_llm_client') as get_client:
+            get_client.return_value.stream.side_effect = LlmAuthenticationError('401')
+            self.ask('退貨流程？')
+
+        session = self.ask('退貨流程？')
+
+        self.assertEqual(self.reply(session), '[fake-gpt] 收到：退貨流程？')
+        self.assertEqual(response_cache_stats(self.scenario.id), {'hits': 0, 'misses': 2, 'semantic_hits': 0, 'coalesced': 0})
+
+    def test_stats_command(self):
+        """測試 response_cache_stats 指令輸出命中率"""
+        self.ask('退貨流程？')
+        self.ask('退貨流程？')
+        out = StringIO()
+
+        call_command('response_cache_stats', stdout=out)
+
+        self.assertIn(f'{self.scenario.name}（啟用）：命中 1，未命中 1，命中率 50.0%，語意快取命中 0，合併請求 0', out.getvalue())
@@ -0,0 +1,82 @@
+"""
+場景設定快取測試
+測試快取命中時 process_message 不查詢場景、儲存時遞增版本並丟棄舊版本，以及其他行程經廣播丟棄快取
+"""
+import time
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from maiagent.chat.models import LlmModel, Message, ScenarioModel, Session
+from maiagent.chat.scenario_cache import ScenarioCache, get_runtime
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+
+
+class ScenarioCacheTestCase(TestCase):
+    """場景設定快取測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.scenario = ScenarioFactory(config_json={
+            'prompt': {'system': '你是客服助手'}, 'llm': {'temperature': 0.3}, 'memory': {'type': 'none'},
+        })
+        self.llm_model = LlmModel.objects.create(provider='fake', name='cached-gpt')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=self.llm_model, is_default=True)
+
+    def ask(self, content):
+        session = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+        message = MessageFactory(session=session, role=Message.Role.USER, content=content)
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as queries:
+            process_message(str(session.id), str(message.id))
+        return Message.objects.get(session=session, role=Message.Role.ASSISTANT), queries
+
+    def test_hot_path_has_no_scenario_queries(self):
+        """測試快取命中後 process_message 不查詢場景與場景模型"""
+        runtime = get_runtime(self.scenario.id)
+        self.assertEqual(runtime.system_prompt, '你是客服助手')
+        self.assertEqual(runtime.default_model, self.llm_model)
+
+        reply, queries = self.ask('退貨流程？')
+
+        self.assertEqual(reply.content, '[cached-gpt] 收到：退貨流程？')
+        self.assertFalse([q['sql'] for q in queries.captured_queries if 'chat_scenario' in q['sql']])
+
+    def test_save_bumps_version_and_drops_cached_runtime(self):
+        """測試儲存場景或綁定的模型時遞增版本，舊的實例儲存也不會讓版本倒退"""
+        stale = type(self.scenario).objects.get(pk=self.scenario.pk)
+        # 建立 ScenarioModel 時已遞增一次
+        self.assertEqual(get_runtime(self.scenario.id).version, 2)
+
+        self.scenario.config_json = {**self.scenario.config_json, 'prompt': '新的提示詞'}
+        self.scenario.save()
+        self.assertEqual(get_runtime(self.scenario.id).system_prompt, '新的提示詞')
+
+        stale.save(update_fields=['name'])
+        self.assertEqual(stale.version, 4)
+        backup = LlmModel.objects.create(provider='fake', name='backup-gpt')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=backup)
+        runtime = get_runtime(self.scenario.id)
+        self.assertEqual((runtime.version, runtime.models), (5, (self.llm_model, backup)))
+
+    def test_other_processes_drop_cache_on_broadcast(self):
+        """測試其他行程的快取收到提交後的廣播即丟棄，廣播之前載入的舊版本不寫入快取"""
+        other = ScenarioCache()
+        self.assertEqual(other.get(self.scenario.id).version, 2)
+
+        self.llm_model.params = {'temperature': 0.9}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.llm_model.save()
+
+        deadline = time.monotonic() + 2
+        while str(self.scenario.id) in other._entries and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertNotIn(str(self.scenario.id), other._entries)
+        self.assertEqual(other.get(self.scenario.id).models[0].params, {'temperature': 0.9})
+
+        other.invalidate(self.scenario.id, 10)
+        other.get(self.scenario.id)
+        self.assertNotIn(str(self.scenario.id), other._entries)
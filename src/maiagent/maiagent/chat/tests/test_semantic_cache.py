@@ -0,0 +1,128 @@
+"""
+語意快取測試
+測試換句話說的第一輪問題使用先前的回覆，且向量索引只載入新增的問答
+"""
+from datetime import timedelta
+from unittest.mock import patch
+
+import numpy as np
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from maiagent.chat.embeddings import HashingEmbedder
+from maiagent.chat.llm import LlmRequest, get_llm_client
+from maiagent.chat.models import LlmModel, Message, ScenarioModel, SemanticCacheEntry, Session
+from maiagent.chat.response_cache import response_cache_stats
+from maiagent.chat.semantic_cache import SemanticQuery, VectorIndex, clear_indexes
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+
+
+class HashingEmbedderTestCase(TestCase):
+    """離線 embedder 測試案例"""
+
+    def test_similarity_ignores_punctuation_and_spacing(self):
+        """測試標點與空白不影響向量，用字相近的問題相似度較高"""
+        vectors = HashingEmbedder(dimensions=256).embed(['怎麼重設密碼', '怎麼 重設密碼？', '密碼要如何重設', '退貨流程'])
+
+        scores = vectors @ vectors[0]
+
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertAlmostEqual(float(scores[1]), 1.0, places=5)
+        self.assertGreater(scores[2], scores[3])
+
+
+class VectorIndexTestCase(TestCase):
+    """向量索引測試案例"""
+
+    def test_keeps_newest_entries_and_skips_expired(self):
+        """測試超過上限時捨棄最舊的問答，且過期的問答不參與比對"""
+        index = VectorIndex(dimensions=2, max_entries=3)
+        for i, vector in enumerate([[1, 0], [0, 1], [1, 0], [0, 1]], start=1):
+            index.append([i], np.array([vector], dtype=np.float32), np.array([float(i)]), [f'回覆 {i}'])
+
+        self.assertEqual(index.size, 3)
+        self.assertEqual(index.replies, ['回覆 2', '回覆 3', '回覆 4'])
+        self.assertEqual(index.search(np.array([1, 0], dtype=np.float32), min_created=0), (1, 1.0))
+        self.assertIsNone(index.search(np.array([1, 0], dtype=np.float32), min_created=10))
+
+
+class ProcessMessageSemanticCacheTestCase(TestCase):
+    """process_message 使用語意快取的測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        cache.clear()
+        clear_indexes()
+        self.scenario = ScenarioFactory(config_json={
+            'prompt': '你是客服助手',
+            'llm': {},
+            'memory': {'type': 'conversation', 'max_turns': 5},
+            'response_cache': {'enabled': False},
+            'semantic_cache': {'enabled': True, 'threshold': 0.5},
+        })
+        llm_model = LlmModel.objects.create(provider='fake', name='fake-gpt')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=llm_model, is_default=True)
+
+    def ask(self, question, session=None):
+        session = session or SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+        message = MessageFactory(session=session, role=Message.Role.USER, content=question)
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            process_message(str(session.id), str(message.id))
+        return session
+
+    def last_reply(self, session):
+        return Message.objects.filter(session=session, role=Message.Role.ASSISTANT).order_by('-sequence_number')[0]
+
+    def test_paraphrase_uses_cached_reply(self):
+        """測試換句話說的第一輪問題不呼叫 LLM，使用先前的回覆"""
+        first = self.ask('怎麼重設密碼')
+
+        with patch.object(get_llm_client('fake'), 'stream') as stream:
+            second = self.ask('密碼要如何重設')
+
+        stream.assert_not_called()
+        self.assertEqual(self.last_reply(second).content, self.last_reply(first).content)
+        self.assertEqual(response_cache_stats(self.scenario.id)['semantic_hits'], 1)
+
+    def test_messages_with_memory_context_are_not_eligible(self):
+        """測試帶有前文的問題不比對也不寫入"""
+        session = self.ask('怎麼重設密碼')
+        self.assertEqual(SemanticCacheEntry.objects.count(), 1)
+
+        client = get_llm_client('fake')
+        with patch.object(client, 'stream', wraps=client.stream) as stream:
+            self.ask('怎麼重設密碼', session=session)
+
+        stream.assert_called_once()
+        self.assertEqual(SemanticCacheEntry.objects.count(), 1)
+
+    def test_prompt_change_and_expired_entries_do_not_match(self):
+        """測試提示詞改變後不命中舊問答，過期的問答於寫入時刪除"""
+        request = LlmRequest(model='fake-gpt', messages=[{'role': 'user', 'content': '怎麼重設密碼'}])
+        query = SemanticQuery(self.scenario.id, self.scenario.config_json, 'fake', request)
+        query.store('舊回覆')
+        SemanticCacheEntry.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertIsNone(query.lookup())
+
+        query.store('新回覆')
+        changed = SemanticQuery(
+            self.scenario.id, self.scenario.config_json, 'fake',
+            LlmRequest(model='fake-gpt', messages=request.messages, system='新的提示詞'),
+        )
+
+        self.assertEqual(query.lookup(), '新回覆')
+        self.assertIsNone(changed.lookup())
+        self.assertEqual(SemanticCacheEntry.objects.count(), 1)
+
+    def test_lookup_loads_only_new_entries(self):
+        """測試索引載入後，之後的查詢只讀取新增的問答"""
+        request = LlmRequest(model='fake-gpt', messages=[{'role': 'user', 'content': '怎麼重設密碼'}])
+        query = SemanticQuery(self.scenario.id, self.scenario.config_json, 'fake', request)
+        query.store('回覆')
+        query.lookup()
+
+        with self.assertNumQueries(1) as ctx:
+            self.assertEqual(query.lookup(), '回覆')
+        self.assertIn('"id" >', ctx.captured_queries[0]['sql'])
@@ -0,0 +1,190 @@
+"""
+相同 LLM 請求合併測試
+測試同時間相同的請求只有一個任務呼叫 LLM，其他任務延後重新排入，取得結果後各自寫入回覆
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from maiagent.chat.llm import LlmAuthenticationError, LlmRequest, get_llm_client
+from maiagent.chat.models import LlmModel, Message, OutboxMessage, ScenarioModel, Session
+from maiagent.chat.response_cache import response_cache_stats, response_key
+from maiagent.chat.single_flight import SingleFlight, get_flight_store
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+
+
+def redis_available():
+    try:
+        return Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1).ping()
+    except RedisError:
+        return False
+
+
+def lead_in_another_process(key):
+    """在另一個行程取得 leader 鎖後結束（不釋放），模擬 prefork 的其他子行程"""
+    code = '\n'.join([
+        'import django',
+        'django.setup()',
+        'from django.test.utils import override_settings',
+        'from maiagent.chat.single_flight import SingleFlight',
+        f'with override_settings(CHAT_SINGLE_FLIGHT_STORE={settings.CHAT_SINGLE_FLIGHT_STORE!r}):',
+        f'    SingleFlight({key!r}, "leader").join()',
+    ])
+    env = {**os.environ, 'REDIS_URL': settings.REDIS_URL}
+    subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, timeout=60, check=True)
+
+
+@override_settings(CHAT_SINGLE_FLIGHT_LOCK_TTL=5)
+class SingleFlightTestCase(TestCase):
+    """SingleFlight 測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        get_flight_store().clear()
+        self.leader = SingleFlight('key', 'leader')
+        self.assertIsNone(self.leader.join())
+        self.assertTrue(self.leader.leading)
+
+    def test_follower_receives_leader_result(self):
+        """測試等待中的任務不等待，重新 join 時取得 leader 的結果"""
+        follower = SingleFlight('key', 'follower')
+        self.assertIsNone(follower.join())
+        self.assertTrue(follower.waiting)
+        self.assertFalse(follower.leading)
+
+        self.leader.share('回覆')
+
+        self.assertEqual(SingleFlight('key', 'follower').join(), '回覆')
+        self.assertIsNone(get_flight_store().get(self.leader.lock_key))
+        self.assertIsNone(get_flight_store().get(follower.waiter_key))
+
+    def test_follower_takes_over_when_leader_fails(self):
+        """測試 leader 未寫入結果即釋放鎖時，等待中的任務接手"""
+        SingleFlight('key', 'follower').join()
+        self.leader.release()
+
+        follower = SingleFlight('key', 'follower')
+        self.assertIsNone(follower.join())
+        self.assertTrue(follower.leading)
+
+    def test_follower_stops_waiting_after_lock_ttl(self):
+        """測試等待超過鎖的存活時間時自行呼叫 LLM"""
+        follower = SingleFlight('key', 'follower')
+        record = json.dumps({'leader': self.leader.token, 'since': time.time() - 5})
+        get_flight_store().set(follower.waiter_key, record, 5)
+
+        self.assertIsNone(follower.join())
+        self.assertFalse(follower.waiting)
+        self.assertFalse(follower.leading)
+
+    def test_finished_result_is_not_reused_by_later_requests(self):
+        """測試請求完成後才到達的任務不使用該結果，自行成為 leader"""
+        self.leader.share('回覆')
+        later_request = SingleFlight('key', 'later')
+
+        self.assertIsNone(later_request.join())
+        self.assertTrue(later_request.leading)
+
+    def test_release_keeps_lock_taken_over_by_others(self):
+        """測試鎖過期並被其他任務取得後，原 leader 不會刪除它"""
+        get_flight_store().set(self.leader.lock_key, 'other', 5)
+
+        self.leader.release()
+
+        self.assertEqual(get_flight_store().get(self.leader.lock_key), 'other')
+
+
+@override_settings(CHAT_SINGLE_FLIGHT_LOCK_TTL=5)
+class ProcessMessageSingleFlightTestCase(TestCase):
+    """process_message 合併相同請求的測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        get_flight_store().clear()
+        self.scenario = ScenarioFactory(config_json={
+            'prompt': '你是客服助手',
+            'llm': {},
+            'memory': {'type': 'none'},
+            'response_cache': {'enabled': False},
+        })
+        llm_model = LlmModel.objects.create(provider='fake', name='fake-gpt')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=llm_model, is_default=True)
+        request = LlmRequest(
+            model='fake-gpt', messages=[{'role': 'user', 'content': '公告的內容是？'}], system='你是客服助手'
+        )
+        self.leader = SingleFlight(response_key(self.scenario.id, 'fake', request), 'leader')
+
+    def ask(self, session=None, message=None):
+        if session is None:
+            session = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+            message = MessageFactory(session=session, role=Message.Role.USER, content='公告的內容是？')
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            process_message(str(session.id), str(message.id))
+        session.refresh_from_db()
+        return session, message
+
+    @override_settings(CHAT_SINGLE_FLIGHT_POLL_INTERVAL=0.5)
+    def test_duplicate_is_rescheduled_until_reply_is_ready(self):
+        """測試相同請求進行中時不呼叫 LLM 也不等待，延後重新排入，取得結果後寫入自己的助手訊息"""
+        self.leader.join()
+
+        with patch.object(get_llm_client('fake'), 'stream') as stream:
+            session, message = self.ask()
+            stream.assert_not_called()
+            self.assertEqual(session.status, Session.Status.WAITING)
+            row = OutboxMessage.objects.get(task_name=process_message.name)
+            self.assertEqual(row.args, [str(session.id), str(message.id)])
+            self.assertGreater(row.available_at, timezone.now())
+
+            self.leader.share('公告內容如下')
+            session, _ = self.ask(session, message)
+            stream.assert_not_called()
+
+        self.assertEqual(session.status, Session.Status.REPLYED)
+        self.assertEqual(Message.objects.get(session=session, role=Message.Role.ASSISTANT).content, '公告內容如下')
+        self.assertEqual(response_cache_stats(self.scenario.id)['coalesced'], 1)
+
+    def test_leader_releases_lock_after_failure(self):
+        """測試呼叫 LLM 失敗後釋放鎖且不寫入結果"""
+        with patch('maiagent.chat.tasks.get_llm_client') as get_client:
+            get_client.return_value.stream.side_effect = LlmAuthenticationError('401')
+            self.ask()
+
+        self.assertIsNone(get_flight_store().get(self.leader.lock_key))
+        self.assertIsNone(get_flight_store().get(self.leader._result_key(self.leader.token)))
+        self.assertEqual(response_cache_stats(self.scenario.id)['coalesced'], 0)
+
+
+@skipUnless(redis_available(), '需要可連線的 REDIS_URL')
+@override_settings(
+    CHAT_SINGLE_FLIGHT_LOCK_TTL=5, CHAT_SINGLE_FLIGHT_STORE='maiagent.chat.single_flight.RedisFlightStore'
+)
+class RedisFlightStoreTestCase(SimpleTestCase):
+    """Redis 儲存的 single-flight 測試案例"""
+
+    def test_requests_in_different_processes_are_coalesced(self):
+        """測試 leader 在其他行程時，相同的請求等待其結果而不自行呼叫 LLM"""
+        key = f'test-{time.time_ns()}'
+        lead_in_another_process(key)
+
+        follower = SingleFlight(key, 'follower')
+        self.assertIsNone(follower.join())
+        self.assertTrue(follower.waiting)
+
+        # leader 的鎖只能由持有者釋放
+        get_flight_store().delete(follower.lock_key, follower.token)
+        self.assertIsNotNone(get_flight_store().get(follower.lock_key))
+        get_flight_store().delete(follower.lock_key)
+        get_flight_store().delete(follower.waiter_key)
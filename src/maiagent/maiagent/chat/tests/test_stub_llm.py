@@ -0,0 +1,114 @@
+"""
+stub provider 測試
+測試 profile 的設定優先順序、首字延遲與輸出速度、可重現的錯誤與 429、fake provider 的 echo 回覆，
+以及 prepare_load_test 建立的場景經 process_message 完整回覆
+"""
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from maiagent.chat.llm import LlmRateLimitError, LlmRequest, LlmServerError, LlmTimeoutError, get_llm_client
+from maiagent.chat.llm.stub import StubLlmClient
+from maiagent.chat.models import Message, Scenario, Session
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import MessageFactory, SessionFactory
+from maiagent.users.models import User
+
+
+def request(question='退貨流程？', **stub):
+    return LlmRequest(model='stub-gpt', messages=[{'role': 'user', 'content': question}], params={'stub': stub})
+
+
+class StubLlmClientTestCase(TestCase):
+    """StubLlmClient 測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.client = StubLlmClient(
+            first_token_latency=0.05, tokens_per_second=200, reply_tokens=20,
+            profiles={'throttled': {'rate_limit_rate': 1, 'retry_after': 3}},
+        )
+
+    def test_profile_precedence(self):
+        """測試具名 profile 覆寫預設值，LlmModel.params["stub"] 再覆寫 profile"""
+        profile = self.client.profile(request(profile='throttled', retry_after=9))
+
+        self.assertEqual((profile.first_token_latency, profile.rate_limit_rate, profile.retry_after), (0.05, 1, 9))
+
+    def test_latency_and_throughput(self):
+        """測試首字延遲後依每秒 token 數輸出，非同步串流產生相同的片段"""
+        started = time.monotonic()
+        chunks = []
+        for chunk in self.client.stream(request()):
+            chunks.append((chunk, time.monotonic() - started))
+
+        self.assertEqual(len(chunks), 20)
+        self.assertGreaterEqual(chunks[0][1], 0.05)
+        # 首字 0.05 秒 + 19 個間隔 × 0.005 秒
+        self.assertAlmostEqual(chunks[-1][1], 0.145, delta=0.1)
+        self.assertEqual(chunks[0][0], '[stub-gpt] ')
+
+        async def collect():
+            return [chunk async for chunk in self.client.astream(request())]
+
+        self.assertEqual(async_to_sync(collect)(), [chunk for chunk, _ in chunks])
+
+    def test_errors_are_reproducible(self):
+        """測試錯誤比例依 seed 與請求內容決定，重跑得到相同的結果"""
+        client = StubLlmClient(first_token_latency=0, tokens_per_second=0, error_rate=0.3)
+
+        def outcomes():
+            return [client.plan(request(f'問題 {i}')).error is not None for i in range(300)]
+
+        first = outcomes()
+        self.assertEqual(first, outcomes())
+        self.assertAlmostEqual(sum(first) / 300, 0.3, delta=0.08)
+        self.assertNotEqual(first, [client.plan(request(f'問題 {i}', seed=1)).error is not None for i in range(300)])
+
+    def test_echo_reply(self):
+        """測試 echo profile（fake provider）回覆「[模型] 收到：問題」，不受回覆長度限制"""
+        chunks = list(self.client.stream(request(reply='echo', first_token_latency=0, max_tokens=2)))
+
+        self.assertEqual(chunks, ['[stub-gpt] ', '收到：退貨流程？'])
+        self.assertEqual(get_llm_client('fake').default.reply, 'echo')
+
+    @override_settings(CHAT_LLM_TIMEOUT=0.01)
+    def test_rate_limit_server_error_and_timeout(self):
+        """測試 429 帶 Retry-After、500 與首字延遲超過讀取逾時"""
+        with self.assertRaises(LlmRateLimitError) as ctx:
+            list(self.client.stream(request(profile='throttled')))
+        self.assertEqual(ctx.exception.retry_countdown(0), 3)
+        with self.assertRaises(LlmServerError):
+            list(self.client.stream(request(error_rate=1)))
+        with self.assertRaises(LlmTimeoutError):
+            list(self.client.stream(request(first_token_latency=1)))
+
+
+class LoadTestScenarioTestCase(TestCase):
+    """prepare_load_test 測試案例"""
+
+    def test_prepared_scenario_replies_through_stub(self):
+        """測試建立的場景以 stub 模型經 process_message 回覆，長度依 profile 設定"""
+        out = StringIO()
+        call_command(
+            'prepare_load_test', '--stub', 'first_token_latency=0', '--stub', 'tokens_per_second=0',
+            '--stub', 'reply_tokens=30', stdout=out,
+        )
+        self.assertIn('--token ', out.getvalue())
+        scenario = Scenario.objects.get(name='負載測試')
+        self.assertIn(f'--scenario {scenario.id}', out.getvalue())
+        session = SessionFactory(
+            scenario=scenario, user=User.objects.get(username='loadtest'), status=Session.Status.WAITING,
+        )
+        message = MessageFactory(session=session, role=Message.Role.USER, content='負載測試')
+
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            process_message(str(session.id), str(message.id))
+
+        reply = Message.objects.get(session=session, role=Message.Role.ASSISTANT)
+        self.assertTrue(reply.content.startswith('[load-test] 負載測試 t0 '))
+        self.assertEqual(len(reply.content.split()), 30)
@@ -0,0 +1,74 @@
+"""
+訊息 token 數測試
+測試訊息寫入時存下 token 數，以及回填舊訊息的指令
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase
+
+from maiagent.chat.models import LlmModel, Message, ScenarioModel, Session
+from maiagent.chat.tasks import process_message
+from maiagent.chat.tests.factories import MessageFactory, ScenarioFactory, SessionFactory
+from maiagent.chat.tokenizers import EstimatingTokenizer, get_tokenizer
+
+
+class EstimatingTokenizerTestCase(TestCase):
+    """離線估算 tokenizer 測試案例"""
+
+    def test_counts_cjk_characters_and_other_text(self):
+        """測試中文每字一個 token，其他文字每 4 個字元一個 token"""
+        tokenizer = EstimatingTokenizer()
+
+        self.assertEqual(tokenizer.count('你好，請問'), 5)
+        self.assertEqual(tokenizer.count('reset password'), 4)
+        self.assertEqual(tokenizer.count(''), 0)
+
+    def test_unknown_tokenizer_name(self):
+        """測試未設定的 tokenizer 名稱"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_tokenizer('missing')
+
+
+class MessageTokenCountTestCase(TestCase):
+    """訊息 token 數寫入與回填測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.scenario = ScenarioFactory()
+        llm_model = LlmModel.objects.create(provider='fake', name='fake-gpt', tokenizer='estimate')
+        ScenarioModel.objects.create(scenario=self.scenario, llm_model=llm_model, is_default=True)
+        self.session = SessionFactory(scenario=self.scenario, status=Session.Status.WAITING)
+
+    def test_reply_is_stored_with_token_count(self):
+        """測試助手回覆寫入時一併存下 token 數"""
+        question = MessageFactory(session=self.session, role=Message.Role.USER, content='退貨流程？')
+
+        with patch('maiagent.chat.tasks.publish_reply'), self.captureOnCommitCallbacks(execute=True):
+            process_message(str(self.session.id), str(question.id))
+
+        reply = Message.objects.get(session=self.session, role=Message.Role.ASSISTANT)
+        self.assertEqual(reply.token_count, EstimatingTokenizer().count(reply.content))
+
+    def test_append_many_counts_tokens(self):
+        """測試批次寫入時以 tokenizer 計算每則訊息"""
+        created = Message.objects.append_many(
+            self.session, [{'role': Message.Role.USER, 'content': '你好'}], EstimatingTokenizer()
+        )
+
+        self.assertEqual(created[0].token_count, 2)
+
+    def test_backfill_command_fills_missing_counts(self):
+        """測試回填指令只計算尚未有 token 數的訊息"""
+        missing = [MessageFactory(session=self.session, content='你好') for _ in range(5)]
+        counted = MessageFactory(session=self.session, content='你好', token_count=99)
+
+        call_command('backfill_token_counts', batch_size=2, workers=1, stdout=StringIO())
+
+        self.assertEqual(
+            set(Message.objects.filter(pk__in=[m.pk for m in missing]).values_list('token_count', flat=True)), {2}
+        )
+        counted.refresh_from_db()
+        self.assertEqual(counted.token_count, 99)
@@ -0,0 +1,140 @@
+"""
+會話 WebSocket 通道測試
+以 ASGI 事件直接驅動 websocket_application，測試驗證、訂閱權限與回覆推送
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from rolepermissions.roles import assign_role
+
+from config.websocket import websocket_application
+from maiagent.chat.api.serializers import MessageSerializer
+from maiagent.chat.models import GroupScenarioAccess, Message, Session
+from maiagent.chat.notifications import publish_reply
+from maiagent.chat.tests.factories import (
+    GroupFactory,
+    MessageFactory,
+    ScenarioFactory,
+    SessionFactory,
+    UserFactory,
+)
+from maiagent.chat.websocket import CLOSE_FORBIDDEN, CLOSE_UNAUTHORIZED
+
+
+class SocketClient:
+    """最小的 ASGI WebSocket 測試客戶端"""
+
+    def __init__(self, query_string=b''):
+        self.scope = {'type': 'websocket', 'path': '/ws/', 'query_string': query_string, 'headers': []}
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.task = None
+
+    async def connect(self):
+        self.task = asyncio.create_task(websocket_application(self.scope, self.incoming.get, self.outgoing.put))
+        await self.incoming.put({'type': 'websocket.connect'})
+        return await self.receive()
+
+    async def send_json(self, data):
+        await self.incoming.put({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive(self, timeout=5):
+        return await asyncio.wait_for(self.outgoing.get(), timeout)
+
+    async def receive_json(self, timeout=5):
+        event = await self.receive(timeout)
+        return json.loads(event['text'])
+
+    async def disconnect(self):
+        await self.incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+class SessionWebSocketTestCase(APITestCase):
+    """WebSocket 通道測試案例"""
+
+    def setUp(self):
+        """測試前準備"""
+        self.group = GroupFactory()
+        self.user = UserFactory(group=self.group)
+        assign_role(self.user, 'employee')
+        self.scenario = ScenarioFactory()
+        GroupScenarioAccess.objects.create(group=self.group, scenario=self.scenario)
+        self.session = SessionFactory(user=self.user, scenario=self.scenario, status=Session.Status.WAITING)
+        self.reply = MessageFactory(session=self.session, role=Message.Role.ASSISTANT, content='AI 回覆')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def client_for(self, token):
+        return SocketClient(f'token={token}'.encode())
+
+    async def test_rejects_invalid_token(self):
+        """測試無效 token 以 4401 關閉連線"""
+        client = self.client_for('invalid')
+
+        self.assertEqual((await client.connect())['type'], 'websocket.accept')
+        closed = await client.receive()
+
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+
+    async def test_rejects_user_without_role(self):
+        """測試沒有角色的使用者以 4403 關閉連線"""
+        user = await sync_to_async(UserFactory)(group=self.group)
+        client = self.client_for(RefreshToken.for_user(user).access_token)
+
+        await client.connect()
+        closed = await client.receive()
+
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+
+    async def test_subscribe_rejects_invisible_session(self):
+        """測試無法訂閱他人會話"""
+        other = await sync_to_async(SessionFactory)(scenario=self.scenario)
+        client = self.client_for(self.token)
+        await client.connect()
+
+        await client.send_json({'action': 'subscribe', 'session_id': str(other.id)})
+        event = await client.receive_json()
+        await client.disconnect()
+
+        self.assertEqual(event['type'], 'error')
+        self.assertEqual(event['session_id'], str(other.id))
+
+    async def test_pushes_reply_to_subscriber(self):
+        """測試訂閱後發佈的助手訊息立即推送"""
+        client = self.client_for(self.token)
+        await client.connect()
+
+        await client.send_json({'action': 'subscribe', 'session_id': str(self.session.id)})
+        subscribed = await client.receive_json()
+        message_data = await sync_to_async(lambda: MessageSerializer(self.reply).data)()
+        started = time.monotonic()
+        await sync_to_async(publish_reply, thread_sensitive=False)(self.session.id, message_data)
+        event = await client.receive_json()
+        latency = time.monotonic() - started
+        await client.disconnect()
+
+        self.assertEqual(subscribed, {'type': 'subscribed', 'session_id': str(self.session.id), 'status': 'Waiting'})
+        self.assertEqual(event['type'], 'message')
+        self.assertEqual(event['message']['id'], str(self.reply.id))
+        self.assertLess(latency, 0.1)
+
+    async def test_unsubscribe_stops_delivery(self):
+        """測試取消訂閱後不再推送"""
+        client = self.client_for(self.token)
+        await client.connect()
+        await client.send_json({'action': 'subscribe', 'session_id': str(self.session.id)})
+        await client.receive_json()
+
+        await client.send_json({'action': 'unsubscribe', 'session_id': str(self.session.id)})
+        unsubscribed = await client.receive_json()
+        publish_reply(self.session.id, {'id': 'ignored'})
+        await client.incoming.put({'type': 'websocket.receive', 'text': 'ping'})
+        pong = await client.receive()
+        await client.disconnect()
+
+        self.assertEqual(unsubscribed['type'], 'unsubscribed')
+        self.assertEqual(pong['text'], 'pong!')
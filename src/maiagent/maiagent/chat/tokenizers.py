@@ -0,0 +1,64 @@
+"""訊息的 token 數計算。
+
+訊息寫入時以該會話使用的模型計算一次，存於 `Message.token_count`；組合對話記憶時只需加總整數，
+不必每輪重新斷詞。`CHAT_TOKENIZERS` 設定可用的 tokenizer，`LlmModel.tokenizer` 指定名稱
+（空白時使用 `CHAT_DEFAULT_TOKENIZER`）：
+
+    CHAT_TOKENIZERS = {
+        "estimate": {"CLASS": "maiagent.chat.tokenizers.EstimatingTokenizer"},
+        "cl100k": {"CLASS": "maiagent.chat.tokenizers.TiktokenTokenizer", "OPTIONS": {"encoding": "cl100k_base"}},
+    }
+"""
+
+from __future__ import annotations
+
+import re
+from functools import cache
+from typing import Any
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+# 中日韓文字（含全形標點）大致每字一個 token
+_CJK = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+
+class Tokenizer:
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+
+class EstimatingTokenizer(Tokenizer):
+    """離線估算：中日韓文字每字 1 個 token，其他文字每 4 個字元 1 個 token（無條件進位）。"""
+
+    def __init__(self, *, chars_per_token: int = 4, **options: Any) -> None:
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        cjk = len(_CJK.findall(text))
+        others = len(text) - cjk
+        return cjk + -(-others // self.chars_per_token)
+
+
+class TiktokenTokenizer(Tokenizer):
+    """OpenAI 模型的 tokenizer，需另外安裝 tiktoken。"""
+
+    def __init__(self, *, encoding: str = "cl100k_base", **options: Any) -> None:
+        try:
+            import tiktoken
+        except ImportError as exc:
+            raise ImproperlyConfigured("TiktokenTokenizer 需要安裝 tiktoken") from exc
+        self.encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+@cache
+def get_tokenizer(name: str = "") -> Tokenizer:
+    name = name or settings.CHAT_DEFAULT_TOKENIZER
+    config = settings.CHAT_TOKENIZERS.get(name)
+    if config is None:
+        raise ImproperlyConfigured(f"未設定的 tokenizer: {name}")
+    return import_string(config["CLASS"])(**config.get("OPTIONS", {}))
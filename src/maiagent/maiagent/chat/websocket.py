@@ -0,0 +1,205 @@
+"""
+會話 WebSocket 通道
+
+連線：ws(s)://<host>/ws/?token=<JWT access token>（或 Authorization: Bearer 標頭）
+
+客戶端送出（JSON 文字訊息）：
+    {"action": "subscribe", "session_id": "<uuid>"}
+    {"action": "unsubscribe", "session_id": "<uuid>"}
+    "ping"  -> "pong!"
+
+伺服器推送：
+    {"type": "subscribed", "session_id": "...", "status": "Waiting"}
+    {"type": "unsubscribed", "session_id": "..."}
+    {"type": "message", "session_id": "...", "message": {...}}   # 與 MessageSerializer 相同
+    {"type": "expired", "session_id": "...", "reply_to": "...", "detail": "..."}   # 回覆逾時，需重新送出
+    {"type": "error", "detail": "...", "session_id": "..."}
+
+回覆事件來自 `notifications` 的 reply broker（Redis pub/sub，可跨行程），
+`process_message` 提交助手訊息、`expire_reply` 標記回覆逾時後即推送，不需客戶端輪詢。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rolepermissions.checkers import has_permission
+
+from maiagent.chat.notifications import get_reply_broker, session_channel
+from maiagent.chat.status_cache import get_session_state
+
+logger = logging.getLogger(__name__)
+
+# 關閉代碼（4000-4999 為應用程式自訂）
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+
+# 單一連線可同時訂閱的會話數上限
+MAX_SUBSCRIPTIONS = 20
+
+# 沒有事件時多久檢查一次連線狀態（秒）
+_IDLE_TIMEOUT = 60
+
+
+def _close_old_connections() -> None:
+    # WebSocket 不經過 Django 請求生命週期，需自行回收失效或逾齡的連線
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+def _token_from_scope(scope: dict[str, Any]) -> str | None:
+    query = parse_qs(scope.get("query_string", b"").decode())
+    if query.get("token"):
+        return query["token"][0]
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            parts = value.decode().split()
+            if len(parts) == 2 and parts[0] == "Bearer":
+                return parts[1]
+    return None
+
+
+def _authenticate(raw_token: str) -> Any | None:
+    _close_old_connections()
+    auth = JWTAuthentication()
+    try:
+        user = auth.get_user(auth.get_validated_token(raw_token))
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+def _visible_session_status(user: Any, session_id: uuid.UUID) -> str | None:
+    """使用者可見的會話回傳目前狀態，否則回傳 None。"""
+    _close_old_connections()
+    state = get_session_state(session_id)
+    if state is None or not state.visible_to(user):
+        return None
+    return state.status
+
+
+class SessionSocket:
+    """單一 WebSocket 連線：管理訂閱並轉送 reply broker 事件。"""
+
+    def __init__(self, user: Any, send: Callable[[dict[str, Any]], Awaitable[None]]) -> None:
+        self.user = user
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self._forwarders: dict[uuid.UUID, asyncio.Task[None]] = {}
+
+    async def send_json(self, data: dict[str, Any]) -> None:
+        # 多個轉送工作共用同一條連線，序列化送出
+        async with self._send_lock:
+            await self._send({"type": "websocket.send", "text": json.dumps(data)})
+
+    async def handle(self, text: str) -> None:
+        if text == "ping":
+            async with self._send_lock:
+                await self._send({"type": "websocket.send", "text": "pong!"})
+            return
+
+        try:
+            data = json.loads(text)
+            action = data["action"]
+            session_id = uuid.UUID(str(data["session_id"]))
+        except (ValueError, KeyError, TypeError):
+            await self.send_json({"type": "error", "detail": "訊息格式錯誤"})
+            return
+
+        if action == "subscribe":
+            await self.subscribe(session_id)
+        elif action == "unsubscribe":
+            await self.unsubscribe(session_id)
+            await self.send_json({"type": "unsubscribed", "session_id": str(session_id)})
+        else:
+            await self.send_json({"type": "error", "detail": f"不支援的操作: {action}"})
+
+    async def subscribe(self, session_id: uuid.UUID) -> None:
+        if session_id in self._forwarders:
+            await self.send_json({"type": "error", "detail": "已訂閱該會話", "session_id": str(session_id)})
+            return
+        if len(self._forwarders) >= MAX_SUBSCRIPTIONS:
+            await self.send_json({"type": "error", "detail": "訂閱數量已達上限", "session_id": str(session_id)})
+            return
+
+        # 先訂閱再讀取狀態：狀態若仍為 waiting，之後提交的回覆一定會推送
+        subscription = get_reply_broker().asubscribe([session_channel(session_id)])
+        await subscription.open()
+        try:
+            session_status = await sync_to_async(_visible_session_status)(self.user, session_id)
+        except BaseException:
+            await subscription.close()
+            raise
+        if session_status is None:
+            await subscription.close()
+            await self.send_json({"type": "error", "detail": "會話不存在", "session_id": str(session_id)})
+            return
+
+        self._forwarders[session_id] = asyncio.create_task(self._forward(subscription))
+        await self.send_json({"type": "subscribed", "session_id": str(session_id), "status": session_status})
+
+    async def unsubscribe(self, session_id: uuid.UUID) -> None:
+        task = self._forwarders.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def close(self) -> None:
+        for session_id in list(self._forwarders):
+            await self.unsubscribe(session_id)
+
+    async def _forward(self, subscription: Any) -> None:
+        try:
+            while True:
+                event = await subscription.get(timeout=_IDLE_TIMEOUT)
+                if event is not None:
+                    await self.send_json(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # noqa: BLE001
+            logger.exception("Failed to forward session event")
+        finally:
+            await subscription.close()
+
+
+async def websocket_application(scope, receive, send):
+    socket: SessionSocket | None = None
+    try:
+        while True:
+            event = await receive()
+
+            if event["type"] == "websocket.connect":
+                await send({"type": "websocket.accept"})
+                raw_token = _token_from_scope(scope)
+                user = await sync_to_async(_authenticate)(raw_token) if raw_token else None
+                if user is None:
+                    await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+                    return
+                if not await sync_to_async(has_permission)(user, "use_scenario"):
+                    await send({"type": "websocket.close", "code": CLOSE_FORBIDDEN})
+                    return
+                socket = SessionSocket(user, send)
+
+            elif event["type"] == "websocket.disconnect":
+                break
+
+            elif event["type"] == "websocket.receive" and socket is not None:
+                text = event.get("text")
+                if text is None:
+                    await socket.send_json({"type": "error", "detail": "僅支援文字訊息"})
+                    continue
+                await socket.handle(text)
+    finally:
+        if socket is not None:
+            await socket.close()
@@ -1,5 +1,7 @@
 import pytest
 
+from maiagent.chat.circuit_breaker import get_circuit_breaker
+from maiagent.chat.single_flight import InMemoryFlightStore, get_flight_store
 from maiagent.users.models import User
 from maiagent.users.tests.factories import UserFactory
 
@@ -9,6 +11,20 @@ def _media_storage(settings, tmpdir) -> None:
     settings.MEDIA_ROOT = tmpdir.strpath
 
 
+@pytest.fixture(autouse=True)
+def _circuit_breaker() -> None:
+    # 斷路器狀態存在行程內，測試模擬的 LLM 錯誤不應影響其他測試
+    get_circuit_breaker().clear()
+
+
+@pytest.fixture(autouse=True)
+def _flight_store() -> None:
+    # single-flight 的鎖與結果存在行程內，未釋放的鎖不應讓其他測試的相同請求等待
+    store = get_flight_store()
+    if isinstance(store, InMemoryFlightStore):
+        store.clear()
+
+
 @pytest.fixture
 def user(db) -> User:
     return UserFactory()
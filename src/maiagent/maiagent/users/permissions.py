@@ -25,6 +25,17 @@ def filter_sessions_for_user(queryset: QuerySet, user: User) -> QuerySet:
     return queryset.filter(user=user)
 
 
+def user_can_view_session(user: User, owner_id: Any, owner_group_id: Any) -> bool:
+    """與 `filter_sessions_for_user` 相同的規則，用於已取得擁有者資訊的會話（不查詢資料庫）。"""
+    if not user.is_authenticated:
+        return False
+    if user.role == User.Role.ADMIN:
+        return True
+    if user.role == User.Role.SUPERVISOR and user.group_id:
+        return owner_group_id == user.group_id
+    return owner_id == user.pk
+
+
 def user_has_scenario_access(user: User, scenario_id: Any) -> bool:
     """檢查使用者是否可使用指定 scenario。
 
@@ -28,6 +28,8 @@ class Admin(AbstractUserRole):
         "view_all_conversations": True,
         "view_group_conversations": True,
         "view_own_conversations": True,
+        # 資料匯入操作
+        "import_conversation_messages": True,
     }
 
 